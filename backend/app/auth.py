@@ -0,0 +1,195 @@
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+import jwt
+from dotenv import load_dotenv
+from fastapi import Depends, Header, HTTPException, Query
+
+from app.cache import OWNER, latest_cache
+from app.database import SUPABASE_URL, supabase
+
+load_dotenv()
+
+# Project JWT secret (Supabase dashboard → Settings → API → JWT Secret).
+# Used for HS256 tokens; asymmetric tokens are checked against the JWKS.
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_URL = os.getenv("SUPABASE_JWKS_URL", f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json")
+JWKS_TTL_SECONDS = float(os.getenv("SUPABASE_JWKS_TTL_SECONDS", "600"))
+
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+
+# Shared secret for operator endpoints (X-Admin-Key header); unset disables them
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+# Allowed clock skew when checking exp/nbf
+LEEWAY_SECONDS = 30
+
+
+class TokenCache:
+    """Bounded LRU of verified tokens, keyed by SHA-256 of the token.
+
+    Entries expire at the earlier of the token's own `exp` and the cache TTL,
+    so a cached token is never accepted past its expiry.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[str]:
+        key = self.key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, user_id = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user_id
+
+    def put(self, token: str, user_id: str, token_exp: Optional[float] = None):
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        key = self.key(token)
+        self._entries[key] = (expires_at, user_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+_token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL_SECONDS)
+
+# JWKS keyed by kid, refreshed at most every JWKS_TTL_SECONDS (or on unknown kid)
+_jwks: dict[str, jwt.PyJWK] = {}
+_jwks_fetched_at = 0.0
+
+
+async def _fetch_jwks(force: bool = False) -> dict[str, jwt.PyJWK]:
+    global _jwks, _jwks_fetched_at
+    if not force and _jwks and time.monotonic() - _jwks_fetched_at < JWKS_TTL_SECONDS:
+        return _jwks
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        resp = await client.get(JWKS_URL)
+        resp.raise_for_status()
+    keys = {}
+    for jwk in resp.json().get("keys", []):
+        try:
+            keys[jwk.get("kid", "")] = jwt.PyJWK(jwk)
+        except jwt.PyJWTError:
+            continue  # unsupported key type/algorithm
+    _jwks, _jwks_fetched_at = keys, time.monotonic()
+    return _jwks
+
+
+async def _signing_key(header: dict) -> tuple[object, str]:
+    """Return (key, algorithm) to verify a token with; the algorithm comes from our side, not the token."""
+    if header.get("alg") == "HS256":
+        return SUPABASE_JWT_SECRET, "HS256"
+    kid = header.get("kid", "")
+    keys = await _fetch_jwks()
+    if kid not in keys:
+        # Key rotation: refresh once before giving up
+        keys = await _fetch_jwks(force=True)
+    if kid not in keys:
+        raise jwt.InvalidTokenError(f"Unknown signing key: {kid}")
+    return keys[kid].key, keys[kid].algorithm_name
+
+
+async def verify_token(token: str) -> str:
+    """Verify a Supabase access token locally and return the user id (`sub`)."""
+    user_id = _token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    header = jwt.get_unverified_header(token)
+    if header.get("alg") == "HS256" and not SUPABASE_JWT_SECRET:
+        # No secret configured: fall back to asking Supabase Auth, but still cache the answer
+        user = await supabase.auth.get_user(token)
+        claims = jwt.decode(token, options={"verify_signature": False})
+        _token_cache.put(token, user.user.id, claims.get("exp"))
+        return user.user.id
+
+    key, algorithm = await _signing_key(header)
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=SUPABASE_JWT_AUDIENCE,
+        leeway=LEEWAY_SECONDS,
+        options={"require": ["exp", "sub"]},
+    )
+    _token_cache.put(token, claims["sub"], claims["exp"])
+    return claims["sub"]
+
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> str:
+    """FastAPI dependency: the authenticated user's id from the Bearer token."""
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing authorization header")
+    try:
+        token = authorization.replace("Bearer ", "")
+        return await verify_token(token)
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+
+async def get_stream_user(
+    authorization: Optional[str] = Header(None),
+    access_token: Optional[str] = Query(None),
+) -> str:
+    """Like get_current_user, but also accepts `?access_token=` since EventSource can't send headers."""
+    if access_token and not authorization:
+        authorization = f"Bearer {access_token}"
+    return await get_current_user(authorization)
+
+
+async def fetch_plant_owner(plant_id: str) -> Optional[str]:
+    result = await supabase.table("plants").select("user_id").eq("id", plant_id).limit(1).execute()
+    return str(result.data[0]["user_id"]) if result.data else None
+
+
+async def check_plant_owner(plant_id: str, user_id: str):
+    """404 unless `user_id` owns the plant; a plant that does not exist gets the same answer."""
+    try:
+        entry = await latest_cache.get(OWNER, plant_id, lambda: fetch_plant_owner(plant_id))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if entry.value != str(user_id):
+        raise HTTPException(status_code=404, detail="Plant not found")
+
+
+async def owned_plant(plant_id: str, user_id: str = Depends(get_current_user)) -> str:
+    """FastAPI dependency for /{plant_id} routes: the caller's user id, once they are shown to own the plant."""
+    await check_plant_owner(plant_id, user_id)
+    return user_id
+
+
+async def owned_stream_plant(plant_id: str, user_id: str = Depends(get_stream_user)) -> str:
+    """owned_plant for the SSE stream, which also takes `?access_token=`."""
+    await check_plant_owner(plant_id, user_id)
+    return user_id
+
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """FastAPI dependency for operator endpoints: the X-Admin-Key header must match ADMIN_API_KEY."""
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_API_KEY")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key.encode(), ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
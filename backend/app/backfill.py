@@ -0,0 +1,177 @@
+"""
+Re-score stored readings in bulk with the current models.
+
+POST /sensor-data/{plant_id}/rescore covers one plant and one request.
+This walks every plant (or the given ones) through [from, to) in keyset
+chunks of BACKFILL_CHUNK_ROWS, scores each chunk with one
+InferenceService.score_all call and writes back only the rows whose
+predictions or model version changed, one bulk upsert per group of
+changed columns. The next chunk is read while the current one is scored
+and written, and BACKFILL_CONCURRENCY plants are processed at once.
+
+    cd backend
+    python -m app.backfill --from 2024-01-01 --to 2024-02-01
+    python -m app.backfill --plant-id 4 --plant-id 7 --dry-run
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from postgrest.types import ReturnMethod
+
+from app.database import supabase
+from app.history import HISTORY_PAGE_SIZE, all_plant_ids, fetch_page, to_iso
+from app.ingest import check_version_column
+from app.logs import configure_logging
+from app.ml.inference import inference
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_ROWS = int(os.getenv("BACKFILL_CHUNK_ROWS", "5000"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+
+
+def changed_rows(rows: list[dict], predictions: list[dict]) -> dict[tuple, list[dict]]:
+    """
+    Rows whose stored predictions differ from `predictions`, grouped by which
+    columns changed so each bulk upsert only sets those columns.
+    """
+    changed: dict[tuple, list[dict]] = {}
+    for row, prediction in zip(rows, predictions):
+        # Rows the models cannot score (missing features) keep their stored values
+        updates = {k: v for k, v in prediction.items() if v is not None and row.get(k) != v}
+        if updates:
+            changed.setdefault(tuple(updates), []).append(
+                {"id": row["id"], "plant_id": row["plant_id"], "timestamp": row["timestamp"], **updates}
+            )
+    return changed
+
+
+async def write_changes(changed: dict[tuple, list[dict]]) -> int:
+    # (id, timestamp): the primary key once sensor_readings is partitioned (migrations/004, 007)
+    for group in changed.values():
+        for i in range(0, len(group), HISTORY_PAGE_SIZE):
+            await (
+                supabase.table("sensor_readings")
+                .upsert(group[i : i + HISTORY_PAGE_SIZE], on_conflict="id,timestamp", returning=ReturnMethod.minimal)
+                .execute()
+            )
+    return sum(len(group) for group in changed.values())
+
+
+async def rescore_rows(rows: list[dict], dry_run: bool = False) -> int:
+    """Score stored rows and write back the changed ones; returns how many changed."""
+    changed = changed_rows(rows, await inference.score_all(rows))
+    if dry_run:
+        return sum(len(group) for group in changed.values())
+    return await write_changes(changed)
+
+
+async def fetch_chunk(plant_id: str, columns: list[str], start, end, position, size: int) -> tuple[list[dict], bool]:
+    """
+    The next `size` rows after `position` (rounded up to whole pages), oldest
+    first, and whether more may follow.
+    """
+    rows: list[dict] = []
+    while len(rows) < size:
+        page = await fetch_page(plant_id, columns, start=start, end=end, position=position, ascending=True)
+        rows.extend(page)
+        if len(page) < HISTORY_PAGE_SIZE:
+            return rows, False
+        position = (page[-1]["timestamp"], page[-1]["id"])
+    return rows, True
+
+
+async def backfill_plant(
+    plant_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    chunk_rows: int = BACKFILL_CHUNK_ROWS,
+    dry_run: bool = False,
+) -> tuple[int, int]:
+    """Re-score one plant's readings in [start, end); returns (scored, updated)."""
+    columns = list(dict.fromkeys(["id", "timestamp", *inference.feature_columns]))
+    scored = updated = 0
+    rows, more = await fetch_chunk(plant_id, columns, start, end, None, chunk_rows)
+    while rows:
+        upcoming = None
+        if more:
+            # Read ahead while this chunk is scored and written
+            last = (rows[-1]["timestamp"], rows[-1]["id"])
+            upcoming = asyncio.create_task(fetch_chunk(plant_id, columns, start, end, last, chunk_rows))
+        try:
+            updated += await rescore_rows(rows, dry_run)
+        except BaseException:
+            if upcoming is not None:
+                upcoming.cancel()
+            raise
+        scored += len(rows)
+        rows, more = await upcoming if upcoming is not None else ([], False)
+    return scored, updated
+
+
+async def backfill(
+    plant_ids: Optional[list[str]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    chunk_rows: int = BACKFILL_CHUNK_ROWS,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    dry_run: bool = False,
+) -> dict:
+    """Re-score the readings of `plant_ids` (default: every plant). Inference must be started."""
+    if not inference.available:
+        raise RuntimeError("Inference models are not loaded")
+    plant_ids = plant_ids or await all_plant_ids()
+    semaphore = asyncio.Semaphore(concurrency)
+    totals = {"plants": len(plant_ids), "scored": 0, "updated": 0}
+    started = time.perf_counter()
+
+    async def one(plant_id: str):
+        async with semaphore:
+            scored, updated = await backfill_plant(plant_id, start, end, chunk_rows, dry_run)
+        totals["scored"] += scored
+        totals["updated"] += updated
+        if scored:
+            logger.info("[Backfill] Plant %s: %d scored, %d changed", plant_id, scored, updated)
+
+    await asyncio.gather(*(one(plant_id) for plant_id in plant_ids))
+    elapsed = time.perf_counter() - started
+    return {
+        **totals,
+        "model_version": inference.version,
+        "seconds": round(elapsed, 3),
+        "readings_per_s": round(totals["scored"] / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    await inference.start()
+    await check_version_column()
+    try:
+        return await backfill(
+            args.plant_id, to_iso(args.from_), to_iso(args.to), args.chunk, args.concurrency, args.dry_run
+        )
+    finally:
+        await inference.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored sensor readings with the current models")
+    parser.add_argument("--from", dest="from_", type=datetime.fromisoformat, help="oldest reading (ISO 8601)")
+    parser.add_argument("--to", type=datetime.fromisoformat, help="end of the range, exclusive (ISO 8601)")
+    parser.add_argument("--plant-id", action="append", help="only this plant; repeat for several (default: all)")
+    parser.add_argument("--chunk", type=int, default=BACKFILL_CHUNK_ROWS, help="readings scored per model call")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY, help="plants processed at once")
+    parser.add_argument("--dry-run", action="store_true", help="count what would change without writing")
+    args = parser.parse_args()
+    configure_logging()
+    print(f"[Backfill] {asyncio.run(run(args))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from app.database import supabase
+from app.metrics import register_callback
+from app.ml.nutrients import nutrient_rules
+
+logger = logging.getLogger(__name__)
+
+LATEST_CACHE_SIZE = int(os.getenv("LATEST_CACHE_SIZE", "10000"))
+# Upper bound on staleness when another worker process wrote the newer value
+LATEST_CACHE_TTL_SECONDS = float(os.getenv("LATEST_CACHE_TTL_SECONDS", "60"))
+# Rows read at startup to pre-fill the cache with recently active plants
+LATEST_CACHE_WARM_ROWS = int(os.getenv("LATEST_CACHE_WARM_ROWS", "1000"))
+
+READING = "reading"
+LIGHT = "light"
+DEVICE = "device"
+OWNER = "owner"
+
+
+class CachedValue:
+    __slots__ = ("value", "etag", "expires_at")
+
+    def __init__(self, value, ttl: float):
+        self.value = value
+        body = json.dumps(value, sort_keys=True, default=str).encode()
+        self.etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        self.expires_at = time.monotonic() + ttl
+
+
+class LatestStateCache:
+    """
+    Per-plant "latest state" cache: the newest sensor reading, the light status,
+    the device the plant is wired to and the user who owns it.
+
+    Ingest and control paths write through with `put`; reads fill misses from
+    the database with a single load per key even under concurrent requests.
+    Entries are evicted LRU beyond `maxsize` and expire after `ttl` so other
+    workers' writes become visible eventually.
+    """
+
+    def __init__(self, maxsize: int = LATEST_CACHE_SIZE, ttl: float = LATEST_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], CachedValue] = OrderedDict()
+        self._loading: dict[tuple[str, str], asyncio.Future] = {}
+
+    def put(self, kind: str, plant_id, value) -> CachedValue:
+        key = (kind, str(plant_id))
+        current = self._entries.get(key)
+        if kind == READING and current is not None and current.value and value:
+            # Out-of-order delivery: never replace a newer reading with an older one
+            if str(value.get("timestamp", "")) < str(current.value.get("timestamp", "")):
+                return current
+        entry = CachedValue(value, self.ttl)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, plant_id):
+        for kind in (READING, LIGHT, DEVICE, OWNER):
+            self._entries.pop((kind, str(plant_id)), None)
+
+    async def get(self, kind: str, plant_id, loader: Callable[[], Awaitable]) -> CachedValue:
+        key = (kind, str(plant_id))
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            entry = self.put(kind, plant_id, await loader())
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._loading[key]
+
+    async def get_many(
+        self, kind: str, plant_ids: list, loader: Callable[[list[str]], Awaitable[dict]], default=None
+    ) -> dict:
+        """
+        Values for several plants at once: fresh entries come from the cache
+        and all misses are handed to one `loader(missing_ids)` call, which
+        returns {plant_id: value}. Plants it has no value for get `default`.
+        """
+        now = time.monotonic()
+        values, missing = {}, []
+        for plant_id in map(str, plant_ids):
+            entry = self._entries.get((kind, plant_id))
+            if entry is not None and entry.expires_at > now:
+                self.hits += 1
+                self._entries.move_to_end((kind, plant_id))
+                values[plant_id] = entry.value
+            else:
+                missing.append(plant_id)
+        if missing:
+            self.misses += len(missing)
+            loaded = {str(k): v for k, v in (await loader(missing)).items()}
+            for plant_id in missing:
+                values[plant_id] = self.put(kind, plant_id, loaded.get(plant_id, default)).value
+        return values
+
+
+def conditional_response(entry: CachedValue, if_none_match: Optional[str]) -> Response:
+    """200 with an ETag, or 304 when the client already has this version."""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if if_none_match and entry.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(entry.value, headers=headers)
+
+
+latest_cache = LatestStateCache()
+register_callback(
+    "latest_cache_lookups_total",
+    "Latest-state cache lookups by result.",
+    lambda: {("hit",): latest_cache.hits, ("miss",): latest_cache.misses},
+    kind="counter",
+    labels=("result",),
+)
+register_callback(
+    "latest_cache_hit_ratio",
+    "Share of latest-state lookups served from the cache since startup.",
+    lambda: latest_cache.hits / max(1, latest_cache.hits + latest_cache.misses),
+)
+register_callback("latest_cache_entries", "Entries held by the latest-state cache.", lambda: len(latest_cache._entries))
+
+
+async def warm_latest_cache(cache: LatestStateCache = latest_cache):
+    """Cold-start fill from the most recent readings and light states. Best effort."""
+    try:
+        readings = await (
+            supabase.table("sensor_readings")
+            .select("*")
+            .order("timestamp", desc=True)
+            .limit(LATEST_CACHE_WARM_ROWS)
+            .execute()
+        )
+        lights = await (
+            supabase.table("light_status")
+            .select("*")
+            .order("updated_at", desc=True)
+            .limit(LATEST_CACHE_WARM_ROWS)
+            .execute()
+        )
+    except Exception as e:
+        logger.warning("[Cache] Warm-up skipped: %s", e)
+        return
+    # Oldest first, so the newest row per plant is the one left in the cache
+    for row in reversed(nutrient_rules.annotate(readings.data)):
+        cache.put(READING, row["plant_id"], row)
+    for row in reversed(lights.data):
+        cache.put(LIGHT, row["plant_id"], row)
+    logger.info("[Cache] Warmed with %d readings, %d light states", len(readings.data), len(lights.data))
@@ -1,10 +1,28 @@
 import os
-from supabase import create_client, Client
+from supabase import AClient
 from dotenv import load_dotenv
 
+from app.metrics import SUPABASE_REQUEST_SECONDS, instrument_httpx
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+# Async client: every `.execute()` is awaited on the event loop instead of
+# blocking it for a network round trip. PostgREST calls share one pooled
+# httpx.AsyncClient for the lifetime of the process.
+supabase: AClient = AClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+
+def _resource(request) -> tuple[str, str]:
+    # /rest/v1/<table> or /rest/v1/rpc/<function>
+    return request.method, request.url.path.partition("/rest/v1/")[2] or request.url.path
+
+
+instrument_httpx(supabase.postgrest.session, SUPABASE_REQUEST_SECONDS, _resource)
+
+
+async def close_database():
+    """Close the pooled PostgREST connections (called on app shutdown)."""
+    await supabase.postgrest.aclose()
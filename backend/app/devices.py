@@ -0,0 +1,67 @@
+"""
+Plant → ThingsBoard device routing.
+
+Each plant names the ESP32 that drives it (`plants.device_id`) and an
+optional `zone` for bulk controls (migrations/006_plant_devices.sql).
+Lookups go through the latest-state cache, so sending a command does not
+query `plants` again until the entry expires; writes to a plant's device
+go through it too. Plants without a device use THINGSBOARD_DEVICE_ID, as
+every command did before the mapping existed.
+"""
+
+from typing import Optional
+
+from app.cache import DEVICE, latest_cache
+from app.database import supabase
+from app.mqtt.publisher import THINGSBOARD_DEVICE_ID
+
+ROUTE_COLUMNS = "id,device_id,zone"
+NO_ROUTE = {"device_id": None, "zone": None}
+
+
+def route(row: dict) -> dict:
+    return {"device_id": row.get("device_id"), "zone": row.get("zone")}
+
+
+def device_id(plant_route: dict) -> Optional[str]:
+    return plant_route.get("device_id") or THINGSBOARD_DEVICE_ID
+
+
+async def fetch_plant_routes(plant_ids: list[str]) -> dict:
+    """{plant_id: {device_id, zone}} for the given plants, in a single query."""
+    result = await supabase.table("plants").select(ROUTE_COLUMNS).in_("id", plant_ids).execute()
+    return {str(row["id"]): route(row) for row in result.data}
+
+
+async def fetch_plant_route(plant_id: str) -> dict:
+    return (await fetch_plant_routes([str(plant_id)])).get(str(plant_id), NO_ROUTE)
+
+
+async def plant_device(plant_id: str) -> Optional[str]:
+    """Device that drives a plant (cached)."""
+    entry = await latest_cache.get(DEVICE, plant_id, lambda: fetch_plant_route(plant_id))
+    return device_id(entry.value)
+
+
+async def select_plants(user_id: str, zone: Optional[str] = None, plant_ids: Optional[list] = None) -> list[dict]:
+    """
+    The user's plants in `zone` and/or among `plant_ids` (all of them when
+    neither is given), with their routes written through to the cache.
+    """
+    query = supabase.table("plants").select(ROUTE_COLUMNS).eq("user_id", user_id)
+    if zone is not None:
+        query = query.eq("zone", zone)
+    if plant_ids is not None:
+        query = query.in_("id", [str(plant_id) for plant_id in plant_ids])
+    result = await query.execute()
+    for row in result.data:
+        latest_cache.put(DEVICE, row["id"], route(row))
+    return result.data
+
+
+def group_by_device(plants: list[dict]) -> dict[Optional[str], list]:
+    """{device_id: [plant ids]}; one command per device reaches all of its plants."""
+    groups: dict[Optional[str], list] = {}
+    for plant in plants:
+        groups.setdefault(device_id(route(plant)), []).append(plant["id"])
+    return groups
@@ -0,0 +1,291 @@
+"""
+Streaming export of sensor history as CSV, NDJSON or Parquet.
+
+Rows are read in keyset pages, oldest first, and encoded page by page,
+so memory stays at a couple of pages however long the range is: the next
+page is already being fetched while the current one is encoded and sent.
+
+The `notebook` layout renames and orders the columns the way
+ml/plant_model.ipynb and ml/test_tflite_mock.py expect them: the health
+model's features (SoilMoisture … Potassium), the NeedsWatering (0/1) and
+HealthStatus targets, then PlantID and Timestamp.
+
+    python -m app.export --plants 1,2 --format csv --layout notebook --out-dir exports
+    python -m app.export --all --from 2026-01-01 --format parquet
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from app.database import close_database
+from app.history import (
+    HISTORY_PAGE_SIZE,
+    METRIC_COLUMNS,
+    RAW_COLUMNS,
+    all_plant_ids,
+    fetch_page,
+    parse_columns,
+    to_iso,
+)
+from app.ml.registry import ML_MODEL_DIR, feature_column, load_metadata
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "4"))
+# Rows per Parquet row group; larger groups compress better but are held in memory
+EXPORT_PARQUET_ROW_GROUP = int(os.getenv("EXPORT_PARQUET_ROW_GROUP", "10000"))
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+LAYOUTS = ("raw", "notebook")
+
+
+def notebook_columns() -> dict[str, str]:
+    """sensor_readings column → notebook column name, in the notebook's order."""
+    notebook = load_metadata(ML_MODEL_DIR, "notebook_tflite_metadata.json")
+    features = notebook.get("health", {}).get("features") or [c.title().replace("_", "") for c in METRIC_COLUMNS]
+    columns = {feature_column(feature): feature for feature in features}
+    columns.update(watering_needed="NeedsWatering", health_status="HealthStatus", plant_id="PlantID", timestamp="Timestamp")
+    return columns
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+class ExportSpec:
+    """What to export and how: validated up front so errors surface before streaming starts."""
+
+    def __init__(self, fmt: str = "csv", columns: Optional[str] = None, layout: str = "raw"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}', expected one of: {', '.join(FORMATS)}")
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout '{layout}', expected one of: {', '.join(LAYOUTS)}")
+        if layout == "notebook":
+            if columns:
+                raise ValueError("columns cannot be combined with layout=notebook")
+            names = notebook_columns()
+            self.columns, self.headers = list(names), list(names.values())
+        else:
+            self.columns = parse_columns(columns, RAW_COLUMNS)
+            self.headers = list(self.columns)
+        if fmt == "parquet":
+            _pyarrow()
+        self.format = fmt
+        self.layout = layout
+        # The notebook trains on NeedsWatering as 0/1
+        self._int_columns = [i for i, c in enumerate(self.columns) if c == "watering_needed" and layout == "notebook"]
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.format]
+
+    def filename(self, plant_id) -> str:
+        return f"plant_{plant_id}.{self.format}"
+
+    def values(self, row: dict) -> list:
+        values = [row.get(column) for column in self.columns]
+        for index in self._int_columns:
+            if values[index] is not None:
+                values[index] = int(values[index])
+        return values
+
+
+async def iter_pages(
+    plant_id: str, columns: list[str], start: Optional[str], end: Optional[str], page_size: int = HISTORY_PAGE_SIZE
+) -> AsyncIterator[list[dict]]:
+    """Keyset pages of [start, end), oldest first, with the next page fetched ahead."""
+    read = list(dict.fromkeys(["id", "timestamp", *columns]))
+
+    def fetch(position):
+        return asyncio.ensure_future(
+            fetch_page(plant_id, read, start=start, end=end, position=position, ascending=True, limit=page_size)
+        )
+
+    pending = fetch(None)
+    try:
+        while pending is not None:
+            page = await pending
+            pending = fetch((page[-1]["timestamp"], page[-1]["id"])) if len(page) == page_size else None
+            yield page
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+async def _csv(pages, spec: ExportSpec):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(spec.headers)
+    async for page in pages:
+        writer.writerows(spec.values(row) for row in page)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+async def _ndjson(pages, spec: ExportSpec):
+    async for page in pages:
+        yield "".join(json.dumps(dict(zip(spec.headers, spec.values(row))), default=str) + "\n" for row in page).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last `take`."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _parquet_schema(pa, spec: ExportSpec):
+    types = {
+        "id": pa.int64(),
+        "plant_id": pa.int64(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "watering_needed": pa.int8() if spec.layout == "notebook" else pa.bool_(),
+        "health_status": pa.string(),
+        "light_on": pa.bool_(),
+        **{column: pa.float64() for column in METRIC_COLUMNS},
+    }
+    return pa.schema([(header, types[column]) for column, header in zip(spec.columns, spec.headers)])
+
+
+async def _parquet(pages, spec: ExportSpec):
+    pa, pq = _pyarrow()
+    schema = _parquet_schema(pa, spec)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    group: list[list] = []
+
+    def write_group():
+        columns = list(zip(*group)) or [[] for _ in schema]
+        arrays = [
+            pa.array(values).cast(field.type) if field.type == pa.timestamp("us", tz="UTC") else pa.array(values, field.type)
+            for values, field in zip(columns, schema)
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        group.clear()
+
+    async for page in pages:
+        group.extend(spec.values(row) for row in page)
+        if len(group) >= EXPORT_PARQUET_ROW_GROUP:
+            write_group()
+            yield sink.take()
+    if group:
+        write_group()
+    writer.close()
+    yield sink.take()
+
+
+ENCODERS = {"csv": _csv, "ndjson": _ndjson, "parquet": _parquet}
+
+
+async def export_stream(
+    plant_id: str, spec: ExportSpec, start: Optional[str] = None, end: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    pages = iter_pages(plant_id, spec.columns, start, end)
+    try:
+        async for chunk in ENCODERS[spec.format](pages, spec):
+            if chunk:
+                yield chunk
+    except Exception as e:
+        # Headers are already sent; all we can do is cut the response short
+        logger.error("[Export] Plant %s export aborted: %s", plant_id, e)
+        raise
+    finally:
+        await pages.aclose()
+
+
+# ── CLI ─────────────────────────────────────────────────────────
+
+
+async def export_to_file(plant_id: str, spec: ExportSpec, start, end, path: Path) -> int:
+    size = 0
+    with open(path, "wb") as f:
+        async for chunk in export_stream(plant_id, spec, start, end):
+            f.write(chunk)
+            size += len(chunk)
+    return size
+
+
+async def export_plants(
+    plant_ids: list[str], spec: ExportSpec, start, end, out_dir: Path, concurrency: int = EXPORT_CONCURRENCY
+) -> dict[str, Path]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(plant_id: str) -> Path:
+        path = out_dir / spec.filename(plant_id)
+        async with semaphore:
+            size = await export_to_file(plant_id, spec, start, end, path)
+        logger.info("[Export] Plant %s → %s (%d bytes)", plant_id, path, size)
+        return path
+
+    paths = await asyncio.gather(*(one(plant_id) for plant_id in plant_ids))
+    return dict(zip(plant_ids, paths))
+
+
+async def run(args) -> dict[str, Path]:
+    spec = ExportSpec(args.format, args.columns, args.layout)
+    try:
+        plant_ids = await all_plant_ids() if args.all else [p.strip() for p in args.plants.split(",") if p.strip()]
+        start = to_iso(datetime.fromisoformat(args.from_)) if args.from_ else None
+        end = to_iso(datetime.fromisoformat(args.to)) if args.to else None
+        return await export_plants(plant_ids, spec, start, end, Path(args.out_dir), args.concurrency)
+    finally:
+        await close_database()
+
+
+def main():
+    from app.logs import configure_logging
+
+    parser = argparse.ArgumentParser(description="Export sensor history, one file per plant")
+    plants = parser.add_mutually_exclusive_group(required=True)
+    plants.add_argument("--plants", help="comma-separated plant ids")
+    plants.add_argument("--all", action="store_true", help="every plant in the database")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--layout", choices=LAYOUTS, default="notebook")
+    parser.add_argument("--columns", help="raw layout only: comma-separated columns")
+    parser.add_argument("--from", dest="from_", help="ISO date/time, inclusive")
+    parser.add_argument("--to", help="ISO date/time, exclusive")
+    parser.add_argument("--out-dir", default="exports")
+    parser.add_argument("--concurrency", type=int, default=EXPORT_CONCURRENCY)
+    args = parser.parse_args()
+    configure_logging()
+    paths = asyncio.run(run(args))
+    print(f"[Export] Wrote {len(paths)} files to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
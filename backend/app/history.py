@@ -0,0 +1,195 @@
+import base64
+import re
+import warnings
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from app.database import supabase
+
+METRIC_COLUMNS = [
+    "soil_moisture",
+    "temperature",
+    "humidity",
+    "light_intensity",
+    "nitrogen",
+    "phosphorus",
+    "potassium",
+]
+RAW_COLUMNS = ["id", "plant_id", "timestamp", *METRIC_COLUMNS, "watering_needed", "health_status", "light_on"]
+
+# Rows per PostgREST request; matches the default max-rows of a Supabase project
+HISTORY_PAGE_SIZE = 1000
+
+_BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_bucket(bucket: str) -> int:
+    """'30s', '5m', '1h', '1d' or a plain number of seconds → seconds."""
+    match = re.fullmatch(r"(\d+)([smhd]?)", bucket.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid bucket '{bucket}', expected e.g. 30s, 5m, 1h, 1d")
+    return int(match.group(1)) * _BUCKET_UNITS[match.group(2) or "s"]
+
+
+def parse_columns(columns: Optional[str], allowed: list[str]) -> list[str]:
+    if not columns:
+        return list(allowed)
+    selected = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in selected if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return selected
+
+
+def encode_cursor(row: dict) -> str:
+    return base64.urlsafe_b64encode(f"{row['timestamp']}|{row['id']}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return timestamp, row_id
+
+
+def _keyset_filter(timestamp: str, row_id, op: str) -> str:
+    """PostgREST `or` filter body for (timestamp, id) strictly after/before a position."""
+    return f'timestamp.{op}."{timestamp}",and(timestamp.eq."{timestamp}",id.{op}.{row_id})'
+
+
+def to_iso(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+
+async def fetch_page(
+    plant_id: str,
+    columns: list[str],
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    position: Optional[tuple[str, str]] = None,
+    ascending: bool = False,
+    limit: int = HISTORY_PAGE_SIZE,
+    table: str = "sensor_readings",
+) -> list[dict]:
+    """One keyset page on (timestamp, id), continuing past `position` in the given direction."""
+    query = supabase.table(table).select(",".join(columns)).eq("plant_id", plant_id)
+    if start:
+        query = query.gte("timestamp", start)
+    if end:
+        query = query.lt("timestamp", end)
+    if position:
+        query = query.or_(_keyset_filter(*position, "gt" if ascending else "lt"))
+    desc = not ascending
+    result = await query.order("timestamp", desc=desc).order("id", desc=desc).limit(limit).execute()
+    return result.data
+
+
+async def all_plant_ids() -> list[str]:
+    """Every plant id, in keyset pages so PostgREST's max-rows cannot cut the list short."""
+    plant_ids: list[str] = []
+    while True:
+        query = supabase.table("plants").select("id").order("id").limit(HISTORY_PAGE_SIZE)
+        if plant_ids:
+            query = query.gt("id", plant_ids[-1])
+        page = (await query.execute()).data
+        plant_ids += [str(row["id"]) for row in page]
+        if len(page) < HISTORY_PAGE_SIZE:
+            return plant_ids
+
+
+async def fetch_range(plant_id: str, columns: list[str], start: Optional[str], end: Optional[str]) -> list[dict]:
+    """All rows in [start, end), oldest first, walking keyset pages."""
+    columns = list(dict.fromkeys(["id", "timestamp", *columns]))
+    rows: list[dict] = []
+    position = None
+    while True:
+        page = await fetch_page(plant_id, columns, start=start, end=end, position=position, ascending=True)
+        rows.extend(page)
+        if len(page) < HISTORY_PAGE_SIZE:
+            return rows
+        position = (page[-1]["timestamp"], page[-1]["id"])
+
+
+def to_epoch_seconds(timestamps: list[str]) -> np.ndarray:
+    with warnings.catch_warnings():
+        # numpy converts offsets to UTC but warns that datetime64 itself is naive
+        warnings.simplefilter("ignore")
+        parsed = np.array(timestamps, dtype="U40").astype("datetime64[us]")
+    return parsed.astype(np.int64) / 1e6
+
+
+def bucket_start_iso(key: int, bucket_seconds: int) -> str:
+    return datetime.fromtimestamp(int(key) * bucket_seconds, tz=timezone.utc).isoformat()
+
+
+def reduce_groups(keys: np.ndarray, counts: np.ndarray, sums: np.ndarray, mins: np.ndarray, maxs: np.ndarray):
+    """
+    Combine partial aggregates that share a group key, vectorized.
+
+    Raw values are partials too (count 0/1, sum = value, min = max = value
+    with ±inf for missing), so the same routine turns readings into buckets
+    and finer buckets into coarser ones. Returns (keys, counts, sums, mins, maxs)
+    with one entry per distinct key, sorted by key.
+    """
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    boundaries = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+    return (
+        unique_keys,
+        np.bincount(inverse, weights=counts, minlength=len(unique_keys)),
+        np.bincount(inverse, weights=sums, minlength=len(unique_keys)),
+        np.minimum.reduceat(mins[order], boundaries),
+        np.maximum.reduceat(maxs[order], boundaries),
+    )
+
+
+def value_partials(values: np.ndarray):
+    """(counts, sums, mins, maxs) partials for one raw column with NaN for missing."""
+    present = ~np.isnan(values)
+    return (
+        present.astype(np.float64),
+        np.where(present, values, 0.0),
+        np.where(present, values, np.inf),
+        np.where(present, values, -np.inf),
+    )
+
+
+def summarize(counts, sums, mins, maxs) -> list[Optional[dict]]:
+    """Per-bucket {min, mean, max}, or None where the bucket had no values."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return [
+        {"min": float(lo), "mean": float(mean), "max": float(hi)} if n else None
+        for n, lo, mean, hi in zip(counts, mins, means, maxs)
+    ]
+
+
+def aggregate_buckets(rows: list[dict], columns: list[str], bucket_seconds: int) -> list[dict]:
+    """
+    Per-bucket count/min/mean/max of each metric, computed with NumPy over
+    whole columns (one pass per metric, no per-row Python work). Buckets
+    are aligned to the Unix epoch; empty buckets are omitted.
+    """
+    if not rows:
+        return []
+    epoch = to_epoch_seconds([row["timestamp"] for row in rows])
+    bucket_index = np.floor(epoch / bucket_seconds).astype(np.int64)
+    keys, row_counts = np.unique(bucket_index, return_counts=True)
+
+    result = [
+        {"start": bucket_start_iso(key, bucket_seconds), "count": int(count)}
+        for key, count in zip(keys, row_counts)
+    ]
+    for column in columns:
+        values = np.array([row.get(column) for row in rows], dtype=np.float64)
+        _, *partials = reduce_groups(bucket_index, *value_partials(values))
+        for bucket, stats in zip(result, summarize(*partials)):
+            bucket[column] = stats
+    return result
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from pydantic import TypeAdapter, ValidationError
+
+from app.cache import READING, latest_cache
+from app.database import supabase
+from app.metrics import INGEST_BATCH_ROWS, INGEST_READINGS, INGEST_ROWS, register_callback
+from app.ml.inference import VERSION_KEY, inference
+from app.ml.nutrients import nutrient_rules
+from app.ml.streaming import plant_analytics
+from app.models import SensorReadingRow
+from app.pubsub import sensor_broker
+
+logger = logging.getLogger(__name__)
+# Rows the database refused, one record each with the row in `extra`
+dead_letter = logging.getLogger(__name__ + ".dead_letter")
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.5"))  # seconds
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_MAX_RETRIES = 3
+
+# PostgreSQL undefined_column, and PostgREST's unknown column in a write
+UNDEFINED_COLUMN = ("42703", "PGRST204")
+# SQLSTATE classes for rows the database refuses: data exception, integrity constraint violation
+REJECTED_CLASSES = ("22", "23")
+
+READING_ROW = TypeAdapter(SensorReadingRow)
+READING_ROWS = TypeAdapter(list[SensorReadingRow])
+
+
+class IngestQueueFull(Exception):
+    """Raised when the buffer cannot take more readings; callers should answer 503."""
+
+
+def reading_time(received: datetime, age_seconds) -> str:
+    """Timestamp of a reading taken `age_seconds` before it was received (buffered offline)."""
+    age = float(age_seconds)
+    if not age >= 0:
+        raise ValueError("age_seconds must be a number >= 0")
+    return (received - timedelta(seconds=age)).isoformat()
+
+
+def parse_readings(items: list, source: str) -> tuple[list[dict], list[dict]]:
+    """
+    Validate raw reading payloads from `source` (webhook, mqtt, ...).
+    Returns (rows ready to insert, rejected items as {index, error}). Rows
+    are stamped with one arrival time so live subscribers and the stored
+    rows agree on it, minus `age_seconds` for readings a device buffered.
+    """
+    received = datetime.now(timezone.utc)
+    received_at = received.isoformat()
+    # One validation call for the whole batch; item by item only to find the bad ones
+    try:
+        validated = READING_ROWS.validate_python(items)
+    except ValidationError:
+        validated = None
+    rows, rejected = [], []
+    for index, item in enumerate(items):
+        try:
+            row = validated[index] if validated is not None else READING_ROW.validate_python(item)
+            age = item.get("age_seconds")
+            row["timestamp"] = received_at if age is None else reading_time(received, age)
+        except Exception as e:
+            rejected.append({"index": index, "error": str(e)})
+            continue
+        if None in row.values():
+            row = {key: value for key, value in row.items() if value is not None}
+        rows.append(row)
+    INGEST_READINGS.inc(source, "accepted", amount=len(rows))
+    if rejected:
+        INGEST_READINGS.inc(source, "rejected", amount=len(rejected))
+    return rows, rejected
+
+
+async def check_version_column():
+    """
+    Stop tagging readings with the model version when sensor_readings has no
+    model_version column (migrations/005_model_version.sql not applied):
+    every insert carrying it would be rejected.
+    """
+    try:
+        await supabase.table("sensor_readings").select(VERSION_KEY).limit(1).execute()
+    except Exception as e:
+        if not isinstance(e, APIError) or e.code not in UNDEFINED_COLUMN:
+            logger.warning("[Ingest] Could not check for sensor_readings.%s: %s", VERSION_KEY, e)
+            return
+        inference.record_version = False
+        logger.warning(
+            "[Ingest] sensor_readings.%s is missing, apply migrations/005_model_version.sql; "
+            "readings are stored without the model version", VERSION_KEY,
+        )
+
+
+def publish_readings(rows: list[dict]):
+    """
+    Make stored readings visible: latest-state cache, live SSE subscribers
+    and streaming analytics. Adds `nutrient_status` to the rows in place.
+    """
+    plant_analytics.observe(rows)
+    for row in nutrient_rules.annotate(rows):
+        latest_cache.put(READING, row["plant_id"], row)
+        sensor_broker.publish(row)
+
+
+def is_rejection(e: Exception) -> bool:
+    """
+    Whether the database refused the rows themselves: a data exception
+    (22xxx, e.g. a value of the wrong type) or an integrity constraint
+    violation (23xxx, e.g. a plant_id that no longer exists). Inserting the
+    same rows again cannot succeed; anything else may be transient.
+    """
+    return isinstance(e, APIError) and str(e.code or "")[:2] in REJECTED_CLASSES
+
+
+async def _insert(rows: list[dict], table: str):
+    # missing=default lets rows with different key sets share one bulk insert
+    await supabase.table(table).insert(rows, returning=ReturnMethod.minimal, default_to_null=False).execute()
+
+
+async def write_readings(rows: list[dict], table: str = "sensor_readings") -> tuple[list[dict], list[dict]]:
+    """
+    Bulk insert with retries. Returns (written, failed): `failed` are rows
+    that could not be written because the database stayed unreachable or
+    kept erroring, and may be retried later.
+
+    A batch the database rejects is split in halves until the rows it
+    refuses are isolated, so one bad row does not take the rest of the
+    batch down with it. Those rows are dead-lettered (logged to
+    app.ingest.dead_letter and counted as failed) and are in neither list.
+    """
+    if not rows:
+        return [], []
+    INGEST_BATCH_ROWS.observe(len(rows), table)
+    written, failed = [], []
+    parts = [rows]
+    while parts:
+        part = parts.pop()
+        for attempt in range(1, INGEST_MAX_RETRIES + 1):
+            try:
+                await _insert(part, table)
+                written.extend(part)
+                break
+            except Exception as e:
+                if is_rejection(e):
+                    if len(part) > 1:
+                        middle = len(part) // 2
+                        parts += [part[middle:], part[:middle]]
+                    else:
+                        dead_letter.error(
+                            "[Ingest] Rejected by %s: %s; row %s", table, e, part[0], extra={"row": part[0]}
+                        )
+                        INGEST_ROWS.inc(table, "failed")
+                    break
+                logger.warning("[Ingest] Bulk insert failed (attempt %d/%d): %s", attempt, INGEST_MAX_RETRIES, e)
+                if attempt == INGEST_MAX_RETRIES:
+                    # The database is unreachable or erroring; the rest of the batch would fail the same way
+                    failed.extend(part)
+                    for rest in parts:
+                        failed.extend(rest)
+                    parts = []
+                else:
+                    await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+    if written:
+        logger.debug("[Ingest] Flushed %d rows to %s", len(written), table)
+        INGEST_ROWS.inc(table, "written", amount=len(written))
+    return written, failed
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer for sensor_readings.
+
+    Readings are queued in memory and written with one bulk insert per batch,
+    flushed when `batch_size` rows are waiting or `flush_interval` seconds
+    after the first row of a batch arrived, whichever comes first. The queue
+    is bounded: `submit` refuses a batch that does not fit instead of
+    growing without limit. Rows are published (see `publish_readings`) once
+    their insert succeeds, so live views never show a reading that was not
+    stored.
+    """
+
+    def __init__(
+        self,
+        table: str = "sensor_readings",
+        batch_size: int = INGEST_BATCH_SIZE,
+        flush_interval: float = INGEST_FLUSH_INTERVAL,
+        max_queue: int = INGEST_QUEUE_SIZE,
+    ):
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        # Rows taken off the queue but not yet handed to a write, and the write in flight
+        self._batch: list[dict] = []
+        self._inflight: asyncio.Future | None = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting work and flush everything still queued."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight is not None:
+            await self._inflight
+        await self._write(self._batch)
+        self._batch = []
+        while not self._queue.empty():
+            await self._write(self._drain(self.batch_size))
+
+    def check_room(self, count: int):
+        """Raise IngestQueueFull unless `count` more rows fit right now."""
+        if self._task is None:
+            raise IngestQueueFull("Ingest buffer is not running")
+        if self._queue.qsize() + count > self.max_queue:
+            raise IngestQueueFull(f"Ingest queue full ({self._queue.qsize()}/{self.max_queue})")
+
+    def submit(self, rows: list[dict]):
+        """Queue rows for insertion. All-or-nothing: raises IngestQueueFull if they don't fit."""
+        self.check_room(len(rows))
+        for row in rows:
+            self._queue.put_nowait(row)
+
+    def _drain(self, limit: int) -> list[dict]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                self._batch.extend(self._drain(self.batch_size - len(self._batch)))
+                if len(self._batch) >= self.batch_size:
+                    break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            # Shielded so that a shutdown mid-flush lets stop() await it instead of losing the batch
+            self._inflight = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _write(self, batch: list[dict]):
+        written, failed = await write_readings(batch, self.table)
+        publish_readings(written)
+        if failed:
+            INGEST_ROWS.inc(self.table, "dropped", amount=len(failed))
+            logger.error("[Ingest] Dropped %d rows after %d failed inserts", len(failed), INGEST_MAX_RETRIES)
+
+
+ingest_buffer = IngestBuffer()
+register_callback("ingest_queue_depth", "Readings waiting in the ingest buffer.", lambda: ingest_buffer.depth)
@@ -1,8 +1,45 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import plants, sensor_data, controls, thingsboard
+from fastapi.responses import PlainTextResponse
+from app import metrics
+from app.cache import warm_latest_cache
+from app.database import close_database
+from app.ingest import check_version_column, ingest_buffer
+from app.logs import configure_logging
+from app.ml.inference import inference
+from app.mqtt import publisher
+from app.mqtt.commands import command_dispatcher
+from app.mqtt.subscriber import mqtt_subscriber
+from app.retention import retention_worker
+from app.rollups import rollup_worker
+from app.routers import plants, sensor_data, controls, thingsboard, dashboard, models
 
-app = FastAPI(title="Plant Monitor API", version="1.0.0")
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await inference.start()
+    await check_version_column()
+    await ingest_buffer.start()
+    await warm_latest_cache()
+    await rollup_worker.start()
+    await retention_worker.start()
+    await command_dispatcher.start()
+    await mqtt_subscriber.start()
+    yield
+    await mqtt_subscriber.stop()
+    await command_dispatcher.stop()
+    await retention_worker.stop()
+    await rollup_worker.stop()
+    await ingest_buffer.stop()
+    await inference.stop()
+    await publisher.thingsboard.aclose()
+    await close_database()
+
+
+app = FastAPI(title="Plant Monitor API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,12 +47,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(plants.router)
 app.include_router(sensor_data.router)
 app.include_router(controls.router)
 app.include_router(thingsboard.router)
+app.include_router(dashboard.router)
+app.include_router(models.router)
 
 
 @app.get("/")
@@ -26,3 +67,8 @@ async def root():
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
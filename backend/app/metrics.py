@@ -0,0 +1,249 @@
+"""
+In-process metrics, served in the Prometheus text format at GET /metrics.
+
+Counters, gauges and histograms keep their values in plain dicts keyed by
+label values and are updated from the event loop thread only. State that
+already lives elsewhere (queue depths, cache hit counters, subscriber
+stats) is not copied on the hot path: `register_callback` reads it when
+/metrics is scraped.
+
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    with SUPABASE_REQUEST_SECONDS.time("GET", "sensor_readings", "200"):
+        ...
+"""
+
+import bisect
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, Union
+
+PREFIX = "plantpulse_"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+CallbackValue = Union[float, dict[tuple, float]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        registry.append(self)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> list[str]:
+        """Sample lines, without the HELP/TYPE header."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Iterable[str] = (), buckets: tuple = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class _Callback(_Metric):
+    def __init__(self, name: str, documentation: str, kind: str, read: Callable[[], CallbackValue], labels=()):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.read = read
+
+    def render(self) -> list[str]:
+        value = self.read()
+        values = value if isinstance(value, dict) else {(): value}
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in values.items()]
+
+
+registry: list[_Metric] = []
+
+
+def register_callback(
+    name: str, documentation: str, read: Callable[[], CallbackValue], kind: str = "gauge", labels: Iterable[str] = ()
+):
+    """Expose a value owned elsewhere; `read` returns a number or {label values: number}."""
+    _Callback(name, documentation, kind, read, tuple(labels))
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        try:
+            samples = metric.render()
+        except Exception:
+            continue  # a broken callback must not take the whole scrape down
+        lines += metric.header() + samples
+    return "\n".join(lines) + "\n"
+
+
+# ── Shared metrics ──────────────────────────────────────────────
+
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status")
+)
+SUPABASE_REQUEST_SECONDS = Histogram(
+    "supabase_request_duration_seconds",
+    "Latency of each PostgREST call, up to the response headers.",
+    ("method", "resource", "status"),
+)
+THINGSBOARD_REQUEST_SECONDS = Histogram(
+    "thingsboard_request_duration_seconds",
+    "Latency of each ThingsBoard REST call (logins and RPC attempts).",
+    ("operation", "status"),
+)
+INGEST_READINGS = Counter(
+    "ingest_readings_total", "Readings received for ingest by source and validation outcome.", ("source", "outcome")
+)
+INGEST_ROWS = Counter(
+    "ingest_rows_total",
+    "Rows bulk-inserted (written), refused by the database (failed) or given up on (dropped) by the ingest path.",
+    ("table", "outcome"),
+)
+INGEST_BATCH_ROWS = Histogram("ingest_batch_rows", "Rows per bulk insert.", ("table",), buckets=SIZE_BUCKETS)
+
+
+# ── HTTP instrumentation ────────────────────────────────────────
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording in-flight requests and latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # FastAPI puts the matched route in the scope; the template keeps label cardinality bounded
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status),
+            )
+
+
+def instrument_httpx(client, histogram: Histogram, labels: Callable):
+    """
+    Time every request of an httpx.AsyncClient into `histogram` through event
+    hooks. `labels(request)` returns the label values before the status.
+    """
+
+    async def on_request(request):
+        request.extensions["metrics_start"] = time.perf_counter()
+
+    async def on_response(response):
+        start = response.request.extensions.get("metrics_start")
+        if start is not None:
+            histogram.observe(time.perf_counter() - start, *labels(response.request), str(response.status_code))
+
+    client.event_hooks["request"].append(on_request)
+    client.event_hooks["response"].append(on_response)
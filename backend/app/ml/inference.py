@@ -0,0 +1,317 @@
+"""
+Server-side inference with the watering and health TFLite models in ml/.
+
+The models come from the registry (app/ml/registry.py), on the lightest
+runtime available (see app/ml/runtime.py). Readings from concurrent
+requests are collected into micro-batches and scored with one `invoke()`
+per model on a pool of INFERENCE_WORKERS threads, each with its own
+interpreters, so the event loop never blocks on inference and a model is
+never used from two threads at once.
+
+When ML_MODEL_DIR changes (checked every ML_RELOAD_INTERVAL_SECONDS, or
+on POST /models/reload) the new version is loaded next to the current
+one and swapped in without pausing scoring. Every prediction records the
+version that made it, stored in sensor_readings.model_version
+(migrations/005_model_version.sql; without it `record_version` is turned
+off at startup by app.ingest.check_version_column and nothing is tagged).
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.metrics import SIZE_BUCKETS, Counter, Histogram, register_callback
+from app.ml.registry import ML_MODEL_DIR, ModelVersion, fingerprint
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BATCH_ROWS = Histogram("inference_batch_rows", "Readings scored per model batch.", buckets=SIZE_BUCKETS)
+INFERENCE_BATCH_SECONDS = Histogram("inference_batch_duration_seconds", "Time to score one batch on the inference thread.")
+MODEL_RELOADS = Counter("model_reloads_total", "Model directory reloads by outcome.", ("result",))
+
+INFERENCE_ENABLED = os.getenv("INFERENCE_ENABLED", "true").lower() == "true"
+# A micro-batch is scored once it holds this many readings or has waited this long
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "256"))
+INFERENCE_MAX_WAIT = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5")) / 1000
+# Batches scored in parallel; each worker thread has its own interpreters
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+# How often ML_MODEL_DIR is checked for a new version; 0 only reloads on request
+ML_RELOAD_INTERVAL = float(os.getenv("ML_RELOAD_INTERVAL_SECONDS", "30"))
+
+PREDICTION_KEYS = ("watering_needed", "health_status")
+VERSION_KEY = "model_version"
+
+
+def feature_matrix(readings: list[dict], columns: list[str]) -> np.ndarray:
+    """(n, len(columns)) float32 matrix with NaN where a reading lacks a value."""
+    return np.array(
+        [[np.nan if r.get(c) is None else r[c] for c in columns] for r in readings],
+        dtype=np.float32,
+    ).reshape(len(readings), len(columns))
+
+
+class InferenceService:
+    """
+    Batched watering/health predictions for sensor readings.
+
+    `predict` may be awaited from many requests at once; their readings are
+    merged into micro-batches of up to `batch_size` rows, waiting at most
+    `max_wait` seconds for a batch to fill. Up to `workers` batches are
+    scored at once. A reading missing any feature a model needs gets None
+    for that model's prediction.
+    """
+
+    def __init__(
+        self,
+        model_dir: Path = ML_MODEL_DIR,
+        batch_size: int = INFERENCE_BATCH_SIZE,
+        max_wait: float = INFERENCE_MAX_WAIT,
+        workers: int = INFERENCE_WORKERS,
+        reload_interval: float = ML_RELOAD_INTERVAL,
+    ):
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.workers = max(workers, 1)
+        self.reload_interval = reload_interval
+        # Swapped in one assignment by reload(); a batch reads it once and keeps it
+        self.current: Optional[ModelVersion] = None
+        # Whether predictions carry the model version; off when the column does not exist
+        self.record_version = True
+        self.batches = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._free: Optional[asyncio.Semaphore] = None
+        self._reloading: Optional[asyncio.Lock] = None
+        self._failed: Optional[tuple] = None
+        self._scoring: set[asyncio.Task] = set()
+        # (readings, future) pairs taken off the queue for the batch being collected
+        self._pending: list[tuple[list[dict], asyncio.Future]] = []
+
+    @property
+    def available(self) -> bool:
+        return self._task is not None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.current.version if self.current else None
+
+    @property
+    def feature_columns(self) -> list[str]:
+        """Columns needed to score and compare a stored reading."""
+        columns = [column for spec in self.current.specs.values() for column in spec.columns]
+        extra = [VERSION_KEY] if self.record_version else []
+        return list(dict.fromkeys(["plant_id", *columns, *PREDICTION_KEYS, *extra]))
+
+    def load(self):
+        """Load ML_MODEL_DIR synchronously and make it the current version."""
+        self.current = ModelVersion(self.model_dir, self.workers, self.batch_size)
+
+    async def start(self):
+        if self._task is not None or not INFERENCE_ENABLED:
+            return
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception as e:
+            logger.warning("[Inference] Models not loaded, predictions disabled: %s", e)
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._queue = asyncio.Queue()
+        self._free = asyncio.Semaphore(self.workers)
+        self._reloading = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+        if self.reload_interval > 0:
+            self._watcher = asyncio.create_task(self._watch())
+        logger.info(
+            "[Inference] Loaded model version %s from %s (%s runtime, %d workers)",
+            self.version, self.current.model_dir, self.current.backend, self.workers,
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        for task in (self._watcher, self._task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._watcher = None
+        # Batches already on a worker finish; everything still queued is cancelled
+        if self._scoring:
+            await asyncio.gather(*self._scoring, return_exceptions=True)
+        while not self._queue.empty():
+            self._pending.append(self._queue.get_nowait())
+        for _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        self._executor.shutdown()
+        self._executor = None
+
+    async def reload(self, force: bool = False) -> bool:
+        """
+        Load ML_MODEL_DIR again if its files changed (always with `force`) and
+        swap it in. Returns whether the version changed; raises if the new
+        files do not load, leaving the current version in place.
+        """
+        async with self._reloading:
+            files = fingerprint(self.model_dir)
+            if not force and files in (self.current.fingerprint, self._failed):
+                return False
+            try:
+                # Off the inference threads, so scoring carries on while the new interpreters warm up
+                candidate = await asyncio.to_thread(ModelVersion, self.model_dir, self.workers, self.batch_size)
+            except Exception:
+                # Not retried until the files change again
+                self._failed = files
+                MODEL_RELOADS.inc("failed")
+                raise
+            self._failed = None
+            previous, self.current = self.current, candidate
+            if previous.version == candidate.version:
+                MODEL_RELOADS.inc("unchanged")
+                return False
+            MODEL_RELOADS.inc("loaded")
+            logger.info("[Inference] Model version %s → %s", previous.version, candidate.version)
+            return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error("[Inference] Keeping model version %s, reload failed: %s", self.version, e)
+
+    def predict_batch(self, readings: list[dict], version: Optional[ModelVersion] = None) -> list[dict]:
+        """Score readings synchronously, on the current version unless given one. Must run on an inference thread."""
+        results = [dict.fromkeys(PREDICTION_KEYS) for _ in readings]
+        if not readings:
+            return results
+        version = version or self.current
+        tag = version.version if self.record_version else None
+        with version.models() as models:
+            for name, key in (("watering", "watering_needed"), ("health", "health_status")):
+                spec = version.specs[name]
+                x = feature_matrix(readings, spec.columns)
+                complete = np.flatnonzero(~np.isnan(x).any(axis=1))
+                if not len(complete):
+                    continue
+                outputs = models[name].predict(x[complete])
+                if key == "watering_needed":
+                    values = (outputs[:, 0] >= spec.threshold).tolist()
+                else:
+                    values = [spec.labels.get(str(i), f"Class {i}") for i in outputs.argmax(axis=1)]
+                for index, value in zip(complete, values):
+                    results[index][key] = value
+                    if tag:
+                        results[index][VERSION_KEY] = tag
+        self.batches += 1
+        return results
+
+    async def predict(self, readings: list[dict]) -> list[dict]:
+        """{watering_needed, health_status, model_version} per reading, batched with concurrent callers."""
+        if not self.available or not readings:
+            return [dict.fromkeys(PREDICTION_KEYS) for _ in readings]
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((readings, future))
+        return await future
+
+    async def score_all(self, readings: list[dict]) -> list[dict]:
+        """Score a large set directly in `batch_size` chunks on one version, bypassing the micro-batcher."""
+        if not self.available:
+            return [dict.fromkeys(PREDICTION_KEYS) for _ in readings]
+        loop = asyncio.get_running_loop()
+        version = self.current
+        results = []
+        for i in range(0, len(readings), self.batch_size):
+            chunk = readings[i : i + self.batch_size]
+            async with self._free:
+                results.extend(await loop.run_in_executor(self._executor, self.predict_batch, chunk, version))
+        return results
+
+    async def annotate(self, rows: list[dict]):
+        """Fill in watering_needed/health_status where the device did not send them, and the model version that did."""
+        missing = [r for r in rows if any(r.get(key) is None for key in PREDICTION_KEYS)]
+        if not missing:
+            return
+        try:
+            predictions = await self.predict(missing)
+        except Exception as e:
+            # Never fail ingest because of the models; the rows are stored unscored
+            logger.warning("[Inference] Skipped scoring %d readings: %s", len(missing), e)
+            return
+        for row, prediction in zip(missing, predictions):
+            for key, value in prediction.items():
+                if row.get(key) is None and value is not None:
+                    row[key] = value
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Collect the next batch only once a worker is free; meanwhile the queue builds up
+            await self._free.acquire()
+            try:
+                self._pending = pending = [await self._queue.get()]
+            except asyncio.CancelledError:
+                self._free.release()
+                raise
+            size = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self._pending = []
+            task = asyncio.create_task(self._score(pending))
+            self._scoring.add(task)
+            task.add_done_callback(self._scoring.discard)
+
+    async def _score(self, pending: list[tuple[list[dict], asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        readings = [r for batch, _ in pending for r in batch]
+        INFERENCE_BATCH_ROWS.observe(len(readings))
+        try:
+            with INFERENCE_BATCH_SECONDS.time():
+                results = await loop.run_in_executor(self._executor, self.predict_batch, readings)
+        except Exception as e:
+            logger.error("[Inference] Batch of %d readings failed: %s", len(readings), e)
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._free.release()
+        offset = 0
+        for batch, future in pending:
+            if not future.done():
+                future.set_result(results[offset : offset + len(batch)])
+            offset += len(batch)
+
+
+inference = InferenceService()
+register_callback(
+    "inference_queue_depth",
+    "Prediction requests waiting for the next batch.",
+    lambda: inference._queue.qsize() if inference._queue else 0,
+)
+register_callback(
+    "model_version_info",
+    "Model version currently scoring readings.",
+    lambda: {(inference.version,): 1} if inference.version else {},
+    labels=("version",),
+)
@@ -0,0 +1,113 @@
+"""
+NPK status rules, evaluated over whole arrays of readings; batches under
+ARRAY_MIN_READINGS are compared one reading at a time instead.
+
+The thresholds come from `nutrient_rules` in ml/esp32_model_metadata.json,
+the same values the firmware's checkNutrients() in esp32_nutrient_rules.h
+uses: below `deficient_below` is low, above `optimal_max` is high.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from app.ml.registry import ML_MODEL_DIR, load_metadata
+
+NUTRIENTS = ("nitrogen", "phosphorus", "potassium")
+
+LOW, OPTIMAL, HIGH, UNKNOWN = range(4)
+STATUS_LABELS = ("low", "optimal", "high", None)
+
+# Below this many readings, comparing each reading in Python beats NumPy's per-call overhead
+ARRAY_MIN_READINGS = 256
+
+# One status dict per combination of N/P/K codes, indexed by n * 16 + p * 4 + k
+_STATUSES = tuple(
+    {"nitrogen": STATUS_LABELS[n], "phosphorus": STATUS_LABELS[p], "potassium": STATUS_LABELS[k]}
+    for n in range(4) for p in range(4) for k in range(4)
+)
+
+DEFAULT_RULES = {
+    "nitrogen": {"deficient_below": 40.0, "optimal_max": 120.0},
+    "phosphorus": {"deficient_below": 10.0, "optimal_max": 40.0},
+    "potassium": {"deficient_below": 50.0, "optimal_max": 200.0},
+}
+
+
+def values_matrix(readings: list[dict]) -> np.ndarray:
+    """(n, 3) N/P/K matrix with NaN where a reading has no value."""
+    # Column lists convert in one call each; NumPy turns None into NaN for float dtype
+    columns = [[r.get(n) for r in readings] for n in NUTRIENTS]
+    return np.array(columns, dtype=np.float64).reshape(len(NUTRIENTS), len(readings)).T
+
+
+class NutrientRules:
+    def __init__(self, rules: dict):
+        self.rules = {n: rules.get(n, DEFAULT_RULES[n]) for n in NUTRIENTS}
+        self.low = np.array([self.rules[n]["deficient_below"] for n in NUTRIENTS])
+        self.high = np.array([self.rules[n]["optimal_max"] for n in NUTRIENTS])
+        self._bounds = tuple((n, self.rules[n]["deficient_below"], self.rules[n]["optimal_max"]) for n in NUTRIENTS)
+
+    @classmethod
+    def from_metadata(cls, model_dir: Path = ML_MODEL_DIR) -> "NutrientRules":
+        return cls(load_metadata(model_dir).get("nutrient_rules", DEFAULT_RULES))
+
+    def evaluate(self, values: np.ndarray) -> np.ndarray:
+        """(n, 3) N/P/K values → (n, 3) int8 codes LOW/OPTIMAL/HIGH, UNKNOWN where NaN."""
+        codes = np.full(values.shape, OPTIMAL, dtype=np.int8)
+        codes[values < self.low] = LOW
+        codes[values > self.high] = HIGH
+        codes[np.isnan(values)] = UNKNOWN
+        return codes
+
+    def _combinations(self, readings: list[dict]) -> list[int]:
+        codes = self.evaluate(values_matrix(readings))
+        return (codes[:, 0].astype(np.intp) * 16 + codes[:, 1] * 4 + codes[:, 2]).tolist()
+
+    def labels(self, codes: np.ndarray) -> list[dict]:
+        """
+        {nitrogen, phosphorus, potassium} → 'low' / 'optimal' / 'high' / None
+        per row of codes. Rows with the same statuses share one dict: copy
+        it before changing it.
+        """
+        combos = codes[:, 0].astype(np.intp) * 16 + codes[:, 1] * 4 + codes[:, 2]
+        return [_STATUSES[i] for i in combos.tolist()]
+
+    def status(self, reading: dict) -> dict:
+        """Statuses of one reading, compared in Python."""
+        status = {}
+        for nutrient, low, high in self._bounds:
+            value = reading.get(nutrient)
+            if value is None:
+                status[nutrient] = None
+            else:
+                status[nutrient] = "low" if value < low else "high" if value > high else "optimal"
+        return status
+
+    def classify(self, readings: list[dict]) -> list[dict]:
+        if len(readings) < ARRAY_MIN_READINGS:
+            return [self.status(r) for r in readings]
+        return [_STATUSES[i].copy() for i in self._combinations(readings)]
+
+    def annotate(self, readings: list[dict]) -> list[dict]:
+        """Set `nutrient_status` on each reading in place, for API and stream payloads; returns them."""
+        if len(readings) < ARRAY_MIN_READINGS:
+            for reading in readings:
+                reading["nutrient_status"] = self.status(reading)
+        else:
+            for reading, i in zip(readings, self._combinations(readings)):
+                reading["nutrient_status"] = _STATUSES[i].copy()
+        return readings
+
+    def counts(self, codes: np.ndarray) -> dict:
+        """Per nutrient, how many readings fall in each status."""
+        return {
+            nutrient: {
+                label or "unknown": int(count)
+                for label, count in zip(STATUS_LABELS, np.bincount(codes[:, i], minlength=len(STATUS_LABELS)))
+            }
+            for i, nutrient in enumerate(NUTRIENTS)
+        }
+
+
+nutrient_rules = NutrientRules.from_metadata()
@@ -0,0 +1,270 @@
+"""
+Versioned registry for the watering and health models in ML_MODEL_DIR.
+
+ml/ holds two metadata files with different schemas: the ESP32 one
+(`watering_model`, `input_features`, `output` map) and the notebook export
+(`watering`, `features`, `classes` list, normalization stats). `read_specs`
+merges them once into a ModelSpec per model, rejecting metadata that
+disagrees on feature order and dropping normalization stats that are not
+finite (the models apply their own normalization, so those are only
+reported).
+
+A ModelVersion is one load of the directory, named by a hash of the model
+and metadata files. It owns a pool of interpreters, one set per inference
+worker, allocated and warmed up before the version goes live.
+InferenceService.reload builds the new version on a thread of its own and
+then swaps it in with one assignment: a batch already running finishes on
+the version it started with, and a directory that fails to load leaves
+the current version serving.
+
+Point ML_MODEL_DIR at a symlink and re-point it to deploy a new version
+atomically. Check a directory before deploying with:
+
+    python -m app.ml.registry check ../ml
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import queue
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.ml.runtime import load_model, npz_path
+
+logger = logging.getLogger(__name__)
+
+ML_MODEL_DIR = Path(os.getenv("ML_MODEL_DIR", Path(__file__).resolve().parents[3] / "ml"))
+
+ESP32_METADATA = "esp32_model_metadata.json"
+NOTEBOOK_METADATA = "notebook_tflite_metadata.json"
+WATERING_THRESHOLD = 0.5
+
+# name → (ESP32 key, notebook key, default file, default features, default labels)
+MODELS = {
+    "watering": (
+        "watering_model",
+        "watering",
+        "watering_model_float32.tflite",
+        ["SoilMoisture", "Temperature", "Humidity"],
+        ["No Water", "Needs Water"],
+    ),
+    "health": (
+        "health_model",
+        "health",
+        "health_model_float32.tflite",
+        ["SoilMoisture", "Temperature", "Humidity", "LightIntensity", "Nitrogen", "Phosphorus", "Potassium"],
+        ["Healthy", "High Stress", "Moderate Stress"],
+    ),
+}
+
+
+class MetadataError(ValueError):
+    """Model metadata is inconsistent or does not match the model file."""
+
+
+def load_metadata(model_dir: Path = ML_MODEL_DIR, name: str = ESP32_METADATA) -> dict:
+    path = model_dir / name
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def feature_column(feature: str) -> str:
+    """Metadata feature name → sensor_readings column, e.g. SoilMoisture → soil_moisture."""
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", feature).lower()
+
+
+def class_labels(notebook_meta: dict, esp32_meta: dict, default: list[str]) -> dict:
+    """
+    Output index → label. The notebook's `classes` list is the encoder order
+    used in training (as in ml/test_tflite_mock.py); the ESP32 `output` map
+    is only a fallback.
+    """
+    if isinstance(notebook_meta.get("classes"), list):
+        return {str(i): label for i, label in enumerate(notebook_meta["classes"])}
+    return esp32_meta.get("output", {str(i): label for i, label in enumerate(default)})
+
+
+def _stats(name: str, key: str, values, n_features: int) -> Optional[list[float]]:
+    if values is None:
+        return None
+    if not isinstance(values, list) or len(values) != n_features:
+        logger.warning("[Models] %s: ignoring %s, expected %d values", name, key, n_features)
+        return None
+    if not all(isinstance(v, (int, float)) and math.isfinite(v) for v in values):
+        logger.warning("[Models] %s: ignoring %s, it contains NaN or infinite values", name, key)
+        return None
+    return [float(v) for v in values]
+
+
+class ModelSpec:
+    """Normalized metadata of one model."""
+
+    def __init__(
+        self,
+        name: str,
+        path: Path,
+        task: str,
+        features: list[str],
+        labels: dict,
+        threshold: float,
+        input_mean: Optional[list[float]] = None,
+        input_std: Optional[list[float]] = None,
+    ):
+        self.name = name
+        self.path = path
+        self.task = task
+        self.features = features
+        self.columns = [feature_column(f) for f in features]
+        self.labels = labels
+        self.threshold = threshold
+        self.input_mean = input_mean
+        self.input_std = input_std
+
+    def describe(self) -> dict:
+        return {
+            "file": self.path.name,
+            "task": self.task,
+            "features": self.features,
+            "columns": self.columns,
+            "labels": self.labels,
+            "threshold": self.threshold if self.name == "watering" else None,
+            "input_mean": self.input_mean,
+            "input_std": self.input_std,
+        }
+
+
+def read_specs(model_dir: Path = ML_MODEL_DIR) -> dict[str, ModelSpec]:
+    """Both metadata files merged into one validated spec per model; raises MetadataError."""
+    try:
+        esp32 = load_metadata(model_dir, ESP32_METADATA)
+        notebook = load_metadata(model_dir, NOTEBOOK_METADATA)
+    except ValueError as e:
+        raise MetadataError(f"Unreadable metadata in {model_dir}: {e}")
+
+    specs = {}
+    for name, (esp32_key, notebook_key, default_file, default_features, default_labels) in MODELS.items():
+        esp32_meta, notebook_meta = esp32.get(esp32_key, {}), notebook.get(notebook_key, {})
+        esp32_features, notebook_features = esp32_meta.get("input_features"), notebook_meta.get("features")
+        if esp32_features and notebook_features and esp32_features != notebook_features:
+            raise MetadataError(f"{name}: feature order differs between {ESP32_METADATA} and {NOTEBOOK_METADATA}")
+        features = esp32_features or notebook_features or default_features
+        if len(set(features)) != len(features):
+            raise MetadataError(f"{name}: duplicate input features {features}")
+
+        labels = class_labels(notebook_meta, esp32_meta, default_labels)
+        output = esp32_meta.get("output")
+        if output and set(output.values()) != set(labels.values()):
+            raise MetadataError(f"{name}: class labels differ between {ESP32_METADATA} and {NOTEBOOK_METADATA}")
+        if output and output != labels:
+            logger.warning(
+                "[Models] %s: %s output order differs from the notebook classes; using the notebook order",
+                name, ESP32_METADATA,
+            )
+
+        threshold = float(notebook_meta.get("threshold", WATERING_THRESHOLD))
+        if not 0 < threshold < 1:
+            raise MetadataError(f"{name}: threshold {threshold} is not between 0 and 1")
+
+        specs[name] = ModelSpec(
+            name,
+            model_dir / (esp32_meta.get("file") or notebook_meta.get("tflite_model") or default_file),
+            esp32_meta.get("task") or notebook_meta.get("task", ""),
+            list(features),
+            labels,
+            threshold,
+            _stats(name, "input_mean", notebook_meta.get("input_mean"), len(features)),
+            _stats(name, "input_std", notebook_meta.get("input_std"), len(features)),
+        )
+    return specs
+
+
+def version_files(model_dir: Path, specs: dict[str, ModelSpec]) -> list[Path]:
+    """Files that make up a version, in a fixed order."""
+    paths = [model_dir / ESP32_METADATA, model_dir / NOTEBOOK_METADATA]
+    for spec in specs.values():
+        paths += [spec.path, npz_path(spec.path)]
+    return [p for p in paths if p.exists()]
+
+
+def fingerprint(model_dir: Path) -> tuple:
+    """Cheap change check: resolved directory plus size and mtime of every file in it."""
+    resolved = model_dir.resolve()
+    try:
+        entries = sorted((p.name, p.stat().st_size, p.stat().st_mtime_ns) for p in resolved.iterdir() if p.is_file())
+    except OSError:
+        entries = []
+    return (str(resolved), tuple(entries))
+
+
+def content_version(paths: list[Path]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+class ModelVersion:
+    """One loaded version: its specs and a pool of warmed-up interpreters per worker."""
+
+    def __init__(self, model_dir: Path, workers: int = 1, warmup_rows: int = 1):
+        self.model_dir = model_dir.resolve()
+        self.fingerprint = fingerprint(model_dir)
+        self.specs = read_specs(self.model_dir)
+        self.version = content_version(version_files(self.model_dir, self.specs))
+        self.backend = None
+        self._pool: queue.SimpleQueue = queue.SimpleQueue()
+        for _ in range(max(workers, 1)):
+            self._pool.put({name: self._load(spec, warmup_rows) for name, spec in self.specs.items()})
+
+    def _load(self, spec: ModelSpec, warmup_rows: int):
+        model = load_model(spec.path)
+        self.backend = model.backend
+        if model.n_features != len(spec.features):
+            raise MetadataError(f"{spec.name}: model takes {model.n_features} inputs, metadata lists {len(spec.features)}")
+        # Allocate tensors for a full batch now, not on the first request
+        outputs = model.predict(np.zeros((warmup_rows, model.n_features), dtype=np.float32))
+        width = outputs.shape[-1]
+        if spec.name != "watering" and width != len(spec.labels):
+            raise MetadataError(f"{spec.name}: model has {width} outputs, metadata lists {len(spec.labels)} labels")
+        return model
+
+    @contextmanager
+    def models(self):
+        """One worker's models, returned to the pool afterwards."""
+        models = self._pool.get()
+        try:
+            yield models
+        finally:
+            self._pool.put(models)
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "path": str(self.model_dir),
+            "runtime": self.backend,
+            "models": {name: spec.describe() for name, spec in self.specs.items()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model registry tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("check", help="validate a model directory and print its version")
+    check.add_argument("model_dir", type=Path, nargs="?", default=ML_MODEL_DIR)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    print(json.dumps(ModelVersion(args.model_dir).describe(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
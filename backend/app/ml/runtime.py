@@ -0,0 +1,227 @@
+"""
+Runtimes for the small TFLite classifiers in ml/.
+
+`load_model` uses the lightest backend that is installed, and imports it
+only when a model is actually loaded:
+
+    litert      ai-edge-litert
+    tflite      tflite-runtime
+    numpy       forward pass over weights exported next to the model as .npz
+    tensorflow  full TensorFlow; only used when ML_RUNTIME=tensorflow
+
+ML_RUNTIME=auto (the default) tries litert, tflite, then numpy. The .npz
+files are exported once, on any machine with a TFLite interpreter:
+
+    python -m app.ml.runtime export ../ml/*.tflite
+"""
+
+import argparse
+import importlib
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ML_RUNTIME = os.getenv("ML_RUNTIME", "auto")
+
+INTERPRETER_MODULES = {
+    "litert": "ai_edge_litert.interpreter",
+    "tflite": "tflite_runtime.interpreter",
+    "tensorflow": "tensorflow.lite",
+}
+AUTO_ORDER = ("litert", "tflite", "numpy")
+
+ACTIVATIONS = {
+    "NONE": lambda x: x,
+    "RELU": lambda x: np.maximum(x, 0.0),
+    "RELU6": lambda x: np.clip(x, 0.0, 6.0),
+}
+
+
+class ModelRuntimeUnavailable(Exception):
+    """No configured backend can load the model."""
+
+
+def _interpreter_module(backend: str):
+    try:
+        return importlib.import_module(INTERPRETER_MODULES[backend])
+    except ImportError as e:
+        raise ModelRuntimeUnavailable(f"{backend} runtime is not installed ({e})")
+
+
+def npz_path(path: Path) -> Path:
+    return Path(path).with_suffix(".npz")
+
+
+class TFLiteModel:
+    """A TFLite interpreter whose input tensor is resized to the batch, in powers of two."""
+
+    def __init__(self, path: Path, backend: str):
+        self.backend = backend
+        self.interpreter = _interpreter_module(backend).Interpreter(model_path=str(path))
+        self.interpreter.allocate_tensors()
+        details = self.interpreter.get_input_details()[0]
+        self.n_features = int(details["shape"][-1])
+        self._input = details["index"]
+        self._output = self.interpreter.get_output_details()[0]["index"]
+        self._batch_capacity = 1
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """Model outputs for a (n, features) float32 matrix, in one invoke()."""
+        n = len(x)
+        if n > self._batch_capacity or n < self._batch_capacity // 4:
+            # Grow in powers of two so varying batch sizes don't reallocate on every call
+            self._batch_capacity = 1 << max(n - 1, 0).bit_length()
+            self.interpreter.resize_tensor_input(self._input, [self._batch_capacity, self.n_features])
+            self.interpreter.allocate_tensors()
+        padded = np.zeros((self._batch_capacity, self.n_features), dtype=np.float32)
+        padded[:n] = x
+        self.interpreter.set_tensor(self._input, padded)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self._output)[:n].copy()
+
+
+class NumpyModel:
+    """
+    Plain NumPy forward pass of an exported op list: the normalization
+    SUB/MUL constants, dense layers with their fused activation, and the
+    LOGISTIC/SOFTMAX output.
+    """
+
+    backend = "numpy"
+
+    def __init__(self, path: Path):
+        with np.load(npz_path(path)) as data:
+            arrays = dict(data)
+        self.ops = [str(op) for op in arrays.pop("ops")]
+        self.params = arrays
+        self.n_features = int(arrays["n_features"])
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        for i, op in enumerate(self.ops):
+            name, _, activation = op.partition(":")
+            if name == "SUB":
+                x = x - self.params[f"{i}_const"]
+            elif name == "MUL":
+                x = x * self.params[f"{i}_const"]
+            elif name == "ADD":
+                x = x + self.params[f"{i}_const"]
+            elif name == "FULLY_CONNECTED":
+                x = ACTIVATIONS[activation](x @ self.params[f"{i}_weights"].T + self.params[f"{i}_bias"])
+            elif name == "RELU":
+                x = np.maximum(x, 0.0)
+            elif name == "LOGISTIC":
+                x = 1.0 / (1.0 + np.exp(-x))
+            elif name == "SOFTMAX":
+                e = np.exp(x - x.max(axis=-1, keepdims=True))
+                x = e / e.sum(axis=-1, keepdims=True)
+            else:
+                raise ValueError(f"Unsupported op {name}")
+        return x.astype(np.float32)
+
+
+def load_model(path: Path, backend: str = ML_RUNTIME):
+    """Load a model with `backend`, or the first available one for 'auto'."""
+    if backend != "auto":
+        return NumpyModel(path) if backend == "numpy" else TFLiteModel(path, backend)
+    errors = []
+    for candidate in AUTO_ORDER:
+        try:
+            if candidate == "numpy":
+                if not npz_path(path).exists():
+                    raise ModelRuntimeUnavailable(f"{npz_path(path).name} not exported")
+                return NumpyModel(path)
+            return TFLiteModel(path, candidate)
+        except ModelRuntimeUnavailable as e:
+            errors.append(str(e))
+    raise ModelRuntimeUnavailable("; ".join(errors))
+
+
+def export_npz(path: Path, backend: str = "auto") -> Path:
+    """
+    Write the weights of a sequential dense .tflite model to <model>.npz.
+
+    Constants are read from the interpreter. Fused activations are not
+    exposed by its Python API, so each dense layer's activation is
+    identified by replaying it against the interpreter's preserved
+    intermediate tensors. The export is checked end to end before writing.
+    """
+    candidates = [b for b in INTERPRETER_MODULES if b != "tensorflow"] if backend == "auto" else [backend]
+    for candidate in candidates:
+        try:
+            module = _interpreter_module(candidate)
+            break
+        except ModelRuntimeUnavailable:
+            if candidate == candidates[-1]:
+                raise
+    resolver = getattr(module, "OpResolverType", None) or module.experimental.OpResolverType
+    interpreter = module.Interpreter(
+        model_path=str(path),
+        experimental_preserve_all_tensors=True,
+        experimental_op_resolver_type=resolver.BUILTIN_WITHOUT_DEFAULT_DELEGATES,
+    )
+    input_index = interpreter.get_input_details()[0]["index"]
+    n_features = int(interpreter.get_input_details()[0]["shape"][-1])
+    interpreter.resize_tensor_input(input_index, [256, n_features])
+    interpreter.allocate_tensors()
+
+    # _get_ops_details is the only way to walk the graph without the flatbuffer schema
+    ops = interpreter._get_ops_details()
+    produced = {input_index} | {t for op in ops for t in op["outputs"]}
+    constants = {
+        t: interpreter.get_tensor(t) for op in ops for t in op["inputs"] if t >= 0 and t not in produced
+    }
+
+    # Inputs spread well beyond the normalization statistics, so every hidden unit sees negatives
+    rng = np.random.default_rng(0)
+    first = ops[0]["inputs"][1] if ops[0]["op_name"] == "SUB" else None
+    center = constants[first] if first is not None else 0.0
+    x = (center + rng.normal(0.0, 1.0, (256, n_features)) * (np.abs(center) + 10.0)).astype(np.float32)
+    interpreter.set_tensor(input_index, x)
+    interpreter.invoke()
+
+    names, params = [], {"n_features": np.array(n_features)}
+    for i, op in enumerate(ops):
+        name = op["op_name"]
+        if name in ("SUB", "MUL", "ADD"):
+            params[f"{i}_const"] = constants[op["inputs"][1]]
+        elif name == "FULLY_CONNECTED":
+            weights, bias = constants[op["inputs"][1]], constants[op["inputs"][2]]
+            params[f"{i}_weights"], params[f"{i}_bias"] = weights, bias
+            pre = interpreter.get_tensor(op["inputs"][0]) @ weights.T + bias
+            out = interpreter.get_tensor(op["outputs"][0])
+            matches = [a for a, f in ACTIVATIONS.items() if np.allclose(f(pre), out, rtol=1e-4, atol=1e-4)]
+            if not matches:
+                raise ValueError(f"{path.name}: unsupported activation on op {i}")
+            name = f"{name}:{matches[0]}"
+        elif name not in ("RELU", "LOGISTIC", "SOFTMAX"):
+            raise ValueError(f"{path.name}: unsupported op {name}")
+        names.append(name)
+    params["ops"] = np.array(names)
+
+    target = npz_path(path)
+    np.savez(target, **params)
+    expected = interpreter.get_tensor(interpreter.get_output_details()[0]["index"])
+    if not np.allclose(NumpyModel(path).predict(x), expected, rtol=1e-4, atol=1e-5):
+        target.unlink()
+        raise ValueError(f"{path.name}: NumPy export does not reproduce the interpreter output")
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TFLite model runtime tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="export .tflite weights to .npz for the NumPy backend")
+    export.add_argument("models", nargs="+", type=Path)
+    export.add_argument("--backend", default="auto", choices=["auto", *INTERPRETER_MODULES])
+    args = parser.parse_args()
+    for model in args.models:
+        print(f"{model} → {export_npz(model, args.backend)}")
+
+
+if __name__ == "__main__":
+    main()
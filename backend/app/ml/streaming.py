@@ -0,0 +1,268 @@
+"""
+Streaming per-plant analytics over the ingest path.
+
+Every accepted reading updates a fixed amount of state per plant, held as
+plain floats and per-metric lists on one small object per plant, so the
+cost per reading does not depend on how much history exists and nothing
+is re-read from the database:
+
+  * per metric, an exponentially weighted mean and variance (Welford's
+    update; exact running mean/variance for the first 1/alpha readings)
+    → a reading more than ANALYTICS_SPIKE_Z deviations from the mean is a
+    spike
+  * per metric, how long the value has not changed → a sensor repeating
+    the exact same value for ANALYTICS_STUCK_SECONDS is stuck
+  * for soil_moisture, a time-decayed least-squares line (half-life
+    ANALYTICS_TREND_HALF_LIFE_HOURS) → drying rate per hour and the time
+    until it reaches SOIL_MOISTURE_DRY_THRESHOLD. A jump up by
+    ANALYTICS_WATERING_JUMP points is a watering and restarts the line.
+
+A batch is applied reading by reading in time order. A handful of floats
+per reading is cheaper in plain Python than in NumPy, whose per-call
+overhead dominates arrays this small. State lives in the process and is
+rebuilt from incoming readings after a restart.
+"""
+
+import math
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.history import METRIC_COLUMNS, to_epoch_seconds
+from app.metrics import Counter, register_callback
+
+ANALYTICS_ALPHA = float(os.getenv("ANALYTICS_ALPHA", "0.05"))
+ANALYTICS_WARMUP = int(os.getenv("ANALYTICS_WARMUP", "20"))  # readings before spikes are flagged
+ANALYTICS_SPIKE_Z = float(os.getenv("ANALYTICS_SPIKE_Z", "4"))
+ANALYTICS_STUCK_SECONDS = float(os.getenv("ANALYTICS_STUCK_SECONDS", "1800"))
+# NPK probes and light at night legitimately hold one value for hours
+ANALYTICS_STUCK_METRICS = os.getenv("ANALYTICS_STUCK_METRICS", "soil_moisture,temperature,humidity").split(",")
+ANALYTICS_TREND_HALF_LIFE_HOURS = float(os.getenv("ANALYTICS_TREND_HALF_LIFE_HOURS", "6"))
+ANALYTICS_MIN_TREND_HOURS = float(os.getenv("ANALYTICS_MIN_TREND_HOURS", "0.5"))
+ANALYTICS_WATERING_JUMP = float(os.getenv("ANALYTICS_WATERING_JUMP", "10"))
+SOIL_MOISTURE_DRY_THRESHOLD = float(os.getenv("SOIL_MOISTURE_DRY_THRESHOLD", "30"))
+
+TREND_METRIC = "soil_moisture"
+
+ANALYTICS_ANOMALIES = Counter("analytics_anomalies_total", "Readings flagged as spikes by streaming analytics.", ("metric",))
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def _epoch(timestamp) -> float:
+    """Seconds since the epoch; timestamps without an offset are UTC, as in to_epoch_seconds."""
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):  # forms NumPy reads but datetime does not
+        return float(to_epoch_seconds([timestamp])[0])
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class _PlantState:
+    """One plant's running state: per-metric lists and the trend sums as floats."""
+
+    __slots__ = (
+        "count", "mean", "var", "last", "same_since", "spiked", "spikes",
+        "seen", "last_at", "trend_since", "n", "st", "sx", "stt", "stx",
+    )
+
+    def __init__(self, metrics: int):
+        self.count = [0] * metrics
+        self.mean = [0.0] * metrics
+        self.var = [0.0] * metrics
+        self.last = [math.nan] * metrics
+        self.same_since = [math.nan] * metrics
+        self.spiked = [False] * metrics
+        self.spikes = [0] * metrics
+        self.seen = 0
+        self.last_at = -math.inf
+        self.trend_since = math.nan
+        # Time-decayed sums for the trend line, t in hours relative to the newest reading
+        self.n = self.st = self.sx = self.stt = self.stx = 0.0
+
+
+class StreamingAnalytics:
+    def __init__(
+        self,
+        metrics: list[str] = METRIC_COLUMNS,
+        alpha: float = ANALYTICS_ALPHA,
+        warmup: int = ANALYTICS_WARMUP,
+        spike_z: float = ANALYTICS_SPIKE_Z,
+        stuck_seconds: float = ANALYTICS_STUCK_SECONDS,
+        stuck_metrics: list[str] = ANALYTICS_STUCK_METRICS,
+        half_life_hours: float = ANALYTICS_TREND_HALF_LIFE_HOURS,
+        min_trend_hours: float = ANALYTICS_MIN_TREND_HOURS,
+        watering_jump: float = ANALYTICS_WATERING_JUMP,
+        dry_threshold: float = SOIL_MOISTURE_DRY_THRESHOLD,
+    ):
+        self.metrics = list(metrics)
+        self.alpha = alpha
+        self.warmup = warmup
+        self.spike_z = spike_z
+        self.stuck_seconds = stuck_seconds
+        self.stuck_mask = [m in stuck_metrics for m in self.metrics]
+        self.half_life_hours = half_life_hours
+        self.min_trend_hours = min_trend_hours
+        self.watering_jump = watering_jump
+        self.dry_threshold = dry_threshold
+        self.trend_column = self.metrics.index(TREND_METRIC)
+        self.plants: dict[str, _PlantState] = {}
+
+    # ── Store ────────────────────────────────────────────────────
+
+    def _state(self, plant_id: str) -> _PlantState:
+        state = self.plants.get(plant_id)
+        if state is None:
+            state = self.plants[plant_id] = _PlantState(len(self.metrics))
+        return state
+
+    def forget(self, plant_id):
+        self.plants.pop(str(plant_id), None)
+
+    @property
+    def plant_count(self) -> int:
+        return len(self.plants)
+
+    # ── Updates ──────────────────────────────────────────────────
+
+    def observe(self, rows: list[dict]):
+        """Fold accepted readings into their plants' state."""
+        if not rows:
+            return
+        at = [_epoch(row["timestamp"]) for row in rows]
+        # Oldest first, so a plant's readings arrive in order (ties keep their batch order)
+        order = sorted(range(len(rows)), key=at.__getitem__) if len(rows) > 1 else (0,)
+        for i in order:
+            row = rows[i]
+            self._update(self._state(str(row["plant_id"])), at[i], row)
+
+    def _update(self, state: _PlantState, t: float, row: dict):
+        """One reading for one plant."""
+        if t <= state.last_at:  # out of order or replayed: leave the state alone
+            return
+        previous = state.last[self.trend_column]
+        count, mean, var, last, flags = state.count, state.mean, state.var, state.last, state.spiked
+        warmup, spike_z, min_alpha = self.warmup, self.spike_z, self.alpha
+        for i, metric in enumerate(self.metrics):
+            x = row.get(metric)
+            if x is None:
+                continue
+            x = float(x)
+            if x != x:  # NaN
+                continue
+            c, m, v = count[i], mean[i], var[i]
+
+            # Floor at 1% of the level: a probe that sat on one value has ~0 variance,
+            # and its next small step is not a spike
+            std = max(math.sqrt(v), 0.01 * abs(m))
+            spiked = c >= warmup and std > 0 and abs(x - m) / std > spike_z
+
+            alpha = max(min_alpha, 1.0 / (c + 1))
+            diff = x - m
+            increment = alpha * diff
+            mean[i] = m + increment
+            var[i] = (1 - alpha) * (v + diff * increment)
+            count[i] = c + 1
+
+            if x != last[i]:
+                state.same_since[i] = t
+            last[i] = x
+            flags[i] = spiked
+            if spiked:
+                state.spikes[i] += 1
+                ANALYTICS_ANOMALIES.inc(metric)
+
+        self._update_trend(state, t, row.get(TREND_METRIC), previous)
+        state.last_at = t
+        state.seen += 1
+
+    def _update_trend(self, state: _PlantState, t: float, x, previous: float):
+        if state.last_at != -math.inf:
+            d = (t - state.last_at) / 3600
+            # Move the origin to the new reading, then age everything by the elapsed time
+            n, st, sx = state.n, state.st, state.sx
+            decay = 0.5 ** (d / self.half_life_hours)
+            state.stt = (state.stt - 2 * d * st + d * d * n) * decay
+            state.stx = (state.stx - d * sx) * decay
+            state.st = (st - d * n) * decay
+            state.n = n * decay
+            state.sx = sx * decay
+
+        if x is None or x != x:
+            return
+        x = float(x)
+        watered = x - previous > self.watering_jump  # False while previous is NaN
+        if watered:
+            state.n = state.st = state.sx = state.stt = state.stx = 0.0
+        if watered or math.isnan(state.trend_since):
+            state.trend_since = t
+        state.n += 1
+        state.sx += x
+
+    # ── Results ──────────────────────────────────────────────────
+
+    def forecast(self, state: _PlantState) -> dict:
+        """Soil moisture trend per hour and time until it is dry, when there is enough of a trend."""
+        n, st, sx, stt, stx = state.n, state.st, state.sx, state.stt, state.stx
+        since = state.trend_since
+        denominator = n * stt - st * st
+        if math.isnan(since) or (state.last_at - since) / 3600 < self.min_trend_hours or denominator <= 1e-12:
+            return {"soil_moisture_per_hour": None, "hours_until_dry": None, "dry_at": None}
+        slope = (n * stx - st * sx) / denominator
+        level = (sx - slope * st) / n
+        if level <= self.dry_threshold:
+            hours = 0.0
+        elif slope < 0:
+            hours = (level - self.dry_threshold) / -slope
+        else:
+            hours = None
+        return {
+            "soil_moisture_per_hour": round(slope, 4),
+            "hours_until_dry": round(hours, 2) if hours is not None else None,
+            "dry_at": _iso(state.last_at + hours * 3600) if hours is not None else None,
+        }
+
+    def snapshot(self, plant_id) -> Optional[dict]:
+        """Current analytics for one plant, or None before its first reading."""
+        state = self.plants.get(str(plant_id))
+        if state is None or not state.seen:
+            return None
+        last_at = state.last_at
+        metrics, anomalies = {}, []
+        for i, metric in enumerate(self.metrics):
+            count = state.count[i]
+            if not count:
+                continue
+            spiked = state.spiked[i]
+            stuck = (
+                self.stuck_mask[i]
+                and count >= self.warmup
+                and last_at - state.same_since[i] >= self.stuck_seconds
+            )
+            metrics[metric] = {
+                "mean": round(state.mean[i], 4),
+                "std": round(math.sqrt(state.var[i]), 4),
+                "last": state.last[i],
+                "spike": spiked,
+                "stuck": stuck,
+                "spikes": state.spikes[i],
+            }
+            if spiked:
+                anomalies.append({"metric": metric, "kind": "spike"})
+            if stuck:
+                anomalies.append({"metric": metric, "kind": "stuck", "since": _iso(state.same_since[i])})
+        return {
+            "readings": state.seen,
+            "updated_at": _iso(last_at),
+            "anomalies": anomalies,
+            "forecast": self.forecast(state),
+            "metrics": metrics,
+        }
+
+
+plant_analytics = StreamingAnalytics()
+register_callback("analytics_plants", "Plants with streaming analytics state.", lambda: plant_analytics.plant_count)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional
+from typing_extensions import Required, TypedDict
 from datetime import datetime
 
 
@@ -8,6 +9,14 @@ class PlantCreate(BaseModel):
     variety: Optional[str] = None
     plant_type: Optional[str] = None
     image_url: Optional[str] = None
+    device_id: Optional[str] = None
+    zone: Optional[str] = None
+
+
+class PlantDevice(BaseModel):
+    """ThingsBoard device that drives a plant, and the zone it belongs to for bulk controls."""
+    device_id: Optional[str] = None
+    zone: Optional[str] = None
 
 
 class PlantResponse(BaseModel):
@@ -17,6 +26,8 @@ class PlantResponse(BaseModel):
     variety: Optional[str]
     plant_type: Optional[str]
     image_url: Optional[str]
+    device_id: Optional[str] = None
+    zone: Optional[str] = None
     last_watered: Optional[datetime]
     created_at: datetime
 
@@ -34,9 +45,34 @@ class SensorReading(BaseModel):
     health_status: Optional[str] = None
 
 
+class SensorReadingRow(TypedDict, total=False):
+    """SensorReading validated straight into a plain dict, for ingest batches. Keep the two in sync."""
+
+    plant_id: Required[int]
+    soil_moisture: Optional[float]
+    temperature: Optional[float]
+    humidity: Optional[float]
+    light_intensity: Optional[float]
+    nitrogen: Optional[float]
+    phosphorus: Optional[float]
+    potassium: Optional[float]
+    watering_needed: Optional[bool]
+    health_status: Optional[str]
+
+
 class LightToggle(BaseModel):
     is_on: bool
 
 
+class BulkTarget(BaseModel):
+    """Plants a bulk control applies to: a zone, a list of ids, both, or every plant of the user."""
+    zone: Optional[str] = None
+    plant_ids: Optional[list[int]] = None
+
+
+class BulkLightToggle(BulkTarget):
+    is_on: bool
+
+
 class WaterTrigger(BaseModel):
     plant_id: str
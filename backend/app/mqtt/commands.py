@@ -0,0 +1,294 @@
+"""
+Background dispatcher for device control commands.
+
+The control endpoints hand commands to `command_dispatcher` and return a
+command id right away; RPCs are sent from a small pool of workers. Per
+device:
+
+  * commands go out one at a time, in submission order;
+  * a light command that has not been sent yet is replaced by a newer one
+    (status `superseded`), and light commands wait `light_debounce`
+    seconds for the burst to settle, so toggling quickly sends one RPC
+    with the final state;
+  * water commands are accepted at most once per `water_interval`
+    seconds per plant, further ones raise CommandRateLimited. The limit is
+    kept per (plant, device): plants without a device mapping all share
+    THINGSBOARD_DEVICE_ID and must not block each other.
+
+Bulk controls submit one command per device with `submit_many` and
+`wait` for them; the worker pool bounds how many RPCs are in flight, all
+over the shared ThingsBoard connection pool.
+
+Command records are kept in memory (the newest `history_size`) for the
+status endpoint.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Iterable, Optional
+
+from app.metrics import register_callback
+from app.mqtt.publisher import send_rpc_command
+
+logger = logging.getLogger(__name__)
+
+COMMAND_WORKERS = int(os.getenv("COMMAND_WORKERS", "8"))
+LIGHT_DEBOUNCE_SECONDS = float(os.getenv("LIGHT_DEBOUNCE_SECONDS", "0.3"))
+WATER_MIN_INTERVAL_SECONDS = float(os.getenv("WATER_MIN_INTERVAL_SECONDS", "60"))
+COMMAND_HISTORY_SIZE = int(os.getenv("COMMAND_HISTORY_SIZE", "10000"))
+COMMAND_SHUTDOWN_TIMEOUT = 5.0  # seconds to flush pending commands on shutdown
+
+LIGHT_COMMAND = "light"
+WATER_COMMAND = "water"
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+SUPERSEDED = "superseded"
+
+
+class CommandRateLimited(Exception):
+    """A water command arrived too soon after the previous one; callers should answer 429."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+DONE = (SENT, FAILED, SUPERSEDED)
+
+
+class Command:
+    FIELDS = ("id", "device_id", "kind", "params", "status", "error", "superseded_by", "created_at", "updated_at")
+    __slots__ = FIELDS + ("user_id", "finished")
+
+    def __init__(self, device_id: Optional[str], kind: str, params: dict, user_id: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.device_id = device_id
+        self.user_id = user_id  # who submitted it; only they see its status
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.superseded_by: Optional[str] = None
+        self.created_at = self.updated_at = _now_iso()
+        self.finished = asyncio.Event()
+
+    def set_status(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.updated_at = _now_iso()
+        if status in DONE:
+            self.finished.set()
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class _Device:
+    __slots__ = ("id", "pending", "timer", "ready", "busy")
+
+    def __init__(self, device_id):
+        self.id = device_id
+        self.pending: deque[Command] = deque()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.ready = False  # waiting in the dispatcher's ready queue
+        self.busy = False  # a worker is sending its commands
+
+    @property
+    def idle(self) -> bool:
+        return not (self.pending or self.busy or self.ready)
+
+
+async def send_command(command: Command):
+    await send_rpc_command(command.device_id, **command.params)
+
+
+class CommandDispatcher:
+    def __init__(
+        self,
+        send: Callable[[Command], Awaitable] = send_command,
+        workers: int = COMMAND_WORKERS,
+        light_debounce: float = LIGHT_DEBOUNCE_SECONDS,
+        water_interval: float = WATER_MIN_INTERVAL_SECONDS,
+        history_size: int = COMMAND_HISTORY_SIZE,
+    ):
+        self.send = send
+        self.workers = workers
+        self.light_debounce = light_debounce
+        self.water_interval = water_interval
+        self.history_size = history_size
+        self.sent_count = 0
+        self._commands: OrderedDict[str, Command] = OrderedDict()
+        self._devices: dict[Optional[str], _Device] = {}
+        # (plant_id, device_id) → monotonic time of its last water command, oldest first
+        self._watered: OrderedDict[tuple, float] = OrderedDict()
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        if not self._tasks:
+            self._ready = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = COMMAND_SHUTDOWN_TIMEOUT):
+        """Send what is still pending (skipping the debounce), then stop the workers."""
+        if not self._tasks:
+            return
+        for device in self._devices.values():
+            if device.pending:
+                self._schedule(device, 0)
+        deadline = time.monotonic() + timeout
+        while not all(d.idle for d in self._devices.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def pending(self) -> int:
+        return sum(len(device.pending) for device in self._devices.values())
+
+    def get(self, command_id: str) -> Optional[Command]:
+        return self._commands.get(command_id)
+
+    @staticmethod
+    def _water_keys(device_id: Optional[str], plant_ids: Iterable) -> list[tuple]:
+        # Without plants the whole device is the key, as before plants were known
+        return [(str(p), device_id) for p in plant_ids] or [(None, device_id)]
+
+    def water_retry_after(self, device_id: Optional[str], plant_ids: Iterable = ()) -> float:
+        """
+        Seconds until a water command for these plants on this device would
+        be accepted (0 if now): any of them watered recently holds it back.
+        """
+        last = max(self._watered.get(key, float("-inf")) for key in self._water_keys(device_id, plant_ids))
+        return max(0.0, last + self.water_interval - time.monotonic())
+
+    def _record_water(self, device_id: Optional[str], plant_ids: Iterable):
+        now = time.monotonic()
+        for key in self._water_keys(device_id, plant_ids):
+            self._watered[key] = now
+            self._watered.move_to_end(key)
+        # Entries older than the interval no longer limit anything
+        while self._watered and next(iter(self._watered.values())) + self.water_interval <= now:
+            self._watered.popitem(last=False)
+
+    def submit(
+        self,
+        device_id: Optional[str],
+        kind: str,
+        params: dict,
+        debounce: bool = True,
+        user_id: Optional[str] = None,
+        plant_ids: Iterable = (),
+    ) -> Command:
+        """Queue a command for a device; `plant_ids` are the plants it acts for (the water limit's key)."""
+        if not self._tasks:
+            raise RuntimeError("Command dispatcher is not running")
+        device = self._devices.get(device_id)
+        if device is None:
+            device = self._devices[device_id] = _Device(device_id)
+
+        command = Command(device_id, kind, params, user_id)
+        if kind == WATER_COMMAND:
+            plant_ids = list(plant_ids)
+            retry_after = self.water_retry_after(device_id, plant_ids)
+            if retry_after > 0:
+                raise CommandRateLimited(retry_after)
+            self._record_water(device_id, plant_ids)
+        else:
+            for queued in [c for c in device.pending if c.kind == LIGHT_COMMAND]:
+                queued.set_status(SUPERSEDED)
+                queued.superseded_by = command.id
+                device.pending.remove(queued)
+
+        device.pending.append(command)
+        self._remember(command)
+        self._schedule(device, self.light_debounce if kind == LIGHT_COMMAND and debounce else 0)
+        return command
+
+    def submit_many(self, devices: dict, kind: str, params: dict, user_id: Optional[str] = None) -> dict:
+        """
+        The same command for several devices ({device_id: plant_ids}), sent
+        without the light debounce. Returns {device_id: Command}, or
+        CommandRateLimited for a device with a plant watered too recently.
+        """
+        commands = {}
+        for device_id, plant_ids in devices.items():
+            try:
+                commands[device_id] = self.submit(
+                    device_id, kind, params, debounce=False, user_id=user_id, plant_ids=plant_ids
+                )
+            except CommandRateLimited as e:
+                commands[device_id] = e
+        return commands
+
+    async def wait(self, commands: list[Command], timeout: float) -> bool:
+        """Wait until every command is sent, failed or superseded; False if `timeout` ran out first."""
+        waiters = [asyncio.ensure_future(c.finished.wait()) for c in commands if not c.finished.is_set()]
+        if not waiters:
+            return True
+        _, pending = await asyncio.wait(waiters, timeout=timeout)
+        for waiter in pending:
+            waiter.cancel()
+        return not pending
+
+    def _remember(self, command: Command):
+        self._commands[command.id] = command
+        while len(self._commands) > self.history_size:
+            self._commands.popitem(last=False)
+
+    def _schedule(self, device: _Device, delay: float):
+        """Queue the device for a worker after `delay`, restarting any pending debounce."""
+        if device.busy or device.ready:
+            # The worker drains everything pending before it lets go of the device
+            return
+        if device.timer is not None:
+            device.timer.cancel()
+            device.timer = None
+        if delay > 0:
+            device.timer = asyncio.get_running_loop().call_later(delay, self._schedule, device, 0)
+            return
+        device.ready = True
+        self._ready.put_nowait(device.id)
+
+    async def _worker(self):
+        while True:
+            device = self._devices[await self._ready.get()]
+            device.ready, device.busy = False, True
+            try:
+                while device.pending:
+                    await self._dispatch(device.pending.popleft())
+            finally:
+                device.busy = False
+
+    async def _dispatch(self, command: Command):
+        command.set_status(SENDING)
+        try:
+            await self.send(command)
+        except asyncio.CancelledError:
+            command.set_status(FAILED, "Dispatcher stopped")
+            raise
+        except Exception as e:
+            command.set_status(FAILED, str(e))
+            logger.warning("[Commands] %s command %s for %s failed: %s", command.kind, command.id, command.device_id, e)
+            return
+        command.set_status(SENT)
+        self.sent_count += 1
+
+
+command_dispatcher = CommandDispatcher()
+register_callback("commands_pending", "Device commands queued but not yet sent.", lambda: command_dispatcher.pending)
+register_callback("commands_sent_total", "Device commands delivered to ThingsBoard.", lambda: command_dispatcher.sent_count, kind="counter")
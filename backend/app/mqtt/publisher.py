@@ -1,41 +1,182 @@
+import asyncio
+import logging
 import os
+import random
+import time
+
 import httpx
+import jwt
 from dotenv import load_dotenv
 
+from app.metrics import THINGSBOARD_REQUEST_SECONDS, instrument_httpx
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 THINGSBOARD_URL = os.getenv("THINGSBOARD_URL", "http://localhost:8080")
 THINGSBOARD_USERNAME = os.getenv("THINGSBOARD_USERNAME")  # Tenant admin email
 THINGSBOARD_PASSWORD = os.getenv("THINGSBOARD_PASSWORD")  # Tenant admin password
 THINGSBOARD_DEVICE_ID = os.getenv("THINGSBOARD_DEVICE_ID")  # ESP32 device ID in ThingsBoard
 
-# Cache the JWT token
-_cached_token: str | None = None
+# Refresh the JWT this many seconds before it expires
+TOKEN_REFRESH_MARGIN = float(os.getenv("THINGSBOARD_TOKEN_REFRESH_MARGIN", "60"))
+RPC_MAX_ATTEMPTS = int(os.getenv("THINGSBOARD_RPC_MAX_ATTEMPTS", "3"))
+RPC_BACKOFF_BASE = 0.2  # seconds, doubled per attempt
+RPC_MAX_CONNECTIONS = int(os.getenv("THINGSBOARD_MAX_CONNECTIONS", "20"))
+
+# Refused before the RPC reached the device: always safe to send again
+NOT_DELIVERED_STATUS = {429}
+# The gateway may have delivered the RPC before failing (a 504 usually means it
+# did and the device was slow to answer): retried only for idempotent RPCs
+RETRYABLE_STATUS = {500, 502, 503, 504}
+# Failures before the request was sent
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _operation(request) -> tuple[str]:
+    # /api/auth/login -> login, /api/plugins/rpc/oneway/<device> -> rpc_oneway
+    parts = request.url.path.strip("/").split("/")
+    if parts[:3] == ["api", "plugins", "rpc"] and len(parts) > 3:
+        return (f"rpc_{parts[3]}",)
+    return (parts[-1],)
+
+
+class ThingsBoardClient:
+    """
+    Long-lived ThingsBoard REST client.
+
+    One pooled httpx.AsyncClient is shared by every call, so connections
+    (and TLS sessions) are reused. The tenant JWT is refreshed shortly
+    before its `exp`; concurrent callers that find it stale share a single
+    login behind a lock instead of each logging in.
+    """
+
+    def __init__(
+        self,
+        base_url: str = THINGSBOARD_URL,
+        username: str | None = THINGSBOARD_USERNAME,
+        password: str | None = THINGSBOARD_PASSWORD,
+        refresh_margin: float = TOKEN_REFRESH_MARGIN,
+        max_attempts: int = RPC_MAX_ATTEMPTS,
+        max_connections: int = RPC_MAX_CONNECTIONS,
+    ):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self.max_attempts = max_attempts
+        self.max_connections = max_connections
+        self.login_count = 0
+        self._client: httpx.AsyncClient | None = None
+        self._token: str | None = None
+        self._token_exp = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=10.0,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            instrument_httpx(self._client, THINGSBOARD_REQUEST_SECONDS, _operation)
+        return self._client
 
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
-async def _get_auth_token() -> str:
-    """Authenticate with ThingsBoard and get a JWT token."""
-    global _cached_token
-    if _cached_token:
-        return _cached_token
+    def _token_is_fresh(self) -> bool:
+        return self._token is not None and time.time() < self._token_exp - self.refresh_margin
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            f"{THINGSBOARD_URL}/api/auth/login",
-            json={
-                "username": THINGSBOARD_USERNAME,
-                "password": THINGSBOARD_PASSWORD,
-            },
+    async def _login(self):
+        resp = await self.client.post(
+            "/api/auth/login",
+            json={"username": self.username, "password": self.password},
         )
         resp.raise_for_status()
-        _cached_token = resp.json()["token"]
-        return _cached_token
+        token = resp.json()["token"]
+        claims = jwt.decode(token, options={"verify_signature": False})
+        # No exp claim: treat as short-lived and re-check in a minute
+        self._token_exp = float(claims.get("exp", time.time() + 60 + self.refresh_margin))
+        self._token = token
+        self.login_count += 1
+        logger.debug("[ThingsBoard] Logged in, token valid until %s", self._token_exp)
+
+    async def get_token(self) -> str:
+        """Return a token that is not about to expire, logging in at most once concurrently."""
+        if self._token_is_fresh():
+            return self._token
+        async with self._lock:
+            if not self._token_is_fresh():
+                await self._login()
+            return self._token
+
+    def invalidate_token(self, token: str):
+        """Drop `token` unless another caller already replaced it."""
+        if self._token == token:
+            self._token = None
+            self._token_exp = 0.0
+
+    async def send_rpc(
+        self, device_id: str, method: str, params: dict, oneway: bool = True, idempotent: bool = True
+    ) -> httpx.Response:
+        """
+        POST an RPC to a device, retrying with exponential backoff. Requests
+        that never reached ThingsBoard (connect errors, 401 before re-login,
+        429) are always retried. Failures after it may have been delivered
+        (5xx, read timeouts) are retried only when `idempotent`: running the
+        RPC twice must be harmless, which is not the case for watering.
+        """
+        kind = "oneway" if oneway else "twoway"
+        payload = {
+            "method": method,
+            "params": params,
+            "timeout": 5000,  # ms to wait for device response
+            "retries": 5,
+        }
+        for attempt in range(1, self.max_attempts + 1):
+            token = await self.get_token()
+            try:
+                resp = await self.client.post(
+                    f"/api/plugins/rpc/{kind}/{device_id}",
+                    json=payload,
+                    headers={"X-Authorization": f"Bearer {token}"},
+                )
+            except NOT_SENT_ERRORS:
+                if attempt == self.max_attempts:
+                    raise
+            except httpx.TransportError:
+                if not idempotent or attempt == self.max_attempts:
+                    raise
+            else:
+                status = resp.status_code
+                retry = status in NOT_DELIVERED_STATUS or (idempotent and status in RETRYABLE_STATUS)
+                if status == 401:
+                    # Token revoked or expired early — re-auth and retry
+                    self.invalidate_token(token)
+                elif not retry or attempt == self.max_attempts:
+                    resp.raise_for_status()
+                    return resp
+            if attempt < self.max_attempts:
+                delay = RPC_BACKOFF_BASE * 2 ** (attempt - 1)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        resp.raise_for_status()
+        return resp
+
+
+thingsboard = ThingsBoardClient()
 
 
 def clear_token_cache():
     """Clear cached token so next call re-authenticates."""
-    global _cached_token
-    _cached_token = None
+    thingsboard.invalidate_token(thingsboard._token)
 
 
 async def send_rpc_command(device_id: str, light_on: bool = False, water_plant: bool = False) -> dict:
@@ -43,38 +184,16 @@ async def send_rpc_command(device_id: str, light_on: bool = False, water_plant:
     if not target_device:
         raise ValueError("No device_id provided and THINGSBOARD_DEVICE_ID not set in .env")
 
-    token = await _get_auth_token()
-    light_on = not light_on  
-    rpc_payload = {
-        "method": "setControl",
-        "params": {
+    light_on = not light_on
+    await thingsboard.send_rpc(
+        target_device,
+        "setControl",
+        {
             "light_on": light_on,
             "water_plant": water_plant,
         },
-        "timeout": 5000,  # ms to wait for device response
-        "retries" : 5
-    }
-
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            f"{THINGSBOARD_URL}/api/plugins/rpc/oneway/{device_id}",
-            json=rpc_payload,
-            headers={"X-Authorization": f"Bearer {token}"},
-            timeout=10.0,
-        )
-
-        # If 401, token expired — re-auth and retry once
-        if resp.status_code == 401:
-            clear_token_cache()
-            token = await _get_auth_token()
-            resp = await client.post(
-                f"{THINGSBOARD_URL}/api/rpc/twoway/{target_device}",
-                json=rpc_payload,
-                headers={"X-Authorization": f"Bearer {token}"},
-                timeout=10.0,
-            )
-
-        resp.raise_for_status()
-        print(f"[ThingsBoard RPC] Sent to {target_device}: light_on={light_on}, water_plant={water_plant}")
-        # twoway RPC returns empty body on success (200)
-        return {"status": "ok", "light_on": light_on, "water_plant": water_plant}
+        # Setting the light is idempotent; a repeated water command waters the plant twice
+        idempotent=not water_plant,
+    )
+    logger.info("[ThingsBoard RPC] Sent to %s: light_on=%s, water_plant=%s", target_device, light_on, water_plant)
+    return {"status": "ok", "light_on": light_on, "water_plant": water_plant}
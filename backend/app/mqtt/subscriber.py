@@ -0,0 +1,327 @@
+"""
+MQTT telemetry subscriber, run as a lifespan task when MQTT_BROKER is set.
+
+ESP32 devices publish readings (one object or an array) straight to the
+broker on MQTT_TOPIC, as JSON on plantpulse/<device>/telemetry or in a
+compact encoding on plantpulse/<device>/telemetry/<msgpack|cbor|packed>
+(see app/telemetry.py). paho-mqtt runs the connection on its own thread,
+reconnecting with exponential backoff; messages are handed to the event
+loop through a bounded buffer and processed in batches: validated,
+scored, bulk-inserted, then published to the cache and SSE subscribers.
+
+QoS 1/2 messages are acknowledged only after their batch is stored, so a
+crash leaves them with the broker for redelivery (persistent session,
+clean_session=False). The broker only redelivers after a reconnect, so an
+unacknowledged message holds a slot of its in-flight window until then:
+rows that failed to insert because the database was unreachable or
+erroring are retried in place with backoff until they go through, and a
+QoS 1/2 delivery arriving at a full buffer blocks the network thread until
+there is room, which pushes back on the broker instead of growing memory.
+Messages that can never be stored are acknowledged rather than retried:
+undecodable or invalid ones, and rows the database refuses (constraint
+violations, bad values), which app.ingest.write_readings splits out of
+the batch and dead-letters. QoS 0 messages are dropped when the buffer is
+full. Only on shutdown are messages left unacknowledged, for the next
+session.
+
+Because acks wait for the insert, the broker's in-flight window for this
+client bounds the batch: keep MQTT_BATCH_SIZE at or below it (mosquitto's
+max_inflight_messages defaults to 20; 0 lifts the limit), otherwise every
+batch waits out MQTT_FLUSH_INTERVAL.
+
+    python -m app.mqtt.subscriber      # run standalone, without the API
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+from dotenv import load_dotenv
+
+from app.ingest import check_version_column, publish_readings, write_readings
+from app.logs import configure_logging
+from app.metrics import register_callback
+from app.ml.inference import inference
+from app.telemetry import TOPIC_ENCODINGS, parse_body
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MQTT_BROKER = os.getenv("MQTT_BROKER")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "plantpulse/+/telemetry/#")
+MQTT_QOS = int(os.getenv("MQTT_QOS", "1"))
+MQTT_USERNAME = os.getenv("MQTT_USERNAME")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "plantpulse-backend")
+MQTT_BUFFER_SIZE = int(os.getenv("MQTT_BUFFER_SIZE", "10000"))
+MQTT_BATCH_SIZE = int(os.getenv("MQTT_BATCH_SIZE", "500"))
+MQTT_FLUSH_INTERVAL = float(os.getenv("MQTT_FLUSH_INTERVAL", "0.2"))  # seconds
+MQTT_RECONNECT_MAX_DELAY = int(os.getenv("MQTT_RECONNECT_MAX_DELAY", "60"))
+# How long a QoS 1/2 delivery may block paho's thread waiting for buffer space
+MQTT_BACKPRESSURE_TIMEOUT = 10.0
+
+
+def topic_encoding(topic: str) -> Optional[str]:
+    """Media type named by the last topic level (…/telemetry/msgpack); JSON otherwise."""
+    return TOPIC_ENCODINGS.get(topic.rsplit("/", 1)[-1])
+
+
+class MqttSubscriber:
+    def __init__(
+        self,
+        broker: Optional[str] = MQTT_BROKER,
+        port: int = MQTT_PORT,
+        topic: str = MQTT_TOPIC,
+        qos: int = MQTT_QOS,
+        client_id: str = MQTT_CLIENT_ID,
+        buffer_size: int = MQTT_BUFFER_SIZE,
+        batch_size: int = MQTT_BATCH_SIZE,
+        flush_interval: float = MQTT_FLUSH_INTERVAL,
+    ):
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.qos = qos
+        self.client_id = client_id
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.received = 0
+        self.stored = 0
+        self.rejected = 0
+        self.dropped = 0  # QoS 0, buffer full
+        self.left_unacked = 0  # QoS 1/2 still waiting for buffer space at shutdown
+        self.errors = 0  # QoS 1/2 that could not be buffered for another reason
+        self.subscribed = threading.Event()
+        self._client: Optional[mqtt.Client] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch: Optional[asyncio.Future] = None
+        self._stopping = threading.Event()
+        self.insert_retries = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    # ── paho thread ─────────────────────────────────────────────
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logger.warning("[MQTT] Connection refused: %s", reason_code)
+            return
+        # Subscribe on every (re)connect; the broker may have dropped the session
+        client.subscribe(self.topic, qos=self.qos)
+        logger.info("[MQTT] Connected to %s:%d, subscribing to %s", self.broker, self.port, self.topic)
+
+    def _on_subscribe(self, client, userdata, mid, reason_codes, properties):
+        if any(code.is_failure for code in reason_codes):
+            logger.error("[MQTT] Subscription to %s refused: %s", self.topic, reason_codes)
+            return
+        self.subscribed.set()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.subscribed.clear()
+        if reason_code != 0:
+            logger.warning("[MQTT] Disconnected (%s), reconnecting", reason_code)
+
+    def _on_message(self, client, userdata, message: mqtt.MQTTMessage):
+        item = (message.topic, message.payload, message.mid, message.qos)
+        self.received += 1
+        if message.qos == 0:
+            self._loop.call_soon_threadsafe(self._offer, item)
+            return
+        # Block this thread until there is room: TCP backpressure instead of unbounded memory.
+        # Giving up would strand the message in the broker's in-flight window until a reconnect.
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        waited = 0.0
+        while True:
+            try:
+                future.result(MQTT_BACKPRESSURE_TIMEOUT)
+                return
+            except TimeoutError:
+                waited += MQTT_BACKPRESSURE_TIMEOUT
+            except Exception as e:
+                self.errors += 1
+                logger.error("[MQTT] Could not buffer message %d, leaving it unacknowledged: %r", message.mid, e)
+                return
+            if self._stopping.is_set():
+                future.cancel()
+                self.left_unacked += 1
+                logger.warning("[MQTT] Shutting down, leaving message %d unacknowledged for redelivery", message.mid)
+                return
+            logger.warning("[MQTT] Buffer still full after %.0fs, holding message %d", waited, message.mid)
+
+    # ── event loop ──────────────────────────────────────────────
+
+    def _offer(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def start(self):
+        if self._task is not None or not self.broker:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+        self._queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._task = asyncio.create_task(self._run())
+
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=self.client_id,
+            clean_session=False,
+            manual_ack=True,
+        )
+        if MQTT_USERNAME:
+            client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        client.reconnect_delay_set(min_delay=1, max_delay=MQTT_RECONNECT_MAX_DELAY)
+        client.on_connect = self._on_connect
+        client.on_subscribe = self._on_subscribe
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        # connect_async + loop_start: the first connection is retried like any reconnect
+        client.connect_async(self.broker, self.port, keepalive=30)
+        client.loop_start()
+        self._client = client
+
+    async def stop(self):
+        """Disconnect, then store and acknowledge whatever is already buffered."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        client, self._client = self._client, None
+        # loop_stop joins paho's thread, which may be blocked on a full buffer; keep the loop free
+        await asyncio.to_thread(client.loop_stop)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._batch is not None:
+            await self._batch
+        while not self._queue.empty():
+            await self._process(self._drain(self.batch_size), client)
+        client.disconnect()
+
+    def _drain(self, limit: int) -> list:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                batch.extend(self._drain(self.batch_size - len(batch)))
+                remaining = deadline - loop.time()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Shielded so a shutdown mid-batch still finishes storing and acking it
+            self._batch = asyncio.ensure_future(self._process(batch, self._client))
+            await asyncio.shield(self._batch)
+            self._batch = None
+
+    async def _sleep(self, seconds: float):
+        """Sleep, waking early when shutdown starts."""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not self._stopping.is_set():
+            await asyncio.sleep(min(0.1, deadline - time.monotonic()))
+
+    async def _process(self, batch: list, client: Optional[mqtt.Client]):
+        rows, acks = [], []
+        for topic, payload, mid, qos in batch:
+            if qos > 0:
+                acks.append((mid, qos))
+            try:
+                valid, rejected, _ = parse_body(payload, topic_encoding(topic), source="mqtt")
+            except ValueError as e:
+                logger.debug("[MQTT] Undecodable message on %s: %s", topic, e)
+                self.rejected += 1
+                continue
+            rows.extend(valid)
+            self.rejected += len(rejected)
+
+        await inference.annotate(rows)
+        written, failed = await write_readings(rows)
+        delay = 1.0
+        while failed:
+            if self._stopping.is_set():
+                logger.error("[MQTT] Insert of %d rows failed on shutdown, leaving %d messages for redelivery",
+                             len(failed), len(acks))
+                publish_readings(written)
+                return
+            # Unacknowledged messages are not redelivered without a reconnect: keep this batch until it is stored
+            self.insert_retries += 1
+            logger.error("[MQTT] Insert of %d rows failed, retrying in %.0fs (%d messages unacknowledged)",
+                         len(failed), delay, len(acks))
+            await self._sleep(delay)
+            delay = min(delay * 2, MQTT_RECONNECT_MAX_DELAY)
+            more, failed = await write_readings(failed)
+            written += more
+        self.stored += len(written)
+        # Invalid messages and rows the database refused are acknowledged too: redelivering them cannot succeed
+        if client is not None:
+            for mid, qos in acks:
+                client.ack(mid, qos)
+        publish_readings(written)
+
+mqtt_subscriber = MqttSubscriber()
+register_callback(
+    "mqtt_messages_total",
+    "MQTT messages delivered by the broker; QoS 0 dropped for lack of buffer space; QoS 1/2 left "
+    "unacknowledged at shutdown or because they could not be buffered.",
+    lambda: {
+        ("received",): mqtt_subscriber.received,
+        ("dropped",): mqtt_subscriber.dropped,
+        ("left_unacked",): mqtt_subscriber.left_unacked,
+        ("error",): mqtt_subscriber.errors,
+    },
+    kind="counter",
+    labels=("outcome",),
+)
+register_callback(
+    "mqtt_insert_retries_total",
+    "MQTT batch inserts retried after transient failures while their messages stay unacknowledged.",
+    lambda: mqtt_subscriber.insert_retries,
+    kind="counter",
+)
+register_callback("mqtt_buffer_depth", "MQTT messages waiting to be stored.", lambda: mqtt_subscriber.depth)
+register_callback("mqtt_subscribed", "1 while subscribed to the broker.", lambda: int(mqtt_subscriber.subscribed.is_set()))
+
+
+async def main():
+    configure_logging()
+    if not MQTT_BROKER:
+        raise SystemExit("Set MQTT_BROKER (and MQTT_PORT / MQTT_TOPIC) in backend/.env")
+    await inference.start()
+    await check_version_column()
+    await mqtt_subscriber.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await mqtt_subscriber.stop()
+        await inference.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from app.metrics import register_callback
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+class SensorBroker:
+    """
+    In-process fan-out of newly ingested sensor readings, keyed by plant.
+
+    Each subscriber gets its own bounded queue. A slow client never blocks
+    ingest: when its queue is full the oldest pending reading is dropped,
+    since only the newest state matters to a live view. Subscriptions are
+    per worker process, like the ingest paths that publish to them.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, plant_id) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[str(plant_id)].add(queue)
+        return queue
+
+    def unsubscribe(self, plant_id, queue: asyncio.Queue):
+        key = str(plant_id)
+        self._subscribers[key].discard(queue)
+        if not self._subscribers[key]:
+            del self._subscribers[key]
+
+    def subscriber_count(self, plant_id=None) -> int:
+        if plant_id is not None:
+            return len(self._subscribers.get(str(plant_id), ()))
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, reading: dict):
+        """Deliver a reading to everyone watching its plant. Never blocks."""
+        queues = self._subscribers.get(str(reading.get("plant_id")))
+        if not queues:
+            return
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(reading)
+
+
+sensor_broker = SensorBroker()
+register_callback("stream_subscribers", "Open live-reading (SSE) subscriptions.", sensor_broker.subscriber_count)
@@ -0,0 +1,171 @@
+"""
+Retention for sensor_readings and its rollups.
+
+Raw readings are compacted into minute/hour/day rollups by app/rollups.py;
+this job deletes what the rollups already cover. Each pass:
+
+  * drops whole monthly partitions past the raw window, when the table is
+    partitioned (migrations/004_partition_sensor_readings.sql)
+  * deletes the remaining raw readings older than RAW_RETENTION_DAYS in
+    batches, never past the rollup watermark and never a plant's newest reading
+  * deletes minute rollups older than ROLLUP_MINUTE_RETENTION_DAYS; hour
+    and day rollups are kept
+  * creates the next months' partitions ahead of time
+
+A window of 0 keeps that data forever, which is the default.
+
+    python -m app.retention run
+
+Schema: migrations/003_retention.sql (and optionally 004)
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from postgrest.exceptions import APIError
+
+from app.database import supabase
+from app.history import to_epoch_seconds
+from app.logs import configure_logging
+from app.metrics import Counter
+from app.rollups import RAW_RETENTION_DAYS, ROLLUP_MINUTE_RETENTION_DAYS, load_state
+
+logger = logging.getLogger(__name__)
+
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+# Rows deleted per statement; smaller batches hold locks for less time
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+
+FUNCTION_NOT_FOUND = "PGRST202"
+
+RETENTION_DELETED_ROWS = Counter("retention_deleted_rows_total", "Rows deleted by the retention job.", ("table",))
+RETENTION_DROPPED_PARTITIONS = Counter("retention_dropped_partitions_total", "Monthly sensor_readings partitions dropped.")
+
+
+def retention_enabled() -> bool:
+    return bool(RAW_RETENTION_DAYS or ROLLUP_MINUTE_RETENTION_DAYS)
+
+
+def raw_cutoff(covered_until: Optional[str], now: datetime) -> Optional[datetime]:
+    """Raw readings before this may go: past the window and already rolled up."""
+    if not RAW_RETENTION_DAYS or covered_until is None:
+        return None
+    covered = datetime.fromtimestamp(to_epoch_seconds([covered_until])[0], tz=timezone.utc)
+    return min(now - timedelta(days=RAW_RETENTION_DAYS), covered)
+
+
+def minute_cutoff(covered_until: Optional[str], now: datetime) -> Optional[datetime]:
+    """Minute rollups before this may go: past the window and already folded into hours."""
+    if not ROLLUP_MINUTE_RETENTION_DAYS or covered_until is None:
+        return None
+    covered = datetime.fromtimestamp(to_epoch_seconds([covered_until])[0], tz=timezone.utc)
+    return min(now - timedelta(days=ROLLUP_MINUTE_RETENTION_DAYS), covered.replace(minute=0, second=0, microsecond=0))
+
+
+async def _call(function: str, params: dict) -> Optional[int]:
+    """Run a maintenance function; None if the migration defining it is not applied."""
+    try:
+        result = await supabase.rpc(function, params).execute()
+    except APIError as e:
+        if e.code == FUNCTION_NOT_FOUND:
+            return None
+        raise
+    return int(result.data or 0)
+
+
+async def _prune(function: str, table: str, params: dict) -> int:
+    """Call a batched delete until a batch comes back short."""
+    total = 0
+    while True:
+        deleted = await _call(function, {**params, "batch_size": RETENTION_BATCH_SIZE})
+        if deleted is None:
+            logger.warning("[Retention] %s() not found; apply migrations/003_retention.sql", function)
+            return total
+        total += deleted
+        RETENTION_DELETED_ROWS.inc(table, amount=deleted)
+        if deleted < RETENTION_BATCH_SIZE:
+            return total
+
+
+async def run_once() -> dict:
+    """One retention pass. Returns what was removed."""
+    last_id, covered_until = await load_state()
+    now = datetime.now(timezone.utc)
+    removed = {"partitions": 0, "readings": 0, "minute_rollups": 0}
+
+    cutoff = raw_cutoff(covered_until, now)
+    if cutoff is not None:
+        dropped = await _call("drop_sensor_partitions", {"cutoff": cutoff.isoformat(), "max_id": last_id})
+        if dropped:
+            removed["partitions"] = dropped
+            RETENTION_DROPPED_PARTITIONS.inc(amount=dropped)
+        removed["readings"] = await _prune(
+            "prune_sensor_readings", "sensor_readings", {"cutoff": cutoff.isoformat(), "max_id": last_id}
+        )
+
+    cutoff = minute_cutoff(covered_until, now)
+    if cutoff is not None:
+        removed["minute_rollups"] = await _prune(
+            "prune_sensor_rollups", "sensor_rollups", {"resolution": "minute", "cutoff": cutoff.isoformat()}
+        )
+
+    created = await _call("ensure_sensor_partitions", {})
+    if created:
+        logger.info("[Retention] Created %d sensor_readings partitions", created)
+    logger.info(
+        "[Retention] Dropped %d partitions, deleted %d readings and %d minute rollups",
+        removed["partitions"], removed["readings"], removed["minute_rollups"],
+    )
+    return removed
+
+
+class RetentionWorker:
+    """Lifespan background task running `run_once` every `interval` seconds."""
+
+    def __init__(self, interval: float = RETENTION_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            try:
+                await run_once()
+            except Exception as e:
+                logger.warning("[Retention] Pass failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if retention_enabled() and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+retention_worker = RetentionWorker()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune sensor_readings and minute rollups past their retention window")
+    parser.add_argument("command", choices=["run"])
+    parser.parse_args()
+    configure_logging()
+    if not retention_enabled():
+        print("[Retention] RAW_RETENTION_DAYS and ROLLUP_MINUTE_RETENTION_DAYS are 0: nothing to prune")
+        return
+    removed = asyncio.run(run_once())
+    print(f"[Retention] run: {removed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+Continuous minute/hour/day rollups of sensor_readings.
+
+A background task follows sensor_readings by `id` (the watermark in
+rollup_state), so late rows with old timestamps are still picked up. For
+every plant touched by new rows it recomputes the affected minute buckets
+from raw readings, then the affected hour buckets from minutes and day
+buckets from hours, and upserts them into sensor_rollups. Buckets are
+always recomputed from their source rather than incremented, which makes
+a run idempotent: re-running over the same rows writes the same values.
+
+An id is assigned at insert but becomes visible at commit, so a concurrent
+batch can commit lower ids after the watermark has passed them. Ids the
+watermark skipped are kept in rollup_state.pending and looked up again on
+every pass for ROLLUP_LAG_SECONDS; after that they are taken to be rolled
+back inserts. Retention only prunes below the oldest pending id.
+
+    python -m app.rollups backfill          # rebuild all rollups
+    python -m app.rollups run               # one incremental pass
+
+Schema: migrations/001_sensor_rollups.sql, 008_rollup_pending.sql
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from postgrest.exceptions import APIError
+
+from app.database import supabase
+from app.logs import configure_logging
+from app.history import (
+    HISTORY_PAGE_SIZE,
+    METRIC_COLUMNS,
+    aggregate_buckets,
+    bucket_start_iso,
+    fetch_range,
+    reduce_groups,
+    summarize,
+    to_epoch_seconds,
+    to_iso,
+    value_partials,
+)
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_ENABLED = os.getenv("ROLLUP_ENABLED", "true").lower() == "true"
+ROLLUP_INTERVAL_SECONDS = float(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+# New raw rows consumed per pass
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "20000"))
+# How long ids skipped by the watermark are waited for before they count as rolled back
+ROLLUP_LAG_SECONDS = float(os.getenv("ROLLUP_LAG_SECONDS", "300"))
+# How long app/retention.py keeps raw readings and minute rollups (0 = forever).
+# Buckets older than their source's window are never rebuilt from what is left of it.
+RAW_RETENTION_DAYS = float(os.getenv("RAW_RETENTION_DAYS", "0"))
+ROLLUP_MINUTE_RETENTION_DAYS = float(os.getenv("ROLLUP_MINUTE_RETENTION_DAYS", "0"))
+
+# Finest first; each level is built from the one before it
+RESOLUTIONS = [("minute", 60), ("hour", 3600), ("day", 86400)]
+ROWS_METRIC = "rows"  # per-bucket reading count, independent of which metrics were present
+ROLLUP_TABLE = "sensor_rollups"
+STATE_TABLE = "rollup_state"
+STATE_NAME = "sensor_readings"
+CONFLICT_COLUMNS = "plant_id,resolution,bucket_start,metric"
+UNKNOWN_COLUMN = "PGRST204"
+
+
+def _floor(epoch: float, seconds: int) -> int:
+    return int(epoch // seconds) * seconds
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def rebuild_floor(seconds: int, retention_days: float) -> float:
+    """Earliest bucket start whose source rows are still complete under `retention_days`."""
+    if not retention_days:
+        return float("-inf")
+    return -(-(time.time() - retention_days * 86400) // seconds) * seconds
+
+
+# ── Watermark ────────────────────────────────────────────────
+
+
+def missing_ranges(ids: list[int], first: int, last: int) -> list[list[int]]:
+    """[lo, hi] runs of ids in [first, last] absent from the sorted `ids`."""
+    ranges, expected = [], first
+    for row_id in ids:
+        if row_id > expected:
+            ranges.append([expected, row_id - 1])
+        expected = max(expected, row_id + 1)
+    if expected <= last:
+        ranges.append([expected, last])
+    return ranges
+
+
+async def _load_row() -> dict:
+    result = await supabase.table(STATE_TABLE).select("*").eq("name", STATE_NAME).limit(1).execute()
+    return result.data[0] if result.data else {}
+
+
+def _settled(row: dict) -> int:
+    """Highest id below which every committed row is rolled up: the watermark, or just under the oldest gap."""
+    last_id = int(row.get("last_id") or 0)
+    return min([last_id, *(lo - 1 for lo, _, _ in row.get("pending") or [])])
+
+
+async def load_state() -> tuple[int, Optional[str]]:
+    """(highest sensor_readings.id rolled up with everything below it, newest processed timestamp floored to the minute)."""
+    row = await _load_row()
+    return _settled(row), row.get("covered_until")
+
+
+async def save_state(last_id: int, covered_until: Optional[str], pending: Optional[list] = None):
+    state = {"name": STATE_NAME, "last_id": last_id, "covered_until": covered_until, "pending": pending or []}
+    try:
+        await supabase.table(STATE_TABLE).upsert(state, on_conflict="name").execute()
+    except APIError as e:
+        if e.code != UNKNOWN_COLUMN:
+            raise
+        logger.warning("[Rollups] rollup_state.pending missing, apply migrations/008_rollup_pending.sql")
+        del state["pending"]
+        await supabase.table(STATE_TABLE).upsert(state, on_conflict="name").execute()
+
+
+# ── Aggregation ──────────────────────────────────────────────
+
+
+def _rollup_rows(plant_id, resolution: str, seconds: int, metric: str, keys, counts, sums, mins, maxs, last, last_at):
+    return [
+        {
+            "plant_id": plant_id,
+            "resolution": resolution,
+            "bucket_start": bucket_start_iso(key, seconds),
+            "metric": metric,
+            "count": int(n),
+            "min": float(lo) if metric != ROWS_METRIC else None,
+            "max": float(hi) if metric != ROWS_METRIC else None,
+            "sum": float(total) if metric != ROWS_METRIC else None,
+            "last": float(lv) if metric != ROWS_METRIC else None,
+            "last_at": _iso(la) if metric != ROWS_METRIC else None,
+        }
+        for key, n, total, lo, hi, lv, la in zip(keys, counts, sums, mins, maxs, last, last_at)
+        if n
+    ]
+
+
+def _last_per_group(keys: np.ndarray, at: np.ndarray, values: np.ndarray):
+    """Value with the greatest `at` in each key group (keys must be the same set reduce_groups returns)."""
+    order = np.lexsort((at, keys))
+    is_last = np.r_[keys[order][1:] != keys[order][:-1], True]
+    return values[order][is_last], at[order][is_last]
+
+
+def minute_rollups(plant_id, rows: list[dict]) -> list[dict]:
+    """Minute buckets for one plant from raw readings."""
+    if not rows:
+        return []
+    epoch = to_epoch_seconds([row["timestamp"] for row in rows])
+    keys = np.floor(epoch / 60).astype(np.int64)
+    unique_keys, row_counts = np.unique(keys, return_counts=True)
+    zeros = np.zeros(len(unique_keys))
+    out = _rollup_rows(plant_id, "minute", 60, ROWS_METRIC, unique_keys, row_counts, zeros, zeros, zeros, zeros, zeros)
+    for metric in METRIC_COLUMNS:
+        values = np.array([row.get(metric) for row in rows], dtype=np.float64)
+        present = ~np.isnan(values)
+        if not present.any():
+            continue
+        grouped = reduce_groups(keys[present], *value_partials(values[present]))
+        last, last_at = _last_per_group(keys[present], epoch[present], values[present])
+        out += _rollup_rows(plant_id, "minute", 60, metric, *grouped, last, last_at)
+    return out
+
+
+def coarsen_rollups(plant_id, finer: list[dict], resolution: str, seconds: int) -> list[dict]:
+    """Hour buckets from minute rollups, or day buckets from hour rollups."""
+    out = []
+    for metric in [ROWS_METRIC, *METRIC_COLUMNS]:
+        rows = [r for r in finer if r["metric"] == metric]
+        if not rows:
+            continue
+        starts = to_epoch_seconds([r["bucket_start"] for r in rows])
+        keys = np.floor(starts / seconds).astype(np.int64)
+        counts = np.array([r["count"] for r in rows], dtype=np.float64)
+        if metric == ROWS_METRIC:
+            unique_keys, total = reduce_groups(keys, counts, counts, counts, counts)[:2]
+            zeros = np.zeros(len(unique_keys))
+            out += _rollup_rows(plant_id, resolution, seconds, metric, unique_keys, total, zeros, zeros, zeros, zeros, zeros)
+            continue
+        column = lambda name: np.array([r[name] for r in rows], dtype=np.float64)  # noqa: E731
+        grouped = reduce_groups(keys, counts, column("sum"), column("min"), column("max"))
+        last, last_at = _last_per_group(keys, to_epoch_seconds([r["last_at"] for r in rows]), column("last"))
+        out += _rollup_rows(plant_id, resolution, seconds, metric, *grouped, last, last_at)
+    return out
+
+
+# ── Storage ──────────────────────────────────────────────────
+
+
+async def fetch_rollups(plant_id, resolution: str, start: str, end: str, metrics: Optional[list[str]] = None) -> list[dict]:
+    rows, offset = [], 0
+    while True:
+        query = (
+            supabase.table(ROLLUP_TABLE)
+            .select("*")
+            .eq("plant_id", plant_id)
+            .eq("resolution", resolution)
+            .gte("bucket_start", start)
+            .lt("bucket_start", end)
+        )
+        if metrics:
+            query = query.in_("metric", metrics)
+        result = await (
+            query.order("bucket_start").order("metric").range(offset, offset + HISTORY_PAGE_SIZE - 1).execute()
+        )
+        rows.extend(result.data)
+        if len(result.data) < HISTORY_PAGE_SIZE:
+            return rows
+        offset += HISTORY_PAGE_SIZE
+
+
+async def _upsert(rows: list[dict]):
+    for i in range(0, len(rows), HISTORY_PAGE_SIZE):
+        await supabase.table(ROLLUP_TABLE).upsert(rows[i : i + HISTORY_PAGE_SIZE], on_conflict=CONFLICT_COLUMNS).execute()
+
+
+async def _fetch_new_rows(last_id: int) -> list[dict]:
+    rows = []
+    while len(rows) < ROLLUP_BATCH_SIZE:
+        result = await (
+            supabase.table("sensor_readings")
+            .select("id,plant_id,timestamp")
+            .gt("id", rows[-1]["id"] if rows else last_id)
+            .order("id")
+            .limit(HISTORY_PAGE_SIZE)
+            .execute()
+        )
+        rows.extend(result.data)
+        if len(result.data) < HISTORY_PAGE_SIZE:
+            break
+    return rows
+
+
+async def _fetch_id_range(lo: int, hi: int) -> list[dict]:
+    rows = []
+    while True:
+        result = await (
+            supabase.table("sensor_readings")
+            .select("id,plant_id,timestamp")
+            .gte("id", rows[-1]["id"] + 1 if rows else lo)
+            .lte("id", hi)
+            .order("id")
+            .limit(HISTORY_PAGE_SIZE)
+            .execute()
+        )
+        rows.extend(result.data)
+        if len(result.data) < HISTORY_PAGE_SIZE:
+            return rows
+
+
+async def rollup_plant(plant_id, first: float, last: float):
+    """
+    Recompute every bucket of every resolution that overlaps [first, last]
+    for one plant. Buckets whose source may already be pruned are left as
+    they are, so readings arriving later than the raw window are not counted.
+    """
+    start = max(_floor(first, 60), rebuild_floor(60, RAW_RETENTION_DAYS))
+    end = _floor(last, 60) + 60
+    if start < end:
+        raw = await fetch_range(str(plant_id), METRIC_COLUMNS, _iso(start), _iso(end))
+        await _upsert(minute_rollups(plant_id, raw))
+    source_retention = {"minute": ROLLUP_MINUTE_RETENTION_DAYS}
+    for (finer, _), (resolution, seconds) in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+        start = max(_floor(first, seconds), rebuild_floor(seconds, source_retention.get(finer, 0)))
+        end = _floor(last, seconds) + seconds
+        if start < end:
+            source = await fetch_rollups(plant_id, finer, _iso(start), _iso(end))
+            await _upsert(coarsen_rollups(plant_id, source, resolution, seconds))
+
+
+async def run_once() -> int:
+    """
+    Roll up readings inserted since the watermark, and those committed late
+    below it. Returns the number of new rows consumed.
+    """
+    state = await _load_row()
+    last_id, covered_until = int(state.get("last_id") or 0), state.get("covered_until")
+    pending = state.get("pending") or []
+    now = time.time()
+
+    late, still_pending = [], []
+    for lo, hi, seen in pending:
+        found = await _fetch_id_range(lo, hi)
+        late += found
+        if now - seen < ROLLUP_LAG_SECONDS:
+            still_pending += [[a, b, seen] for a, b in missing_ranges([row["id"] for row in found], lo, hi)]
+
+    new_rows = await _fetch_new_rows(last_id)
+    if new_rows and last_id:
+        gaps = missing_ranges([row["id"] for row in new_rows], last_id + 1, new_rows[-1]["id"])
+        still_pending += [[a, b, now] for a, b in gaps]
+    if not new_rows and not late:
+        if still_pending != pending:
+            await save_state(last_id, covered_until, still_pending)
+        return 0
+
+    rows = late + new_rows
+    epoch = to_epoch_seconds([row["timestamp"] for row in rows])
+    plant_ids = np.array([row["plant_id"] for row in rows])
+    for plant_id in np.unique(plant_ids):
+        mask = plant_ids == plant_id
+        await rollup_plant(plant_id.item(), float(epoch[mask].min()), float(epoch[mask].max()))
+
+    newest = _iso(_floor(float(epoch.max()), 60))
+    if covered_until is not None and to_epoch_seconds([covered_until])[0] > to_epoch_seconds([newest])[0]:
+        newest = covered_until
+    await save_state(new_rows[-1]["id"] if new_rows else last_id, newest, still_pending)
+    if late:
+        logger.info("[Rollups] Rolled up %d readings committed after the watermark passed them", len(late))
+    if new_rows:
+        logger.debug("[Rollups] Consumed %d readings up to id %s", len(new_rows), new_rows[-1]["id"])
+    return len(new_rows)
+
+
+async def run_until_caught_up() -> int:
+    total = 0
+    while processed := await run_once():
+        total += processed
+    return total
+
+
+async def backfill() -> int:
+    """Rebuild all rollups from raw data (safe to run at any time)."""
+    await save_state(0, None)
+    return await run_until_caught_up()
+
+
+class RollupWorker:
+    """Lifespan background task running `run_once` every `interval` seconds."""
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            try:
+                await run_until_caught_up()
+            except Exception as e:
+                logger.warning("[Rollups] Pass failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if ROLLUP_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+rollup_worker = RollupWorker()
+
+
+# ── History queries ──────────────────────────────────────────
+
+
+def pick_resolution(bucket_seconds: int) -> Optional[tuple[str, int]]:
+    """Coarsest rollup whose buckets tile the requested bucket exactly."""
+    for resolution, seconds in reversed(RESOLUTIONS):
+        if bucket_seconds % seconds == 0:
+            return resolution, seconds
+    return None
+
+
+def _raw_partials(rows: list[dict], metrics: list[str], bucket_seconds: int) -> dict:
+    if not rows:
+        return {}
+    keys = np.floor(to_epoch_seconds([r["timestamp"] for r in rows]) / bucket_seconds).astype(np.int64)
+    ones = np.ones(len(rows))
+    partials = {ROWS_METRIC: (keys, ones, ones, ones, ones)}
+    for metric in metrics:
+        values = np.array([r.get(metric) for r in rows], dtype=np.float64)
+        partials[metric] = (keys, *value_partials(values))
+    return partials
+
+
+def _rollup_partials(rows: list[dict], bucket_seconds: int) -> dict:
+    partials = {}
+    for metric in {r["metric"] for r in rows}:
+        subset = [r for r in rows if r["metric"] == metric]
+        keys = np.floor(to_epoch_seconds([r["bucket_start"] for r in subset]) / bucket_seconds).astype(np.int64)
+        counts = np.array([r["count"] for r in subset], dtype=np.float64)
+        if metric == ROWS_METRIC:
+            partials[metric] = (keys, counts, counts, counts, counts)
+            continue
+        column = lambda name: np.array([r[name] for r in subset], dtype=np.float64)  # noqa: E731
+        partials[metric] = (keys, counts, column("sum"), column("min"), column("max"))
+    return partials
+
+
+async def bucketed_history(plant_id: str, metrics: list[str], start: datetime, end: datetime, bucket_seconds: int) -> list[dict]:
+    """
+    Same result as aggregating raw rows, but served from the coarsest
+    rollup that fits `bucket_seconds`. Raw readings fill the unaligned
+    edges of the range and anything newer than the rollup watermark.
+    """
+    picked = pick_resolution(bucket_seconds)
+    if picked is None:
+        rows = await fetch_range(plant_id, metrics, to_iso(start), to_iso(end))
+        return aggregate_buckets(rows, metrics, bucket_seconds)
+    resolution, seconds = picked
+
+    _, covered_until = await load_state()
+    start_s, end_s = start.timestamp(), end.timestamp()
+    head_end = min(-(-start_s // seconds) * seconds, end_s)  # start rounded up to the rollup grid
+    covered = to_epoch_seconds([covered_until])[0] if covered_until else 0.0
+    tail_start = max(head_end, min(_floor(end_s, seconds), _floor(covered, seconds)))
+
+    sources = []
+    if head_end > start_s:
+        sources.append(_raw_partials(await fetch_range(plant_id, metrics, _iso(start_s), _iso(head_end)), metrics, bucket_seconds))
+    if tail_start > head_end:
+        rollups = await fetch_rollups(plant_id, resolution, _iso(head_end), _iso(tail_start), [ROWS_METRIC, *metrics])
+        sources.append(_rollup_partials(rollups, bucket_seconds))
+    if end_s > tail_start:
+        sources.append(_raw_partials(await fetch_range(plant_id, metrics, _iso(tail_start), _iso(end_s)), metrics, bucket_seconds))
+
+    combined = {}
+    for metric in [ROWS_METRIC, *metrics]:
+        parts = [source[metric] for source in sources if metric in source]
+        if parts:
+            combined[metric] = reduce_groups(*(np.concatenate(arrays) for arrays in zip(*parts)))
+    if ROWS_METRIC not in combined:
+        return []
+
+    keys, row_counts = combined[ROWS_METRIC][:2]
+    result = [
+        {"start": bucket_start_iso(key, bucket_seconds), "count": int(count)}
+        for key, count in zip(keys, row_counts)
+    ]
+    for metric in metrics:
+        if metric not in combined:
+            for bucket in result:
+                bucket[metric] = None
+            continue
+        metric_keys, *partials = combined[metric]
+        stats = dict(zip(metric_keys.tolist(), summarize(*partials)))
+        for key, bucket in zip(keys.tolist(), result):
+            bucket[metric] = stats.get(key)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain sensor_readings rollups")
+    parser.add_argument("command", choices=["run", "backfill"])
+    args = parser.parse_args()
+    configure_logging()
+    processed = asyncio.run(backfill() if args.command == "backfill" else run_until_caught_up())
+    print(f"[Rollups] {args.command}: consumed {processed} readings")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,101 +1,204 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import JSONResponse
+from app.auth import get_current_user, owned_plant
+from app.cache import LIGHT, conditional_response, latest_cache
 from app.database import supabase
-from app.models import LightToggle
-from app.mqtt.publisher import send_rpc_command
-from typing import Optional
+from app.devices import group_by_device, plant_device, select_plants
+from app.models import BulkLightToggle, BulkTarget, LightToggle
+from app.mqtt.commands import LIGHT_COMMAND, WATER_COMMAND, CommandRateLimited, command_dispatcher
+from app.writes import upsert_light_status, upsert_light_statuses
 from datetime import datetime, timezone
+from typing import Optional
 import os
 
 router = APIRouter(prefix="/controls", tags=["controls"])
 
-# ThingsBoard device ID for the ESP32 (from .env)
-DEVICE_ID = os.getenv("THINGSBOARD_DEVICE_ID")
+# How long a bulk control waits for its RPCs before answering with what is still in flight
+BULK_COMMAND_TIMEOUT = float(os.getenv("BULK_COMMAND_TIMEOUT_SECONDS", "10"))
+
+
+async def fetch_light_status(plant_id: str) -> dict:
+    result = await (
+        supabase.table("light_status")
+        .select("*")
+        .eq("plant_id", plant_id)
+        .order("updated_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return result.data[0] if result.data else {"is_on": False}
+
 
+async def fetch_light_statuses(plant_ids: list[str]) -> dict:
+    """Newest light_status row per plant, in a single query."""
+    result = await (
+        supabase.table("light_status")
+        .select("*")
+        .in_("plant_id", plant_ids)
+        .order("updated_at", desc=True)
+        .execute()
+    )
+    statuses = {}
+    for row in result.data:
+        statuses.setdefault(str(row["plant_id"]), row)
+    return statuses
 
-@router.get("/light/{plant_id}")
-async def get_light_status(plant_id: str, authorization: Optional[str] = Header(None)):
-    """Get current light status for a plant"""
+
+@router.get("/light/{plant_id}", dependencies=[Depends(owned_plant)])
+async def get_light_status(plant_id: str, if_none_match: Optional[str] = Header(None)):
+    """Get current light status for a plant (cached, ETag/304 aware)"""
     try:
-        result = (
-            supabase.table("light_status")
-            .select("*")
-            .eq("plant_id", plant_id)
-            .order("updated_at", desc=True)
-            .limit(1)
-            .execute()
-        )
-        if not result.data:
-            return {"is_on": False}
-        return result.data[0]
+        entry = await latest_cache.get(LIGHT, plant_id, lambda: fetch_light_status(plant_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return conditional_response(entry, if_none_match)
+
+
+def _too_many_requests(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Watering was triggered recently, retry later"},
+        headers={"Retry-After": str(max(1, round(retry_after)))},
+    )
 
 
 @router.post("/light/{plant_id}")
-async def toggle_light(plant_id: str, payload: LightToggle, authorization: Optional[str] = Header(None)):
+async def toggle_light(plant_id: str, payload: LightToggle, user_id: str = Depends(owned_plant)):
     """
     Toggle light on/off for a plant.
     Saves state to DB and sends RPC command to ESP32 via ThingsBoard.
     """
     try:
-        # Update or insert light status
-        existing = (
-            supabase.table("light_status")
-            .select("id")
-            .eq("plant_id", plant_id)
-            .execute()
+        # Upsert on plant_id: one round trip, no race between concurrent toggles
+        light = await upsert_light_status(plant_id, payload.is_on)
+        latest_cache.put(LIGHT, plant_id, light)
+
+        # RPC to the ESP32 is sent in the background; a quick re-toggle replaces it
+        device_id = await plant_device(plant_id)
+        command = command_dispatcher.submit(
+            device_id, LIGHT_COMMAND, {"light_on": payload.is_on, "water_plant": False}, user_id=user_id
         )
 
-        if existing.data:
-            result = (
-                supabase.table("light_status")
-                .update({"is_on": payload.is_on, "updated_at": datetime.now(timezone.utc).isoformat()})
-                .eq("plant_id", plant_id)
-                .execute()
-            )
-        else:
-            result = (
-                supabase.table("light_status")
-                .insert({"plant_id": plant_id, "is_on": payload.is_on})
-                .execute()
-            )
-
-        # Send RPC command to ESP32 via ThingsBoard
-        try:
-            await send_rpc_command(
-                device_id=DEVICE_ID,
-                light_on=payload.is_on,
-                water_plant=False,
-            )
-        except Exception as rpc_err:
-            print(f"[Controls] RPC failed (light): {rpc_err}")
-            # Don't fail the request — DB state is already updated
-
-        return {"plant_id": plant_id, "is_on": payload.is_on, "message": "Light updated"}
+        return {
+            "plant_id": plant_id,
+            "is_on": payload.is_on,
+            "message": "Light updated",
+            "command_id": command.id,
+            "command_status": command.status,
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/water/{plant_id}")
-async def trigger_water(plant_id: str, authorization: Optional[str] = Header(None)):
+async def trigger_water(plant_id: str, user_id: str = Depends(owned_plant)):
     """
     Trigger manual watering for a plant.
     Updates last_watered timestamp and sends RPC command to ESP32 via ThingsBoard.
     """
     try:
+        device_id = await plant_device(plant_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    retry_after = command_dispatcher.water_retry_after(device_id, [plant_id])
+    if retry_after > 0:
+        return _too_many_requests(retry_after)
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        await supabase.table("plants").update({"last_watered": now}).eq("id", plant_id).execute()
+
+        # RPC to the ESP32 is sent in the background
+        command = command_dispatcher.submit(
+            device_id,
+            WATER_COMMAND,
+            {"light_on": False, "water_plant": True},
+            user_id=user_id,
+            plant_ids=[plant_id],
+        )
+        return {
+            "plant_id": plant_id,
+            "last_watered": now,
+            "message": "Watering triggered",
+            "command_id": command.id,
+            "command_status": command.status,
+        }
+    except CommandRateLimited as e:
+        return _too_many_requests(e.retry_after)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def fan_out(devices: dict, kind: str, params: dict, user_id: str) -> dict:
+    """
+    Send one command to each device at once and wait for the results.
+    The dispatcher's workers bound how many RPCs are in flight.
+    """
+    submitted = command_dispatcher.submit_many(devices, kind, params, user_id=user_id)
+    commands = [c for c in submitted.values() if not isinstance(c, CommandRateLimited)]
+    await command_dispatcher.wait(commands, BULK_COMMAND_TIMEOUT)
+    results = []
+    for device_id, plant_ids in devices.items():
+        command = submitted[device_id]
+        if isinstance(command, CommandRateLimited):
+            result = {"status": "rate_limited", "retry_after": round(command.retry_after, 1)}
+        else:
+            result = {"command_id": command.id, "status": command.status, "error": command.error}
+        results.append({"device_id": device_id, "plant_ids": plant_ids, **result})
+    statuses = [r["status"] for r in results]
+    return {
+        "devices": results,
+        "sent": statuses.count("sent"),
+        "failed": len(statuses) - statuses.count("sent"),
+    }
+
+
+@router.post("/bulk/light")
+async def bulk_toggle_light(payload: BulkLightToggle, user_id: str = Depends(get_current_user)):
+    """
+    Switch the lights of many plants at once, e.g. everything in a zone, or
+    every plant with no zone and no plant_ids given ("lights off everywhere").
+    One RPC goes to each device, in parallel; the response has the outcome per device.
+    """
+    try:
+        plants = await select_plants(user_id, payload.zone, payload.plant_ids)
+        if plants:
+            for light in await upsert_light_statuses([p["id"] for p in plants], payload.is_on):
+                latest_cache.put(LIGHT, light["plant_id"], light)
+        params = {"light_on": payload.is_on, "water_plant": False}
+        result = await fan_out(group_by_device(plants), LIGHT_COMMAND, params, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"is_on": payload.is_on, "plants": len(plants), **result}
+
+
+@router.post("/bulk/water")
+async def bulk_trigger_water(payload: BulkTarget, user_id: str = Depends(get_current_user)):
+    """
+    Water many plants at once, e.g. every plant in a zone. A device with a
+    plant watered within WATER_MIN_INTERVAL_SECONDS is skipped and reported
+    as rate_limited.
+    """
+    try:
+        plants = await select_plants(user_id, payload.zone, payload.plant_ids)
+        devices = group_by_device(plants)
+        result = await fan_out(devices, WATER_COMMAND, {"light_on": False, "water_plant": True}, user_id)
+        watered = [
+            plant_id for device in result["devices"] if device["status"] != "rate_limited"
+            for plant_id in device["plant_ids"]
+        ]
         now = datetime.now(timezone.utc).isoformat()
-        supabase.table("plants").update({"last_watered": now}).eq("id", plant_id).execute()
-
-        # Send RPC command to ESP32 via ThingsBoard
-        try:
-            await send_rpc_command(
-                device_id=DEVICE_ID,
-                light_on=False,
-                water_plant=True,
-            )
-        except Exception as rpc_err:
-            print(f"[Controls] RPC failed (water): {rpc_err}")
-
-        return {"plant_id": plant_id, "last_watered": now, "message": "Watering triggered"}
+        if watered:
+            await supabase.table("plants").update({"last_watered": now}).in_("id", watered).execute()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"last_watered": now if watered else None, "plants": len(plants), **result}
+
+
+@router.get("/commands/{command_id}")
+async def get_command_status(command_id: str, user_id: str = Depends(get_current_user)):
+    """Delivery status of a light/water command: queued, sending, sent, failed or superseded."""
+    command = command_dispatcher.get(command_id)
+    # Someone else's command is reported like an unknown one
+    if command is None or command.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Command not found")
+    return command.to_dict()
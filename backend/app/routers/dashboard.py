@@ -0,0 +1,48 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends
+from app.auth import get_current_user
+from app.cache import LIGHT, READING, latest_cache
+from app.database import supabase
+from app.ml.streaming import plant_analytics
+from app.routers.controls import fetch_light_statuses
+from app.routers.sensor_data import fetch_latest_readings
+
+router = APIRouter(tags=["dashboard"])
+
+NO_LIGHT_STATUS = {"is_on": False}
+
+
+async def latest_state(plant_ids: list[str]) -> tuple[dict, dict]:
+    """Latest reading and light status per plant; cache first, misses loaded in bulk."""
+    return await asyncio.gather(
+        latest_cache.get_many(READING, plant_ids, fetch_latest_readings),
+        latest_cache.get_many(LIGHT, plant_ids, fetch_light_statuses, default=NO_LIGHT_STATUS),
+    )
+
+
+@router.get("/dashboard")
+async def get_dashboard(user_id: str = Depends(get_current_user)):
+    """
+    Everything the dashboard shows in one call: the user's plants, each
+    with its latest reading and light state. Replaces GET /plants/ plus a
+    sensor-data and a light request per plant.
+    """
+    try:
+        result = await supabase.table("plants").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+        plant_ids = [str(plant["id"]) for plant in result.data]
+        readings, lights = await latest_state(plant_ids) if plant_ids else ({}, {})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    plants = []
+    for plant in result.data:
+        reading = readings.get(str(plant["id"]))
+        light = lights.get(str(plant["id"])) or NO_LIGHT_STATUS
+        plants.append({
+            **plant,
+            "latest_reading": reading,
+            "latest_health": reading.get("health_status") if reading else None,
+            "light_on": light.get("is_on", False),
+            "analytics": plant_analytics.snapshot(plant["id"]),
+        })
+    return {"plants": plants}
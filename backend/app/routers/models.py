@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Depends
+from app.auth import get_current_user, require_admin
+from app.ml.inference import inference
+from app.ml.registry import MetadataError
+from app.ml.runtime import ModelRuntimeUnavailable
+
+router = APIRouter(prefix="/models", tags=["models"])
+
+
+@router.get("/", dependencies=[Depends(get_current_user)])
+async def get_models():
+    """Model version currently scoring readings, with its features, labels and runtime."""
+    if not inference.available:
+        raise HTTPException(status_code=503, detail="Inference models are not loaded")
+    return inference.current.describe()
+
+
+@router.post("/reload", dependencies=[Depends(require_admin)])
+async def reload_models(force: bool = False):
+    """
+    Load ML_MODEL_DIR again and swap the new version in without a restart.
+    Unchanged files are skipped unless `force`. If the new files fail to
+    load, the current version keeps serving and the error is returned.
+    The swap affects every user, so this needs the X-Admin-Key header
+    instead of a user login.
+    """
+    if not inference.available:
+        raise HTTPException(status_code=503, detail="Inference models are not loaded")
+    try:
+        changed = await inference.reload(force=force)
+    except (MetadataError, ModelRuntimeUnavailable) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"version": inference.version, "changed": changed}
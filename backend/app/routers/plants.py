@@ -1,85 +1,116 @@
-from fastapi import APIRouter, HTTPException, Header
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends
+from app.auth import get_current_user, owned_plant
+from app.cache import DEVICE, LIGHT, OWNER, READING, latest_cache
 from app.database import supabase
-from app.models import PlantCreate
-from typing import Optional
+from app.ml.nutrients import nutrient_rules
+from app.ml.streaming import plant_analytics
+from app.devices import ROUTE_COLUMNS, route
+from app.models import PlantCreate, PlantDevice
+from app.routers.dashboard import latest_state
+from app.writes import create_plant_with_defaults
 import json
 
 router = APIRouter(prefix="/plants", tags=["plants"])
 
 
-def get_user_id(authorization: str) -> str:
-    """Extract user from JWT token via Supabase"""
-    try:
-        token = authorization.replace("Bearer ", "")
-        user = supabase.auth.get_user(token)
-        return user.user.id
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-
-
 @router.get("/")
-async def get_plants(authorization: Optional[str] = Header(None)):
-    user_id = get_user_id(authorization)
+async def get_plants(user_id: str = Depends(get_current_user)):
     try:
-        result = supabase.table("plants").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+        result = await supabase.table("plants").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
         return result.data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/")
-async def create_plant(plant: PlantCreate, authorization: Optional[str] = Header(None)):
-    user_id = get_user_id(authorization)
+async def create_plant(plant: PlantCreate, user_id: str = Depends(get_current_user)):
     try:
-        data = {
+        # Plant, placeholder reading and light status are created in one transaction
+        created = await create_plant_with_defaults({
             "user_id": user_id,
             "name": plant.name,
             "variety": plant.variety,
             "plant_type": plant.plant_type,
             "image_url": plant.image_url,
-        }
-        result = supabase.table("plants").insert(data).execute()
-
-        # Insert dummy sensor reading so detail page works immediately
-        plant_id = result.data[0]["id"]
-        dummy_reading = {
-            "plant_id": plant_id,
-            "soil_moisture": 42.5,
-            "temperature": 27.3,
-            "humidity": 65.0,
-            "light_intensity": 850.0,
-            "nitrogen": 75.0,
-            "phosphorus": 22.0,
-            "potassium": 110.0,
-            "watering_needed": True,
-            "health_status": "Moderate Stress",
-            "light_on": False,
-        }
-        supabase.table("sensor_readings").insert(dummy_reading).execute()
-
-        # Insert default light status
-        supabase.table("light_status").insert({"plant_id": plant_id, "is_on": False}).execute()
-
-        return result.data[0]
+            "device_id": plant.device_id,
+            "zone": plant.zone,
+        })
+        plant_id = created["plant"]["id"]
+        latest_cache.put(READING, plant_id, nutrient_rules.annotate([created["reading"]])[0])
+        latest_cache.put(LIGHT, plant_id, created["light"])
+        latest_cache.put(DEVICE, plant_id, route(created["plant"]))
+        latest_cache.put(OWNER, plant_id, user_id)
+
+        return created["plant"]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{plant_id}")
-async def get_plant(plant_id: str, authorization: Optional[str] = Header(None)):
-    user_id = get_user_id(authorization)
+async def get_plant(plant_id: str, user_id: str = Depends(get_current_user)):
     try:
-        result = supabase.table("plants").select("*").eq("id", plant_id).eq("user_id", user_id).single().execute()
+        result = await supabase.table("plants").select("*").eq("id", plant_id).eq("user_id", user_id).single().execute()
         return result.data
     except Exception as e:
         raise HTTPException(status_code=404, detail="Plant not found")
 
 
+@router.get("/{plant_id}/overview")
+async def get_plant_overview(plant_id: str, user_id: str = Depends(get_current_user)):
+    """Plant, latest sensor reading and light status in one call, for the plant detail page."""
+    try:
+        plant, (readings, lights) = await asyncio.gather(
+            supabase.table("plants").select("*").eq("id", plant_id).eq("user_id", user_id).limit(1).execute(),
+            latest_state([plant_id]),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not plant.data:
+        raise HTTPException(status_code=404, detail="Plant not found")
+    return {
+        "plant": plant.data[0],
+        "sensor": readings.get(plant_id),
+        "light": lights.get(plant_id),
+        "analytics": plant_analytics.snapshot(plant_id),
+    }
+
+
+@router.get("/{plant_id}/analytics", dependencies=[Depends(owned_plant)])
+async def get_plant_analytics(plant_id: str):
+    """
+    Streaming analytics kept in memory from incoming readings: spike and
+    stuck-sensor flags, per-metric mean/std and the soil drying forecast.
+    `analytics` is null until the plant has sent a reading since the API started.
+    """
+    return {"plant_id": plant_id, "analytics": plant_analytics.snapshot(plant_id)}
+
+
+@router.put("/{plant_id}/device")
+async def set_plant_device(plant_id: str, payload: PlantDevice, user_id: str = Depends(get_current_user)):
+    """Route a plant's light and water commands to a ThingsBoard device, and set its zone."""
+    try:
+        result = await (
+            supabase.table("plants")
+            .update(payload.model_dump())
+            .eq("id", plant_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Plant not found")
+    latest_cache.put(DEVICE, plant_id, route(result.data[0]))
+    return {key: result.data[0].get(key) for key in ROUTE_COLUMNS.split(",")}
+
+
 @router.delete("/{plant_id}")
-async def delete_plant(plant_id: str, authorization: Optional[str] = Header(None)):
-    user_id = get_user_id(authorization)
+async def delete_plant(plant_id: str, user_id: str = Depends(get_current_user)):
     try:
-        supabase.table("plants").delete().eq("id", plant_id).eq("user_id", user_id).execute()
+        await supabase.table("plants").delete().eq("id", plant_id).eq("user_id", user_id).execute()
+        latest_cache.invalidate(plant_id)
+        plant_analytics.forget(plant_id)
         return {"message": "Plant deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
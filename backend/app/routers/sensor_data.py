@@ -1,47 +1,246 @@
-from fastapi import APIRouter, HTTPException, Header
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app.auth import owned_plant, owned_stream_plant
+from app.backfill import backfill_plant
+from app.cache import READING, conditional_response, latest_cache
 from app.database import supabase
+from app.export import ExportSpec, export_stream
+from app.metrics import INGEST_READINGS
+from app.history import (
+    HISTORY_PAGE_SIZE,
+    METRIC_COLUMNS,
+    RAW_COLUMNS,
+    decode_cursor,
+    encode_cursor,
+    fetch_page,
+    fetch_range,
+    parse_bucket,
+    parse_columns,
+    to_iso,
+)
+from app.ml.inference import inference
+from app.ml.nutrients import NUTRIENTS, nutrient_rules, values_matrix
+from app.ml.streaming import plant_analytics
 from app.models import SensorReading
-from typing import Optional
+from app.pubsub import sensor_broker
+from app.rollups import bucketed_history
 
 router = APIRouter(prefix="/sensor-data", tags=["sensor-data"])
 
+# Comment line sent when no reading arrived for this long, keeps proxies from closing the stream
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+async def fetch_latest_reading(plant_id: str) -> Optional[dict]:
+    result = await (
+        supabase.table("sensor_readings")
+        .select("*")
+        .eq("plant_id", plant_id)
+        .order("timestamp", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return nutrient_rules.annotate(result.data)[0] if result.data else None
+
+
+async def fetch_latest_readings(plant_ids: list[str]) -> dict:
+    """Latest reading per plant, one indexed query each, run concurrently."""
+    readings = await asyncio.gather(*(fetch_latest_reading(plant_id) for plant_id in plant_ids))
+    return {plant_id: reading for plant_id, reading in zip(plant_ids, readings) if reading}
 
-@router.get("/{plant_id}")
-async def get_latest_sensor_data(plant_id: str, authorization: Optional[str] = Header(None)):
-    """Get the latest sensor reading for a plant"""
+
+@router.get("/{plant_id}", dependencies=[Depends(owned_plant)])
+async def get_latest_sensor_data(plant_id: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Get the latest sensor reading for a plant.
+    Served from the latest-state cache; returns 304 when If-None-Match
+    matches the current ETag.
+    """
     try:
-        result = (
-            supabase.table("sensor_readings")
-            .select("*")
-            .eq("plant_id", plant_id)
-            .order("timestamp", desc=True)
-            .limit(1)
-            .execute()
-        )
-        if not result.data:
-            return None
-        return result.data[0]
+        entry = await latest_cache.get(READING, plant_id, lambda: fetch_latest_reading(plant_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return conditional_response(entry, if_none_match)
+
+
+@router.get("/{plant_id}/history", dependencies=[Depends(owned_plant)])
+async def get_sensor_history(
+    plant_id: str,
+    response: Response,
+    limit: int = Query(20, ge=1, le=HISTORY_PAGE_SIZE),
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    bucket: Optional[str] = None,
+    columns: Optional[str] = None,
+    cursor: Optional[str] = None,
+):
+    """
+    Sensor readings history for a plant.
+
+    Without `bucket`: raw rows, newest first, `limit` per page. `columns`
+    projects a subset of fields; pass the `X-Next-Cursor` response header
+    back as `cursor` to get the next (older) page.
 
+    With `bucket` (e.g. `5m`, `1h`, `1d`): per-bucket count and
+    min/mean/max of each metric between `from` and `to` (default: the
+    last 24 hours), read from the coarsest minute/hour/day rollup that
+    fits the bucket size.
+    """
+    try:
+        if bucket:
+            bucket_seconds = parse_bucket(bucket)
+            metrics = parse_columns(columns, METRIC_COLUMNS)
+        else:
+            selected = parse_columns(columns, RAW_COLUMNS)
+            position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-@router.get("/{plant_id}/history")
-async def get_sensor_history(plant_id: str, limit: int = 20, authorization: Optional[str] = Header(None)):
-    """Get recent sensor readings history for a plant"""
     try:
-        result = (
-            supabase.table("sensor_readings")
-            .select("*")
-            .eq("plant_id", plant_id)
-            .order("timestamp", desc=True)
-            .limit(limit)
-            .execute()
-        )
-        return result.data
+        if not bucket:
+            rows = await fetch_page(
+                plant_id,
+                list(dict.fromkeys(["id", "timestamp", *selected])),
+                start=to_iso(from_),
+                end=to_iso(to),
+                position=position,
+                limit=limit,
+            )
+            if len(rows) == limit:
+                response.headers["X-Next-Cursor"] = encode_cursor(rows[-1])
+            return [{column: row.get(column) for column in selected} for row in rows]
+
+        end = to or datetime.now(timezone.utc)
+        start = from_ or end - timedelta(days=1)
+        return {
+            "plant_id": plant_id,
+            "from": to_iso(start),
+            "to": to_iso(end),
+            "bucket_seconds": bucket_seconds,
+            "buckets": await bucketed_history(plant_id, metrics, start, end, bucket_seconds),
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/{plant_id}/export", dependencies=[Depends(owned_plant)])
+async def export_sensor_history(
+    plant_id: str,
+    format: str = "csv",
+    layout: str = "raw",
+    columns: Optional[str] = None,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+):
+    """
+    Download a plant's readings between `from` and `to` (default: all),
+    oldest first, as `csv`, `ndjson` or `parquet`. The body is streamed
+    page by page, so any range can be exported. `layout=notebook` uses the
+    column names and order of ml/plant_model.ipynb; otherwise `columns`
+    picks a subset of the raw fields.
+    """
+    try:
+        spec = ExportSpec(format, columns, layout)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    return StreamingResponse(
+        export_stream(plant_id, spec, to_iso(from_), to_iso(to)),
+        media_type=spec.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{spec.filename(plant_id)}"'},
+    )
+
+
+@router.get("/{plant_id}/nutrients", dependencies=[Depends(owned_plant)])
+async def get_nutrient_history(
+    plant_id: str,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    include_readings: bool = True,
+):
+    """
+    Classify every reading of a plant in [`from`, `to`) as low / optimal /
+    high for N, P and K, with per-status counts. Set `include_readings=false`
+    to get only the counts.
+    """
+    try:
+        rows = await fetch_range(plant_id, list(NUTRIENTS), to_iso(from_), to_iso(to))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    codes = nutrient_rules.evaluate(values_matrix(rows))
+    result = {
+        "plant_id": plant_id,
+        "from": to_iso(from_),
+        "to": to_iso(to),
+        "thresholds": nutrient_rules.rules,
+        "counts": nutrient_rules.counts(codes),
+    }
+    if include_readings:
+        result["readings"] = [
+            {"id": row["id"], "timestamp": row["timestamp"], **status}
+            for row, status in zip(rows, nutrient_rules.labels(codes))
+        ]
+    return result
+
+
+@router.post("/{plant_id}/rescore", dependencies=[Depends(owned_plant)])
+async def rescore_sensor_history(
+    plant_id: str,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+):
+    """
+    Re-run the watering and health models over stored readings in
+    [`from`, `to`) and write back the rows whose predictions changed.
+    Readings are processed in chunks, so memory stays flat for any range.
+    """
+    if not inference.available:
+        raise HTTPException(status_code=503, detail="Inference models are not loaded")
+    try:
+        scored, updated = await backfill_plant(plant_id, to_iso(from_), to_iso(to))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if updated:
+        latest_cache.invalidate(plant_id)
+    return {"plant_id": plant_id, "scored": scored, "updated": updated}
+
+
+@router.get("/{plant_id}/stream", dependencies=[Depends(owned_stream_plant)])
+async def stream_sensor_data(plant_id: str, request: Request):
+    """
+    Server-Sent Events stream of new readings for a plant.
+    Each reading ingested through POST /sensor-data/ or the ThingsBoard
+    webhook is pushed as an `event: reading` message; nothing touches the
+    database while the stream is idle.
+    """
+    queue = sensor_broker.subscribe(plant_id)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    reading = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: reading\ndata: {json.dumps(reading, default=str)}\n\n"
+        finally:
+            sensor_broker.unsubscribe(plant_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/")
 async def insert_sensor_reading(reading: SensorReading):
     """
@@ -63,11 +262,18 @@ async def insert_sensor_reading(reading: SensorReading):
         "watering_needed": true,
         "health_status": "Healthy"
     }
+    watering_needed / health_status are predicted server-side when omitted.
     -----------------------------------------------------------------
     """
     try:
         data = reading.dict()
-        result = supabase.table("sensor_readings").insert(data).execute()
-        return result.data[0]
+        await inference.annotate([data])
+        result = await supabase.table("sensor_readings").insert(data).execute()
+        INGEST_READINGS.inc("api", "accepted")
+        plant_analytics.observe(result.data)
+        row = nutrient_rules.annotate(result.data)[0]
+        latest_cache.put(READING, reading.plant_id, row)
+        sensor_broker.publish(row)
+        return row
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,46 +1,61 @@
 
 import logging
+import os
+import random
 from fastapi import APIRouter, HTTPException, Request
-from app.database import supabase
-from app.models import SensorReading
+from fastapi.responses import JSONResponse
+from app.ingest import ingest_buffer, IngestQueueFull
+from app.ml.inference import inference
+from app.telemetry import UnsupportedEncoding, parse_body
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/thingsboard", tags=["thingsboard"])
 
+# Raw payload logging is off by default; when enabled only a sample of requests is logged
+LOG_RAW_PAYLOADS = os.getenv("THINGSBOARD_LOG_RAW_PAYLOADS", "false").lower() == "true"
+RAW_PAYLOAD_SAMPLE_RATE = float(os.getenv("THINGSBOARD_RAW_PAYLOAD_SAMPLE_RATE", "0.01"))
 
-@router.post("/webhook")
+
+@router.post("/webhook", status_code=202)
 async def thingsboard_webhook(request: Request):
     """
-    Receive sensor data pushed from ThingsBoard server.
-    Accepts the raw JSON body so we can log exactly what ThingsBoard sends,
-    then validates and stores it in the sensor_readings table.
+    Receive sensor data pushed from ThingsBoard server or straight from devices.
+    Accepts a single reading or an array of readings, as JSON, MessagePack,
+    CBOR or packed records (see app/telemetry.py, chosen by Content-Type),
+    validates each one and hands the valid ones to the ingest buffer, which
+    writes them to sensor_readings in bulk and publishes them to live
+    subscribers once stored. Invalid readings are reported back by index.
     """
-    # Log raw body for debugging
     raw_body = await request.body()
-    logger.info(f"[ThingsBoard] Raw payload: {raw_body.decode()}")
-    print(f"[ThingsBoard] Raw payload: {raw_body.decode()}")
-
-    try:
-        payload = await request.json()
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    content_type = request.headers.get("content-type")
+    if LOG_RAW_PAYLOADS and random.random() < RAW_PAYLOAD_SAMPLE_RATE:
+        logger.info("[ThingsBoard] Raw %s payload: %r", content_type, raw_body[:1024])
 
-    # Validate with Pydantic model
     try:
-        reading = SensorReading(**payload)
-    except Exception as e:
-        logger.error(f"[ThingsBoard] Validation error: {e}")
-        raise HTTPException(status_code=422, detail=f"Validation error: {e}")
+        rows, rejected, received = parse_body(raw_body, content_type, source="webhook")
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if not reading.plant_id:
-        raise HTTPException(status_code=400, detail="plant_id is required")
+    if rejected:
+        logger.warning("[ThingsBoard] %d/%d readings failed validation", len(rejected), received)
+    if not rows:
+        raise HTTPException(status_code=422, detail={"message": "No valid readings", "rejected": rejected})
 
     try:
-        data = reading.dict(exclude_none=True)
-        result = supabase.table("sensor_readings").insert(data).execute()
-        print(f"[ThingsBoard] Data saved for plant: {reading.plant_id}")
-        return {"status": "ok", "data": result.data[0]}
-    except Exception as e:
-        logger.error(f"[ThingsBoard] DB error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        # Before scoring, so a request that will be refused does not pay for inference
+        ingest_buffer.check_room(len(rows))
+        # One batched model call fills in predictions the device did not send
+        await inference.annotate(rows)
+        ingest_buffer.submit(rows)
+    except IngestQueueFull as e:
+        logger.warning("[ThingsBoard] %s", e)
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Ingest queue is full, retry later"},
+            headers={"Retry-After": "1"},
+        )
+
+    return {"status": "accepted", "accepted": len(rows), "rejected": rejected}
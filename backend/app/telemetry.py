@@ -0,0 +1,153 @@
+"""
+Telemetry payload encodings accepted by the ingest endpoints.
+
+The Content-Type of a webhook request (the last topic level on MQTT)
+picks the decoder:
+
+  application/json                   one reading object or an array (default)
+  application/msgpack                the same, MessagePack-encoded
+  application/cbor                   the same, CBOR-encoded (needs cbor2)
+  application/vnd.plantpulse.packed  fixed-size little-endian records
+
+Reading objects may use the short keys in SHORT_KEYS instead of column
+names. A device that buffered readings while offline uploads them as one
+array and sets `age_seconds` (short key `a`) on each: how long before the
+upload the reading was taken.
+
+A packed record is uint32 plant_id, uint32 age_seconds, then one float32
+per feature in the order of `health_model.input_features` in
+ml/esp32_model_metadata.json (SoilMoisture … Potassium); NaN marks a
+missing value. Records are plain numbers, so they skip per-field
+validation and are decoded for a whole batch at once.
+"""
+
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+import msgpack
+import numpy as np
+
+from app.history import METRIC_COLUMNS
+from app.ingest import parse_readings, reading_time
+from app.metrics import INGEST_READINGS
+from app.ml.registry import feature_column, load_metadata
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+PACKED = "application/vnd.plantpulse.packed"
+
+CONTENT_TYPES = {
+    JSON: JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    CBOR: CBOR,
+    PACKED: PACKED,
+}
+# MQTT has no content type: plantpulse/<device>/telemetry/<encoding>
+TOPIC_ENCODINGS = {"json": JSON, "msgpack": MSGPACK, "cbor": CBOR, "packed": PACKED}
+
+SHORT_KEYS = {
+    "p": "plant_id",
+    "sm": "soil_moisture",
+    "t": "temperature",
+    "h": "humidity",
+    "l": "light_intensity",
+    "n": "nitrogen",
+    "ph": "phosphorus",
+    "k": "potassium",
+    "w": "watering_needed",
+    "hs": "health_status",
+    "a": "age_seconds",
+}
+
+# float32 carries ~7 significant digits; round off the binary noise (40.1 → 40.099998…)
+PACKED_DECIMALS = 3
+
+_metadata = load_metadata()
+PACKED_COLUMNS = [
+    feature_column(feature) for feature in _metadata.get("health_model", {}).get("input_features", [])
+] or list(METRIC_COLUMNS)
+PACKED_RECORD = np.dtype([("plant_id", "<u4"), ("age", "<u4"), ("values", "<f4", (len(PACKED_COLUMNS),))])
+
+
+class UnsupportedEncoding(ValueError):
+    """The decoder for the payload's encoding is not installed (HTTP 415)."""
+
+
+def media_type(content_type: Optional[str]) -> str:
+    """Canonical media type for a Content-Type header; anything unrecognised is read as JSON."""
+    if not content_type:
+        return JSON
+    return CONTENT_TYPES.get(content_type.split(";", 1)[0].strip().lower(), JSON)
+
+
+def _loads_cbor(body: bytes):
+    try:
+        import cbor2
+    except ImportError:
+        raise UnsupportedEncoding("CBOR payloads need cbor2 (pip install cbor2)")
+    return cbor2.loads(body)
+
+
+DECODERS = {JSON: json.loads, MSGPACK: msgpack.unpackb, CBOR: _loads_cbor}
+
+
+def expand_keys(item):
+    """Short keys → column names; objects already using column names pass through untouched."""
+    if not isinstance(item, dict) or "plant_id" in item:
+        return item
+    return {SHORT_KEYS.get(key, key): value for key, value in item.items()}
+
+
+def decode_items(body: bytes, media: str) -> list:
+    """Reading objects from a JSON, MessagePack or CBOR body."""
+    try:
+        payload = DECODERS[media](body)
+    except UnsupportedEncoding:
+        raise
+    except Exception as e:
+        raise ValueError(f"Invalid {media} payload: {e}")
+    items = payload if isinstance(payload, list) else [payload]
+    return [expand_keys(item) for item in items]
+
+
+def parse_packed(body: bytes, source: str) -> list[dict]:
+    """Rows from packed records; raises ValueError if the body is not whole records."""
+    if not body or len(body) % PACKED_RECORD.itemsize:
+        raise ValueError(f"Packed payload must be a whole number of {PACKED_RECORD.itemsize}-byte records")
+    records = np.frombuffer(body, PACKED_RECORD)
+    values = np.round(records["values"].astype(np.float64), PACKED_DECIMALS)
+    present = np.isfinite(values)
+
+    received = datetime.now(timezone.utc)
+    received_at = received.isoformat()
+    rows = []
+    for plant_id, age, row_values, row_present in zip(
+        records["plant_id"].tolist(), records["age"].tolist(), values.tolist(), present.tolist()
+    ):
+        row = {"plant_id": plant_id}
+        for column, value, ok in zip(PACKED_COLUMNS, row_values, row_present):
+            if ok:
+                row[column] = value
+        row["timestamp"] = reading_time(received, age) if age else received_at
+        rows.append(row)
+    INGEST_READINGS.inc(source, "accepted", amount=len(rows))
+    return rows
+
+
+def parse_body(body: bytes, content_type: Optional[str], source: str) -> tuple[list[dict], list[dict], int]:
+    """
+    Decode and validate a telemetry payload in any supported encoding.
+    Returns (rows ready to insert, rejected items as {index, error}, readings received).
+    Raises UnsupportedEncoding or ValueError when the body cannot be decoded at all.
+    """
+    media = media_type(content_type)
+    if media == PACKED:
+        rows = parse_packed(body, source)
+        return rows, [], len(rows)
+    items = decode_items(body, media)
+    rows, rejected = parse_readings(items, source)
+    return rows, rejected, len(items)
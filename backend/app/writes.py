@@ -0,0 +1,51 @@
+"""
+Single-round-trip writes for the control and plant-creation paths.
+
+Needs migrations/002_write_paths.sql: the unique constraint on
+light_status.plant_id and the create_plant_with_defaults() function.
+"""
+
+from datetime import datetime, timezone
+
+from app.database import supabase
+
+# Placeholder reading stored with every new plant so the detail page has data immediately
+DUMMY_READING = {
+    "soil_moisture": 42.5,
+    "temperature": 27.3,
+    "humidity": 65.0,
+    "light_intensity": 850.0,
+    "nitrogen": 75.0,
+    "phosphorus": 22.0,
+    "potassium": 110.0,
+    "watering_needed": True,
+    "health_status": "Moderate Stress",
+    "light_on": False,
+}
+
+
+async def upsert_light_status(plant_id: str, is_on: bool) -> dict:
+    """Set a plant's light state, creating the row if needed, in one atomic statement."""
+    result = await (
+        supabase.table("light_status")
+        .upsert(
+            {"plant_id": plant_id, "is_on": is_on, "updated_at": datetime.now(timezone.utc).isoformat()},
+            on_conflict="plant_id",
+        )
+        .execute()
+    )
+    return result.data[0]
+
+
+async def upsert_light_statuses(plant_ids: list, is_on: bool) -> list[dict]:
+    """Set the light state of several plants in one statement."""
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [{"plant_id": plant_id, "is_on": is_on, "updated_at": now} for plant_id in plant_ids]
+    result = await supabase.table("light_status").upsert(rows, on_conflict="plant_id").execute()
+    return result.data
+
+
+async def create_plant_with_defaults(plant: dict, reading: dict = DUMMY_READING) -> dict:
+    """Insert a plant with its placeholder reading and light status in one transaction."""
+    result = await supabase.rpc("create_plant_with_defaults", {"plant": plant, "reading": reading}).execute()
+    return result.data
@@ -0,0 +1,101 @@
+"""
+Concurrency benchmark for the database layer.
+
+Serves GET /sensor-data/{plant_id} against a stub PostgREST with a fixed
+per-query latency and measures p50/p99 request latency as the number of
+requests in flight grows. The same query issued through the synchronous
+supabase client (the previous implementation) is benchmarked alongside:
+it blocks the event loop, so its p99 grows linearly with concurrency while
+the async layer stays close to the stub latency. (Client, app and stub
+share one process here, so the async numbers still include a little CPU
+queueing at high concurrency.)
+
+    cd backend
+    python -m benchmarks.bench_db_concurrency --latency 0.1
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.stubs import (
+    FAKE_JWT_SECRET,
+    FAKE_SERVICE_KEY,
+    FAKE_USER_ID,
+    BackgroundServer,
+    StubPostgrest,
+    make_access_token,
+    percentile,
+)
+
+
+async def drive(client: httpx.AsyncClient, path: str, concurrency: int, waves: int) -> list[float]:
+    """Fire `concurrency` simultaneous requests per wave; latency is measured from the wave start."""
+    latencies: list[float] = []
+
+    async def one(issued: float):
+        resp = await client.get(path)
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - issued)
+
+    for _ in range(waves):
+        issued = time.perf_counter()
+        await asyncio.gather(*(one(issued) for _ in range(concurrency)))
+    return latencies
+
+
+async def run(args):
+    from app.main import app
+    from app.database import close_database
+    from supabase import create_client
+
+    blocking_client = create_client(os.environ["SUPABASE_URL"], FAKE_SERVICE_KEY)
+
+    @app.get("/_bench/blocking/{plant_id}")
+    async def blocking_latest(plant_id: str):
+        result = (
+            blocking_client.table("sensor_readings")
+            .select("*")
+            .eq("plant_id", plant_id)
+            .order("timestamp", desc=True)
+            .limit(1)
+            .execute()
+        )
+        return result.data[0] if result.data else None
+
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {make_access_token()}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=120) as client:
+        print(f"{'layer':<10}{'in flight':>10}{'requests':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for label, path in (("async", "/sensor-data/1"), ("blocking", "/_bench/blocking/1")):
+            for concurrency in args.concurrency:
+                latencies = await drive(client, path, concurrency, args.waves)
+                print(
+                    f"{label:<10}{concurrency:>10}{len(latencies):>10}"
+                    f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 99) * 1000:>10.1f}"
+                )
+    await close_database()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.1, help="stub PostgREST latency per query (s)")
+    parser.add_argument("--waves", type=int, default=10, help="bursts of simultaneous requests per level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    args = parser.parse_args()
+
+    stub = StubPostgrest(latency=args.latency)
+    stub.insert_rows("plants", [{"id": 1, "user_id": FAKE_USER_ID, "name": "plant 1"}])
+    stub.insert_rows("sensor_readings", [{"plant_id": 1, "soil_moisture": 42.5, "temperature": 27.3}])
+    with BackgroundServer(stub.app) as server:
+        os.environ["SUPABASE_URL"] = server.url
+        os.environ["SUPABASE_SERVICE_ROLE_KEY"] = FAKE_SERVICE_KEY
+        os.environ["SUPABASE_JWT_SECRET"] = FAKE_JWT_SECRET
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
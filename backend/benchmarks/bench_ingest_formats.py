@@ -0,0 +1,91 @@
+"""
+Decode + validate cost per reading for each telemetry encoding.
+
+A batch of `--batch` readings is encoded once per format, then timed
+through app.telemetry.parse_body, which the webhook and MQTT subscriber
+both call:
+
+  json_legacy   the JSON path before compact encodings: json.loads, then
+                SensorReading(**item).dict() per reading
+  json          JSON with column names
+  json_short    JSON with the short keys
+  msgpack       MessagePack with the short keys
+  cbor          CBOR with the short keys (skipped without cbor2)
+  packed        fixed-size float32 records, decoded for the whole batch
+
+Reports bytes on the wire and microseconds per reading, best of
+`--repeat` rounds.
+
+    cd backend
+    python -m benchmarks.bench_ingest_formats --json formats.json
+"""
+
+import argparse
+import json
+import os
+import struct
+import warnings
+
+import msgpack
+
+from benchmarks import results
+from benchmarks.bench_micro import best_per_call, payloads
+from benchmarks.stubs import FAKE_SERVICE_KEY
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=100, help="readings per payload")
+    parser.add_argument("--repeat", type=int, default=5)
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    # The ingest modules pull in the app's settings; any values will do for in-memory work
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_KEY)
+    from app.models import SensorReading
+    from app.telemetry import CBOR, JSON, MSGPACK, PACKED, PACKED_COLUMNS, SHORT_KEYS, parse_body
+
+    items = payloads(args.batch)
+    short = {column: key for key, column in SHORT_KEYS.items()}
+    short_items = [{short[key]: value for key, value in item.items()} for item in items]
+    bodies = {
+        "json_legacy": (json.dumps(items).encode(), JSON),
+        "json": (json.dumps(items).encode(), JSON),
+        "json_short": (json.dumps(short_items, separators=(",", ":")).encode(), JSON),
+        "msgpack": (msgpack.packb(short_items), MSGPACK),
+    }
+    try:
+        import cbor2
+    except ImportError:
+        print("cbor skipped: pip install cbor2")
+    else:
+        bodies["cbor"] = (cbor2.dumps(short_items), CBOR)
+    record = struct.Struct(f"<II{len(PACKED_COLUMNS)}f")
+    bodies["packed"] = (b"".join(record.pack(i["plant_id"], 0, *(i[c] for c in PACKED_COLUMNS)) for i in items), PACKED)
+
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+    def legacy(body):
+        payload = json.loads(body)
+        return [SensorReading(**item).dict(exclude_none=True) for item in payload]
+
+    measured = {}
+    print(f"{'format':<14}{'bytes/reading':>15}{'us/reading':>12}{'readings/s':>13}")
+    for name, (body, media) in bodies.items():
+        if name == "json_legacy":
+            fn = lambda body=body: legacy(body)  # noqa: E731
+        else:
+            fn = lambda body=body, media=media: parse_body(body, media, source="bench")  # noqa: E731
+        per_reading = best_per_call(fn, args.repeat) / args.batch
+        measured[name] = {
+            "bytes_per_reading": len(body) / args.batch,
+            "per_reading_us": per_reading * 1e6,
+            "readings_per_s": 1 / per_reading,
+        }
+        print(f"{name:<14}{len(body) / args.batch:>15.1f}{per_reading * 1e6:>12.2f}{1 / per_reading:>13.0f}")
+    raise SystemExit(results.finish(args, "ingest_formats", measured))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Mixed-traffic load test of the whole API.
+
+Boots app.main:app (lifespan on) under uvicorn against a StubPostgrest
+and a StubThingsBoard, then drives three kinds of clients at once for
+`--duration` seconds:
+
+  devices     each POSTs one reading to /thingsboard/webhook every
+              `--device-interval` seconds
+  dashboards  each polls GET /sensor-data/{id} every `--poll-interval`
+              seconds, sending If-None-Match like a browser cache
+  controls    every `--burst-interval` seconds, a burst of `--burst-size`
+              concurrent POST /controls/light/{id} toggles
+
+An interval of 0 makes those clients send back to back (closed loop).
+Per scenario it reports requests/sec, errors and p50/p95/p99 latency.
+The clients run in a separate process so they do not compete with the
+server for the GIL; the stubs share the server's process.
+
+    cd backend
+    python -m benchmarks.bench_load_mix --duration 10 --json load.json
+    python -m benchmarks.bench_load_mix --duration 10 --baseline load.json
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+
+import httpx
+
+from benchmarks import results
+from benchmarks.stubs import (
+    FAKE_JWT_SECRET,
+    FAKE_SERVICE_KEY,
+    FAKE_USER_ID,
+    BackgroundServer,
+    StubPostgrest,
+    StubThingsBoard,
+    make_access_token,
+)
+
+
+def random_reading(plant_id: int, rng: random.Random) -> dict:
+    return {
+        "plant_id": plant_id,
+        "soil_moisture": round(rng.uniform(10, 90), 1),
+        "temperature": round(rng.uniform(15, 35), 1),
+        "humidity": round(rng.uniform(30, 90), 1),
+        "light_intensity": round(rng.uniform(0, 1500), 1),
+        "nitrogen": round(rng.uniform(20, 150), 1),
+        "phosphorus": round(rng.uniform(5, 80), 1),
+        "potassium": round(rng.uniform(40, 250), 1),
+    }
+
+
+class Scenario:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: list[float] = []
+        self.errors = 0
+
+    async def request(self, send, ok=(200,)):
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except httpx.HTTPError:
+            self.errors += 1
+            return None
+        self.latencies.append(time.perf_counter() - start)
+        if response.status_code not in ok:
+            self.errors += 1
+        return response
+
+
+async def paced(deadline: float, interval: float, rng: random.Random, step):
+    """Call `step` every `interval` seconds (back to back if 0) until the deadline."""
+    if interval:
+        await asyncio.sleep(rng.uniform(0, interval))  # spread clients over the interval
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        await step()
+        if interval:
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+async def drive(args, base_url: str) -> dict:
+    rng = random.Random(args.seed)
+    auth = {"Authorization": f"Bearer {make_access_token()}"}
+    devices, dashboards, controls = Scenario("devices"), Scenario("dashboards"), Scenario("controls")
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    deadline = time.monotonic() + args.duration
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+
+        def device(plant_id: int):
+            async def step():
+                await devices.request(
+                    lambda: http.post("/thingsboard/webhook", json=random_reading(plant_id, rng)), ok=(202,)
+                )
+
+            return step
+
+        def dashboard(plant_id: int):
+            etag = None
+
+            async def step():
+                nonlocal etag
+                headers = {**auth, "If-None-Match": etag} if etag else auth
+                response = await dashboards.request(
+                    lambda: http.get(f"/sensor-data/{plant_id}", headers=headers), ok=(200, 304)
+                )
+                if response is not None and response.status_code == 200:
+                    etag = response.headers.get("etag")
+
+            return step
+
+        async def burst():
+            toggles = [
+                controls.request(
+                    lambda p=rng.randrange(args.plants): http.post(
+                        f"/controls/light/{p}", json={"is_on": rng.random() < 0.5}, headers=auth
+                    )
+                )
+                for _ in range(args.burst_size)
+            ]
+            await asyncio.gather(*toggles)
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(paced(deadline, args.device_interval, rng, device(i % args.plants)) for i in range(args.devices)),
+            *(paced(deadline, args.poll_interval, rng, dashboard(i % args.plants)) for i in range(args.dashboards)),
+            paced(deadline, args.burst_interval, rng, burst),
+        )
+        elapsed = time.perf_counter() - start
+
+    return {s.name: results.latency_summary(s.latencies, elapsed, s.errors) for s in (devices, dashboards, controls)}
+
+
+def run_clients(args, base_url: str) -> dict:
+    return asyncio.run(drive(args, base_url))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--plants", type=int, default=100)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--device-interval", type=float, default=1.0)
+    parser.add_argument("--dashboards", type=int, default=50)
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--burst-size", type=int, default=10)
+    parser.add_argument("--burst-interval", type=float, default=2.0)
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connections from the load generator")
+    parser.add_argument("--latency", type=float, default=0.005, help="stub PostgREST latency per request (s)")
+    parser.add_argument("--rpc-latency", type=float, default=0.02, help="stub ThingsBoard latency per call (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    stub = StubPostgrest(latency=args.latency)
+    stub.insert_rows("plants", [{"id": i, "user_id": FAKE_USER_ID, "name": f"plant {i}"} for i in range(args.plants)])
+    rng = random.Random(args.seed)
+    stub.insert_rows("sensor_readings", [random_reading(i, rng) for i in range(args.plants)])
+    thingsboard = StubThingsBoard(latency=args.rpc_latency)
+
+    with BackgroundServer(stub.app) as db, BackgroundServer(thingsboard.app) as tb:
+        os.environ.update(
+            SUPABASE_URL=db.url,
+            SUPABASE_SERVICE_ROLE_KEY=FAKE_SERVICE_KEY,
+            SUPABASE_JWT_SECRET=FAKE_JWT_SECRET,
+            ROLLUP_ENABLED="false",
+            THINGSBOARD_URL=tb.url,
+            THINGSBOARD_USERNAME="bench@example.com",
+            THINGSBOARD_PASSWORD="bench",
+            THINGSBOARD_DEVICE_ID="bench-device",
+            LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+        )
+        from app.main import app
+
+        with BackgroundServer(app, lifespan="on") as api:
+            # spawn, not fork: this process already runs the server threads
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                measured = pool.apply(run_clients, (args, api.url))
+        rows = len(stub.table("sensor_readings")) - args.plants
+
+    print(f"{args.duration:.0f}s, stub latency {args.latency * 1000:.0f} ms (db) / {args.rpc_latency * 1000:.0f} ms (rpc)")
+    print(f"{'scenario':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, m in measured.items():
+        print(
+            f"{name:<12}{m['requests']:>10}{m['errors']:>8}{m['throughput_per_s']:>10.1f}"
+            f"{m['p50_ms']:>9.1f}{m['p95_ms']:>9.1f}{m['p99_ms']:>9.1f}"
+        )
+    print(f"\nreadings stored: {rows}, RPCs sent: {len(thingsboard.rpc_calls)}")
+    raise SystemExit(results.finish(args, "load_mix", measured))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmarks for the per-reading hot paths.
+
+  validate_dict      SensorReading(**payload), as the webhook does per item
+  validate_json      SensorReading.model_validate_json(raw bytes)
+  parse_readings     app.ingest.parse_readings over a `--batch` of payloads
+  predict_row        InferenceService.predict_batch on one reading
+  predict_batch      InferenceService.predict_batch on `--batch` readings
+
+Each case runs enough iterations to fill 0.2 s and reports the best of
+`--repeat` rounds as microseconds per call and items per second. The
+inference cases use whichever model runtime ML_RUNTIME selects and are
+skipped when the models cannot be loaded.
+
+    cd backend
+    python -m benchmarks.bench_micro --json micro.json
+    python -m benchmarks.bench_micro --baseline micro.json
+"""
+
+import argparse
+import json
+import os
+import random
+import timeit
+
+from benchmarks import results
+from benchmarks.stubs import FAKE_SERVICE_KEY
+
+
+def best_per_call(fn, repeat: int) -> float:
+    number, _ = timeit.Timer(fn).autorange()
+    return min(timeit.Timer(fn).repeat(repeat=repeat, number=number)) / number
+
+
+def payloads(count: int) -> list[dict]:
+    rng = random.Random(0)
+    return [
+        {
+            "plant_id": rng.randrange(1, 500),
+            "soil_moisture": round(rng.uniform(10, 90), 1),
+            "temperature": round(rng.uniform(15, 35), 1),
+            "humidity": round(rng.uniform(30, 90), 1),
+            "light_intensity": round(rng.uniform(0, 1500), 1),
+            "nitrogen": round(rng.uniform(20, 150), 1),
+            "phosphorus": round(rng.uniform(5, 80), 1),
+            "potassium": round(rng.uniform(40, 250), 1),
+        }
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    # parse_readings pulls in the app's settings; any values will do for in-memory work
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_KEY)
+    from app.ingest import parse_readings
+    from app.ml.inference import InferenceService
+    from app.models import SensorReading
+
+    items = payloads(args.batch)
+    item, raw = items[0], json.dumps(items[0]).encode()
+    cases = [
+        ("validate_dict", 1, lambda: SensorReading(**item)),
+        ("validate_json", 1, lambda: SensorReading.model_validate_json(raw)),
+        ("parse_readings", args.batch, lambda: parse_readings(items, source="bench")),
+    ]
+
+    service = InferenceService()
+    try:
+        service.load()
+    except Exception as e:
+        print(f"inference cases skipped: {e}")
+    else:
+        cases += [
+            ("predict_row", 1, lambda: service.predict_batch(items[:1])),
+            ("predict_batch", args.batch, lambda: service.predict_batch(items)),
+        ]
+
+    measured = {}
+    print(f"{'case':<16}{'items':>7}{'us/call':>12}{'items/s':>14}")
+    for name, size, fn in cases:
+        per_call = best_per_call(fn, args.repeat)
+        measured[name] = {"items": size, "per_call_us": per_call * 1e6, "items_per_s": size / per_call}
+        print(f"{name:<16}{size:>7}{per_call * 1e6:>12.1f}{size / per_call:>14.0f}")
+    raise SystemExit(results.finish(args, "micro", measured))
+
+
+if __name__ == "__main__":
+    main()
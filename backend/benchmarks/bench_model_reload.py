@@ -0,0 +1,116 @@
+"""
+Prediction latency while the model registry hot-swaps versions.
+
+`--clients` concurrent callers keep awaiting InferenceService.predict with
+`--batch` readings each, for `--duration` seconds per phase:
+
+  steady     no reloads
+  reloading  a new version (the metadata file rewritten) every
+             `--reload-every` seconds, loaded and swapped in while the
+             callers keep scoring
+
+The models are copied to a temporary directory first, so ml/ is never
+touched. A swap that blocked scoring would show up as a jump in p99 and
+max between the two phases.
+
+    cd backend
+    python -m benchmarks.bench_model_reload --json reload.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import results
+from benchmarks.bench_micro import payloads
+from benchmarks.stubs import FAKE_SERVICE_KEY, percentile
+
+
+async def phase(service, items: list[dict], clients: int, duration: float, reload_every: float = 0) -> dict:
+    latencies, versions = [], set()
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            predictions = await service.predict(items)
+            latencies.append(time.perf_counter() - started)
+            versions.add(predictions[0].get("model_version"))
+
+    async def reloader():
+        metadata_path = service.model_dir / "notebook_tflite_metadata.json"
+        metadata = json.loads(metadata_path.read_text())
+        step = 0
+        while time.perf_counter() + reload_every < deadline:
+            await asyncio.sleep(reload_every)
+            step += 1
+            metadata["reload_step"] = step  # new content, so a new version
+            metadata_path.write_text(json.dumps(metadata))
+            await service.reload()
+
+    tasks = [client() for _ in range(clients)]
+    if reload_every:
+        tasks.append(reloader())
+    await asyncio.gather(*tasks)
+    return {
+        "predictions": len(latencies),
+        "versions": len(versions),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+async def run(args) -> dict:
+    from app.ml.inference import InferenceService
+
+    model_dir = Path(tempfile.mkdtemp()) / "ml"
+    shutil.copytree(args.model_dir, model_dir)
+    service = InferenceService(model_dir=model_dir, workers=args.workers, reload_interval=0)
+    await service.start()
+    if not service.available:
+        raise SystemExit("models could not be loaded")
+    try:
+        items = payloads(args.batch)
+        await phase(service, items, args.clients, 1)  # warm up
+        return {
+            "steady": await phase(service, items, args.clients, args.duration),
+            "reloading": await phase(service, items, args.clients, args.duration, args.reload_every),
+        }
+    finally:
+        await service.stop()
+        shutil.rmtree(model_dir.parent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", type=Path, default=Path(__file__).resolve().parents[2] / "ml")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=32, help="readings per predict() call")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase")
+    parser.add_argument("--reload-every", type=float, default=0.5)
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    # The inference module pulls in the app's settings; any values will do for in-memory work
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_KEY)
+
+    measured = asyncio.run(run(args))
+    print(f"{'phase':<11}{'predictions':>12}{'versions':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, m in measured.items():
+        print(
+            f"{name:<11}{m['predictions']:>12}{m['versions']:>10}"
+            f"{m['p50_ms']:>9.2f}{m['p99_ms']:>9.2f}{m['max_ms']:>9.2f}"
+        )
+    raise SystemExit(results.finish(args, "model_reload", measured))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Startup cost of each model runtime.
+
+Every backend from app.ml.runtime is measured in a fresh interpreter
+process: time to import it and load both models, peak RSS afterwards,
+and rows/sec scoring a batch with the health model. Backends that are
+not installed are reported as such.
+
+    cd backend
+    python -m benchmarks.bench_model_runtime --rows 1000
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ML_DIR = Path(__file__).resolve().parents[2] / "ml"
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+from app.ml.runtime import load_model
+import numpy as np
+models = [load_model(sys.argv[1] + "/" + name, sys.argv[2])
+          for name in ("watering_model_float32.tflite", "health_model_float32.tflite")]
+startup = time.perf_counter() - start
+x = np.random.default_rng(0).uniform(0, 120, (int(sys.argv[3]), models[1].n_features)).astype(np.float32)
+models[1].predict(x)
+start = time.perf_counter()
+for _ in range(20):
+    models[1].predict(x)
+scoring = (time.perf_counter() - start) / 20
+print(json.dumps({"startup": startup, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "rows_per_sec": len(x) / scoring}))
+"""
+
+
+def measure(backend: str, rows: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, str(ML_DIR), backend, str(rows)],
+        capture_output=True,
+        text=True,
+        cwd=Path(__file__).resolve().parents[1],
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="batch size for the scoring measurement")
+    parser.add_argument("--backends", default="numpy,tflite,litert,tensorflow")
+    args = parser.parse_args()
+
+    print(f"{'backend':<12}{'startup ms':>12}{'peak RSS MB':>13}{'rows/s':>12}")
+    for backend in args.backends.split(","):
+        stats = measure(backend, args.rows)
+        if "error" in stats:
+            print(f"{backend:<12}  unavailable: {stats['error']}")
+            continue
+        print(f"{backend:<12}{stats['startup'] * 1000:>12.0f}{stats['rss_mb']:>13.0f}{stats['rows_per_sec']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Telemetry ingest throughput: MQTT subscriber vs. the HTTP webhook.
+
+Starts the full app (lifespan on) against a StubPostgrest and a local
+StubMqttBroker, then pushes the same readings, one per message, through:
+
+  webhook  POST /thingsboard/webhook from `--concurrency` HTTP clients
+  mqtt     QoS 1 publishes on MQTT_TOPIC, consumed by app.mqtt.subscriber
+
+Each run is timed from the first message until every reading is stored in
+the stub (and, for MQTT, every message is acknowledged to the broker).
+
+    cd backend
+    python -m benchmarks.bench_mqtt_ingest --messages 5000 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from benchmarks.stubs import (
+    FAKE_JWT_SECRET,
+    FAKE_SERVICE_KEY,
+    FAKE_USER_ID,
+    BackgroundServer,
+    StubMqttBroker,
+    StubPostgrest,
+)
+
+READING = {
+    "soil_moisture": 42.5,
+    "temperature": 27.3,
+    "humidity": 65.0,
+    "light_intensity": 850.0,
+    "nitrogen": 75.0,
+    "phosphorus": 22.0,
+    "potassium": 110.0,
+    "watering_needed": True,
+    "health_status": "Healthy",
+}
+
+
+def payloads(count: int, plants: int) -> list[bytes]:
+    return [json.dumps({**READING, "plant_id": i % plants}).encode() for i in range(count)]
+
+
+async def wait_for(predicate, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Readings did not land in time")
+        await asyncio.sleep(0.005)
+
+
+async def run_webhook(url: str, bodies: list[bytes], concurrency: int, stored) -> float:
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+    target = stored() + len(bodies)
+
+    async def client(http: httpx.AsyncClient):
+        while not queue.empty():
+            body = queue.get_nowait()
+            while (await http.post("/thingsboard/webhook", content=body)).status_code == 503:
+                await asyncio.sleep(0.05)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        await wait_for(lambda: stored() >= target)
+        return time.perf_counter() - start
+
+
+async def run_mqtt(broker: StubMqttBroker, topic: str, bodies: list[bytes], stored) -> float:
+    target, acked = stored() + len(bodies), broker.acked + len(bodies)
+    start = time.perf_counter()
+    broker.publish_many([(topic, body) for body in bodies], qos=1)
+    await wait_for(lambda: stored() >= target and broker.acked >= acked)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--plants", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32, help="webhook HTTP clients")
+    parser.add_argument("--latency", type=float, default=0.005, help="stub PostgREST latency per request (s)")
+    parser.add_argument("--max-inflight", type=int, default=0, help="broker QoS 1 in-flight window (0 = unlimited)")
+    args = parser.parse_args()
+
+    stub = StubPostgrest(latency=args.latency)
+    stub.insert_rows("plants", [{"id": i, "user_id": FAKE_USER_ID, "name": f"plant {i}"} for i in range(args.plants)])
+
+    def stored() -> int:
+        return len(stub.table("sensor_readings"))
+
+    with BackgroundServer(stub.app) as db, StubMqttBroker(max_inflight=args.max_inflight) as broker:
+        os.environ.update(
+            SUPABASE_URL=db.url,
+            SUPABASE_SERVICE_ROLE_KEY=FAKE_SERVICE_KEY,
+            SUPABASE_JWT_SECRET=FAKE_JWT_SECRET,
+            ROLLUP_ENABLED="false",
+            MQTT_BROKER="127.0.0.1",
+            MQTT_PORT=str(broker.port),
+        )
+        from app.main import app
+        from app.mqtt.subscriber import MQTT_TOPIC, mqtt_subscriber
+
+        topic = MQTT_TOPIC.replace("+", "bench").removesuffix("/#").replace("#", "bench")
+        bodies = payloads(args.messages, args.plants)
+        with BackgroundServer(app, lifespan="on") as api:
+            if not mqtt_subscriber.subscribed.wait(10):
+                raise SystemExit("Subscriber did not connect to the stub broker")
+            print(f"{args.messages} readings, stub latency {args.latency * 1000:.0f} ms/request")
+            print(f"{'path':<10}{'seconds':>10}{'msg/s':>12}{'db writes':>12}")
+            for name, run in (
+                ("webhook", lambda: run_webhook(api.url, bodies, args.concurrency, stored)),
+                ("mqtt", lambda: run_mqtt(broker, topic, bodies, stored)),
+            ):
+                before = stub.request_count
+                elapsed = asyncio.run(run())
+                print(f"{name:<10}{elapsed:>10.2f}{args.messages / elapsed:>12.0f}{stub.request_count - before:>12}")
+            print(f"\nmqtt: acked {broker.acked}, unacked {broker.unacked}, rejected {mqtt_subscriber.rejected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+NPK rule evaluation throughput.
+
+Compares classifying readings one at a time in Python, the way
+checkNutrients() in ml/esp32_nutrient_rules.h does per reading, with
+app.ml.nutrients evaluating the whole batch as one NumPy array:
+
+  per-row      Python comparisons for each reading dict, copied with a
+               nutrient_status field (what the routers did before)
+  annotate     NutrientRules.annotate: nutrient_status set in place, as
+               ingest, the latest-state cache and the routers do (per
+               reading below ARRAY_MIN_READINGS)
+  endpoint     GET /sensor-data/{id}/nutrients body: counts plus
+               {id, timestamp, statuses} per reading
+  counts       dicts in, per-status counts out, as the nutrients
+               endpoint with include_readings=false
+  array only   NutrientRules.evaluate on a prepared (n, 3) array
+
+With dicts on both sides most of the time goes to building Python
+objects; the rule evaluation itself is the "array only" line. Each
+`--readings` size is run separately, so the crossover between per-row
+and array evaluation shows.
+
+    cd backend
+    python -m benchmarks.bench_nutrient_rules --readings 10 100 1000 10000
+"""
+
+import argparse
+import random
+import time
+
+from app.ml.nutrients import NUTRIENTS, NutrientRules, values_matrix
+
+
+def status_per_row(rules: NutrientRules, readings: list[dict]) -> list[dict]:
+    return [{**r, "nutrient_status": status} for r, status in zip(readings, classify_per_row(rules, readings))]
+
+
+def endpoint_body(rules: NutrientRules, readings: list[dict]) -> dict:
+    codes = rules.evaluate(values_matrix(readings))
+    return {
+        "counts": rules.counts(codes),
+        "readings": [
+            {"id": r["id"], "timestamp": r["timestamp"], **status} for r, status in zip(readings, rules.labels(codes))
+        ],
+    }
+
+
+def classify_per_row(rules: NutrientRules, readings: list[dict]) -> list[dict]:
+    results = []
+    for reading in readings:
+        status = {}
+        for nutrient in NUTRIENTS:
+            value = reading.get(nutrient)
+            rule = rules.rules[nutrient]
+            if value is None:
+                status[nutrient] = None
+            elif value < rule["deficient_below"]:
+                status[nutrient] = "low"
+            elif value > rule["optimal_max"]:
+                status[nutrient] = "high"
+            else:
+                status[nutrient] = "optimal"
+        results.append(status)
+    return results
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, nargs="+", default=[10, 100, 1000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rules = NutrientRules.from_metadata()
+    print(f"{'readings':>9}  {'engine':<12}{'ms':>10}{'readings/s':>14}")
+    for size in args.readings:
+        readings = [
+            {
+                "id": i,
+                "timestamp": f"2024-01-01T00:00:{i % 60:02d}+00:00",
+                **{n: None if rng.random() < 0.02 else rng.uniform(0, 250) for n in NUTRIENTS},
+            }
+            for i in range(size)
+        ]
+        assert classify_per_row(rules, readings) == rules.classify(readings)
+        values = values_matrix(readings)
+        annotated = [dict(r) for r in readings]  # annotate writes in place; re-running it overwrites the field
+
+        for name, fn in (
+            ("per-row", lambda: status_per_row(rules, readings)),
+            ("annotate", lambda: rules.annotate(annotated)),
+            ("endpoint", lambda: endpoint_body(rules, readings)),
+            ("counts", lambda: rules.counts(rules.evaluate(values_matrix(readings)))),
+            ("array only", lambda: rules.evaluate(values)),
+        ):
+            elapsed = timed(fn, args.repeat)
+            print(f"{size:>9}  {name:<12}{elapsed * 1000:>10.3f}{size / elapsed:>14.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+Replay telemetry through the ingest path, or re-score stored history in bulk.
+
+replay
+    Each simulated device POSTs its readings to /thingsboard/webhook on its
+    own schedule. Readings are shaped like the ESP32's (SensorReading
+    fields, one reading per request) and come from either
+
+      synthetic  `--devices` devices publishing every `--interval` seconds
+                 (3 s, like the firmware, with some jitter) for `--duration`
+                 simulated seconds: soil drying out until it is watered,
+                 temperature, humidity and light following the time of day
+      --source   a CSV or NDJSON file from GET /sensor-data/export (raw
+                 layout), grouped by plant_id with the recorded spacing kept
+
+    `--speed` 1 replays in real time, N at N× speed and 0 as fast as
+    `--concurrency` in-flight requests allow. Devices omit the predictions
+    so the server's models score every reading.
+
+    By default the full app (lifespan on) runs against a StubPostgrest that
+    stamps each stored reading, and the run waits for the ingest buffer to
+    flush. Reported: readings sent and stored per second, request latency,
+    schedule lag (how late each send left against its due time, so whether
+    the load generator kept up) and pipeline lag (server arrival → stored
+    in the database). With `--target URL` the readings go to a running API
+    instead and only the client-side figures are reported.
+
+backfill
+    Seeds the stub with `--readings` synthetic readings over `--plants`
+    plants and re-scores them in-process, cleared back to unscored before
+    each case:
+
+      per_plant   fetch_range + rescore_rows one plant after the other,
+                  each plant's whole range read into memory at once
+      backfill    app.backfill.backfill with `--chunk` rows per model call
+                  and `--concurrency` plants at once
+      unchanged   backfill again over already scored rows (reads and
+                  scoring, no writes)
+
+The stubs share the server's process and its CPU, so absolute rates are
+lower than against a real database; the cases are comparable to each other.
+
+    cd backend
+    python -m benchmarks.bench_replay replay --devices 200 --duration 300 --speed 10
+    python -m benchmarks.bench_replay replay --source plant_4.csv --speed 0
+    python -m benchmarks.bench_replay backfill --readings 20000 --json backfill.json
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+import msgpack
+
+from benchmarks import results
+from benchmarks.stubs import (
+    FAKE_JWT_SECRET,
+    FAKE_SERVICE_KEY,
+    FAKE_USER_ID,
+    BackgroundServer,
+    StubPostgrest,
+    percentile,
+)
+
+METRICS = ["soil_moisture", "temperature", "humidity", "light_intensity", "nitrogen", "phosphorus", "potassium"]
+CONTENT_TYPES = {"json": "application/json", "msgpack": "application/msgpack"}
+DAY = 86400
+
+
+class RecordingPostgrest(StubPostgrest):
+    """StubPostgrest that stamps sensor_readings rows with the wall time they were stored."""
+
+    def insert_rows(self, name: str, rows: list[dict]) -> list[dict]:
+        stored = super().insert_rows(name, rows)
+        if name == "sensor_readings":
+            now = time.time()
+            for row in stored:
+                row.setdefault("stored_at", now)
+        return stored
+
+
+# ── Streams: {plant_id: [(offset seconds, reading)]} ────────────
+
+
+def synthetic_stream(devices: int, interval: float, duration: float, seed: int = 0) -> dict[int, list]:
+    rng = random.Random(seed)
+    streams = {}
+    for plant_id in range(devices):
+        soil = rng.uniform(45, 85)
+        phase = rng.uniform(0, 2 * math.pi)
+        nitrogen, phosphorus, potassium = rng.uniform(40, 120), rng.uniform(15, 60), rng.uniform(80, 200)
+        events = []
+        t = rng.uniform(0, interval)  # devices are not in lockstep
+        while t < duration:
+            daylight = math.sin(2 * math.pi * t / DAY + phase)
+            soil -= rng.uniform(0.0005, 0.002) * interval
+            if soil < 25:
+                soil = rng.uniform(70, 85)  # watered
+            nitrogen = max(5.0, nitrogen - rng.uniform(0, 0.0002) * interval)
+            events.append((t, {
+                "plant_id": plant_id,
+                "soil_moisture": round(soil + rng.gauss(0, 0.5), 1),
+                "temperature": round(22 + 6 * daylight + rng.gauss(0, 0.3), 1),
+                "humidity": round(min(95.0, max(20.0, 60 - 15 * daylight + rng.gauss(0, 1))), 1),
+                "light_intensity": round(max(0.0, 1200 * daylight + rng.gauss(0, 20)), 1),
+                "nitrogen": round(nitrogen, 1),
+                "phosphorus": round(phosphorus + rng.gauss(0, 0.5), 1),
+                "potassium": round(potassium + rng.gauss(0, 1), 1),
+            }))
+            t += interval * rng.uniform(0.9, 1.1)
+        streams[plant_id] = events
+    return streams
+
+
+def recorded_stream(path: Path) -> dict[int, list]:
+    """Readings from an export file, keeping the recorded spacing relative to the first one."""
+    with open(path, newline="") as f:
+        rows = [json.loads(line) for line in f if line.strip()] if path.suffix == ".ndjson" else list(csv.DictReader(f))
+    readings = []
+    for row in rows:
+        reading = {"plant_id": int(row["plant_id"])}
+        reading.update({c: float(row[c]) for c in METRICS if row.get(c) not in (None, "")})
+        readings.append((datetime.fromisoformat(row["timestamp"]).timestamp(), reading))
+    if not readings:
+        raise SystemExit(f"no readings in {path}")
+    first = min(at for at, _ in readings)
+    streams: dict[int, list] = {}
+    for at, reading in sorted(readings, key=lambda item: item[0]):
+        streams.setdefault(reading["plant_id"], []).append((at - first, reading))
+    return streams
+
+
+def load_streams(args) -> dict[int, list]:
+    if args.source:
+        return recorded_stream(Path(args.source))
+    return synthetic_stream(args.devices, args.interval, args.duration, args.seed)
+
+
+# ── Replay ──────────────────────────────────────────────────────
+
+
+async def replay(args, base_url: str) -> dict:
+    streams = load_streams(args)
+    encode = json.dumps if args.format == "json" else msgpack.packb
+    headers = {"Content-Type": CONTENT_TYPES[args.format]}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, schedule_lags = [], []
+    accepted = errors = 0
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        start, started_wall = time.monotonic(), time.time()
+
+        async def device(events: list):
+            nonlocal accepted, errors
+            for offset, reading in events:
+                due = start + offset / args.speed if args.speed else start
+                if due > time.monotonic():
+                    await asyncio.sleep(due - time.monotonic())
+                async with semaphore:
+                    sent = time.monotonic()
+                    if args.speed:
+                        schedule_lags.append(sent - due)
+                    try:
+                        response = await http.post("/thingsboard/webhook", content=encode(reading), headers=headers)
+                    except httpx.HTTPError:
+                        errors += 1
+                        continue
+                    latencies.append(time.monotonic() - sent)
+                    if response.status_code == 202:
+                        accepted += response.json()["accepted"]
+                    else:
+                        errors += 1
+
+        await asyncio.gather(*(device(events) for events in streams.values()))
+        elapsed = time.monotonic() - start
+
+    offered = sum(len(events) for events in streams.values())
+    span = max((events[-1][0] for events in streams.values() if events), default=0)
+    return {
+        "devices": len(streams),
+        "offered": offered,
+        "offered_per_s": offered / (span / args.speed) if args.speed and span else None,
+        "accepted": accepted,
+        "errors": errors,
+        "elapsed": elapsed,
+        "started_wall": started_wall,
+        "latencies": latencies,
+        "schedule_lags": schedule_lags,
+    }
+
+
+def run_clients(args, base_url: str) -> dict:
+    return asyncio.run(replay(args, base_url))
+
+
+def lag_summary(prefix: str, lags: list[float]) -> dict:
+    if not lags:
+        return {}
+    return {
+        f"{prefix}_p50_ms": percentile(lags, 50) * 1000,
+        f"{prefix}_p95_ms": percentile(lags, 95) * 1000,
+        f"{prefix}_max_ms": max(lags) * 1000,
+    }
+
+
+def replay_main(args) -> dict:
+    if args.target:
+        sent = run_clients(args, args.target.rstrip("/"))
+        stored_rows = None
+    else:
+        stub = RecordingPostgrest(latency=args.latency)
+        with BackgroundServer(stub.app) as db:
+            os.environ.update(
+                SUPABASE_URL=db.url,
+                SUPABASE_SERVICE_ROLE_KEY=FAKE_SERVICE_KEY,
+                SUPABASE_JWT_SECRET=FAKE_JWT_SECRET,
+                ROLLUP_ENABLED="false",
+                LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+            )
+            from app.main import app
+
+            with BackgroundServer(app, lifespan="on") as api:
+                # spawn, not fork: this process already runs the server threads
+                with multiprocessing.get_context("spawn").Pool(1) as pool:
+                    sent = pool.apply(run_clients, (args, api.url))
+                deadline = time.monotonic() + 60
+                while len(stub.table("sensor_readings")) < sent["accepted"] and time.monotonic() < deadline:
+                    time.sleep(0.05)
+            stored_rows = list(stub.table("sensor_readings"))
+
+    measured = {
+        "sent": sent["accepted"] + sent["errors"],
+        "errors": sent["errors"],
+        "sent_per_s": (sent["accepted"] + sent["errors"]) / sent["elapsed"],
+        **lag_summary("request", sent["latencies"]),
+        **lag_summary("schedule_lag", sent["schedule_lags"]),
+    }
+    print(f"{sent['devices']} devices, {sent['offered']} readings, speed {args.speed or 'max'}, {args.format}")
+    if sent["offered_per_s"]:
+        print(f"offered {sent['offered_per_s']:.1f} readings/s")
+    print(f"sent {measured['sent']} ({measured['errors']} errors) in {sent['elapsed']:.1f}s: {measured['sent_per_s']:.1f}/s")
+    if stored_rows is not None:
+        finished = max((row["stored_at"] for row in stored_rows), default=sent["started_wall"])
+        pipeline_lags = [row["stored_at"] - datetime.fromisoformat(row["timestamp"]).timestamp() for row in stored_rows]
+        measured.update(
+            stored=len(stored_rows),
+            stored_per_s=len(stored_rows) / (finished - sent["started_wall"]),
+            **lag_summary("pipeline_lag", pipeline_lags),
+        )
+        print(f"stored {measured['stored']}: {measured['stored_per_s']:.1f}/s")
+    print(f"\n{'':<14}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for prefix in ("request", "schedule_lag", "pipeline_lag"):
+        if f"{prefix}_p50_ms" in measured:
+            print(
+                f"{prefix:<14}{measured[f'{prefix}_p50_ms']:>9.1f}"
+                f"{measured[f'{prefix}_p95_ms']:>9.1f}{measured[f'{prefix}_max_ms']:>9.1f}"
+            )
+    return {"replay": measured}
+
+
+# ── Backfill ────────────────────────────────────────────────────
+
+
+def seed_history(stub: StubPostgrest, plants: int, readings: int, seed: int):
+    per_plant = max(readings // plants, 1)
+    streams = synthetic_stream(plants, 3.0, per_plant * 3.0, seed)
+    origin = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    stub.insert_rows("plants", [{"id": i, "user_id": FAKE_USER_ID, "name": f"plant {i}"} for i in range(plants)])
+    stub.insert_rows("sensor_readings", [
+        {**reading, "timestamp": (origin + timedelta(seconds=offset)).isoformat()}
+        for events in streams.values()
+        for offset, reading in events[:per_plant]
+    ])
+
+
+async def run_backfill(args, stub: StubPostgrest) -> dict:
+    from app.backfill import backfill, rescore_rows
+    from app.history import fetch_range
+    from app.ml.inference import PREDICTION_KEYS, VERSION_KEY, inference
+
+    async def per_plant() -> tuple[int, int]:
+        scored = updated = 0
+        for plant_id in range(args.plants):
+            rows = await fetch_range(str(plant_id), inference.feature_columns, None, None)
+            updated += await rescore_rows(rows)
+            scored += len(rows)
+        return scored, updated
+
+    async def chunked() -> tuple[int, int]:
+        totals = await backfill(chunk_rows=args.chunk, concurrency=args.concurrency)
+        return totals["scored"], totals["updated"]
+
+    await inference.start()
+    if not inference.available:
+        raise SystemExit("models could not be loaded")
+    measured = {}
+    print(f"{'case':<12}{'scored':>8}{'updated':>9}{'wall ms':>10}{'readings/s':>12}")
+    try:
+        for name, case, reset in (("per_plant", per_plant, True), ("backfill", chunked, True),
+                                  ("unchanged", chunked, False)):
+            if reset:
+                for row in stub.table("sensor_readings"):
+                    for key in (*PREDICTION_KEYS, VERSION_KEY):
+                        row.pop(key, None)
+            started = time.perf_counter()
+            scored, updated = await case()
+            elapsed = time.perf_counter() - started
+            measured[name] = {"scored": scored, "updated": updated, "wall_ms": elapsed * 1000,
+                              "readings_per_s": scored / elapsed}
+            print(f"{name:<12}{scored:>8}{updated:>9}{elapsed * 1000:>10.0f}{scored / elapsed:>12.0f}")
+    finally:
+        await inference.stop()
+    return measured
+
+
+def backfill_main(args) -> dict:
+    stub = StubPostgrest(latency=args.latency)
+    seed_history(stub, args.plants, args.readings, args.seed)
+    with BackgroundServer(stub.app) as db:
+        os.environ.update(
+            SUPABASE_URL=db.url,
+            SUPABASE_SERVICE_ROLE_KEY=FAKE_SERVICE_KEY,
+            LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+        )
+        print(f"{len(stub.table('sensor_readings'))} readings over {args.plants} plants, "
+              f"stub latency {args.latency * 1000:.0f} ms")
+        return asyncio.run(run_backfill(args, stub))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = sub.add_parser("replay", help="replay readings through the webhook")
+    replay_parser.add_argument("--source", help="CSV or NDJSON export to replay (default: synthetic)")
+    replay_parser.add_argument("--devices", type=int, default=50, help="synthetic devices")
+    replay_parser.add_argument("--interval", type=float, default=3.0, help="synthetic publish interval (s)")
+    replay_parser.add_argument("--duration", type=float, default=60.0, help="simulated seconds of synthetic data")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N× faster, 0 = max")
+    replay_parser.add_argument("--concurrency", type=int, default=50, help="requests in flight at most")
+    replay_parser.add_argument("--format", choices=sorted(CONTENT_TYPES), default="json")
+    replay_parser.add_argument("--target", help="base URL of a running API (default: local app on stubs)")
+    replay_parser.add_argument("--latency", type=float, default=0.005, help="stub PostgREST latency per request (s)")
+    replay_parser.add_argument("--seed", type=int, default=0)
+    results.add_arguments(replay_parser)
+
+    backfill_parser = sub.add_parser("backfill", help="re-score seeded history in bulk")
+    backfill_parser.add_argument("--plants", type=int, default=20)
+    backfill_parser.add_argument("--readings", type=int, default=20000)
+    backfill_parser.add_argument("--chunk", type=int, default=5000, help="readings per model call")
+    backfill_parser.add_argument("--concurrency", type=int, default=4, help="plants at once")
+    backfill_parser.add_argument("--latency", type=float, default=0.005, help="stub PostgREST latency per request (s)")
+    backfill_parser.add_argument("--seed", type=int, default=0)
+    results.add_arguments(backfill_parser)
+
+    args = parser.parse_args()
+    measured = replay_main(args) if args.command == "replay" else backfill_main(args)
+    raise SystemExit(results.finish(args, f"replay_{args.command}", measured))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Query latency of sensor_readings as the table grows.
+
+Fills a table with `--plants` devices reporting every 3 s, at each size in
+`--sizes`, and times the queries the API runs per plant:
+
+  latest        newest reading (cache warm-up, GET /sensor-data/{id})
+  history_page  one 100-row keyset page of the last hour, newest first
+  prune_batch   deleting one `--batch-size` batch of rows past the cutoff,
+                keeping each plant's newest (prune_sensor_readings)
+
+once without an index on (plant_id, timestamp) and once with the
+(plant_id, timestamp DESC, id DESC) and timestamp indexes from
+migrations/003_retention.sql. Without them every query scans the table
+and grows with it; with them latency stays flat.
+
+Postgres is not needed: the table lives in an in-memory SQLite database,
+whose B-tree plans for these queries have the same shape (an index range
+scan in order, stopped by LIMIT), so the trend carries over even though
+the absolute numbers do not.
+
+    cd backend
+    python -m benchmarks.bench_retention_queries --json retention.json
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from benchmarks import results
+from benchmarks.stubs import percentile
+
+INTERVAL_SECONDS = 3
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+INDEXES = [
+    'create index sensor_readings_plant_timestamp_id_idx on sensor_readings (plant_id, "timestamp" desc, id desc)',
+    'create index sensor_readings_timestamp_idx on sensor_readings ("timestamp")',
+]
+
+LATEST = 'select * from sensor_readings where plant_id = ? order by "timestamp" desc, id desc limit 1'
+HISTORY_PAGE = (
+    'select * from sensor_readings where plant_id = ? and "timestamp" >= ? and "timestamp" < ? '
+    'order by "timestamp" desc, id desc limit 100'
+)
+PRUNE_BATCH = """
+delete from sensor_readings where id in (
+    select r.id from sensor_readings r
+    where r."timestamp" < ?
+      and exists (
+          select 1 from sensor_readings n
+          where n.plant_id = r.plant_id and (n."timestamp", n.id) > (r."timestamp", r.id)
+      )
+    limit ?
+)
+"""
+
+
+def iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def build(rows: int, plants: int, indexed: bool) -> tuple[sqlite3.Connection, float]:
+    """Table of `rows` readings; returns it with the newest timestamp (epoch)."""
+    db = sqlite3.connect(":memory:")
+    db.execute(
+        'create table sensor_readings (id integer primary key, plant_id integer not null, "timestamp" text not null, '
+        "soil_moisture real, temperature real, humidity real, light_intensity real)"
+    )
+    rng = random.Random(0)
+    start = START.timestamp()
+
+    def readings():
+        for i in range(rows):
+            tick, plant_id = divmod(i, plants)
+            yield (
+                plant_id,
+                iso(start + tick * INTERVAL_SECONDS + rng.random()),
+                rng.uniform(10, 90), rng.uniform(15, 35), rng.uniform(30, 90), rng.uniform(0, 1500),
+            )
+
+    db.executemany(
+        'insert into sensor_readings (plant_id, "timestamp", soil_moisture, temperature, humidity, light_intensity) '
+        "values (?, ?, ?, ?, ?, ?)",
+        readings(),
+    )
+    if indexed:
+        for statement in INDEXES:
+            db.execute(statement)
+    db.commit()
+    newest = start + ((rows - 1) // plants) * INTERVAL_SECONDS
+    return db, newest
+
+
+def timed(db: sqlite3.Connection, sql: str, params_for, queries: int, rng: random.Random) -> list[float]:
+    latencies = []
+    for _ in range(queries):
+        params = params_for(rng)
+        started = time.perf_counter()
+        db.execute(sql, params).fetchall()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def measure(rows: int, args, indexed: bool, queries: int) -> dict:
+    db, newest = build(rows, args.plants, indexed)
+    rng = random.Random(1)
+    hour_ago = iso(newest - 3600)
+    latest = timed(db, LATEST, lambda r: (r.randrange(args.plants),), queries, rng)
+    history = timed(db, HISTORY_PAGE, lambda r: (r.randrange(args.plants), hour_ago, iso(newest + 1)), queries, rng)
+
+    # Prune the oldest tenth of the table, one batch at a time
+    cutoff = iso(START.timestamp() + (rows // args.plants // 10) * INTERVAL_SECONDS)
+    prune = []
+    for _ in range(args.prune_batches):
+        started = time.perf_counter()
+        deleted = db.execute(PRUNE_BATCH, (cutoff, args.batch_size)).rowcount
+        db.commit()
+        if not deleted:
+            break
+        prune.append(time.perf_counter() - started)
+    db.close()
+    return {
+        "rows": rows,
+        "latest_p50_us": percentile(latest, 50) * 1e6,
+        "latest_p95_us": percentile(latest, 95) * 1e6,
+        "history_page_p50_us": percentile(history, 50) * 1e6,
+        "history_page_p95_us": percentile(history, 95) * 1e6,
+        "prune_batch_p50_ms": percentile(prune, 50) * 1000 if prune else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated table sizes (rows)")
+    parser.add_argument("--plants", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200, help="timed queries per kind, size and setup")
+    parser.add_argument("--unindexed-queries", type=int, default=20, help="fewer queries for the table scans")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--prune-batches", type=int, default=2)
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    measured = {}
+    print(f"{'setup':<10}{'rows':>10}{'latest p50':>12}{'p95 us':>9}{'history p50':>13}{'p95 us':>9}{'prune ms':>10}")
+    for rows in (int(size) for size in args.sizes.split(",")):
+        for setup, indexed in (("no_index", False), ("indexed", True)):
+            queries = args.queries if indexed else min(args.queries, args.unindexed_queries)
+            m = measured[f"{setup}_{rows}"] = measure(rows, args, indexed, queries)
+            print(
+                f"{setup:<10}{rows:>10}{m['latest_p50_us']:>12.0f}{m['latest_p95_us']:>9.0f}"
+                f"{m['history_page_p50_us']:>13.0f}{m['history_page_p95_us']:>9.0f}{m['prune_batch_p50_ms']:>10.1f}"
+            )
+    raise SystemExit(results.finish(args, "retention_queries", measured))
+
+
+if __name__ == "__main__":
+    main()
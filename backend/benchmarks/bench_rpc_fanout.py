@@ -0,0 +1,96 @@
+"""
+Bulk control fan-out: one RPC to each of many devices.
+
+Sends a setControl RPC to each of `--devices` devices on a local
+StubThingsBoard (`--latency` per call), with the pooled ThingsBoardClient:
+
+  sequential   awaiting one RPC after the other, as a loop over the
+               single-device endpoints would
+  fanout_N     CommandDispatcher.submit_many + wait with N workers, as the
+               /controls/bulk endpoints do (one per `--concurrency` value)
+
+Reports wall time, RPCs/sec and the TCP connections the stub saw.
+The stub shares this process and its CPU, so past a few dozen workers
+throughput stops scaling here for reasons a real ThingsBoard would not share.
+
+    cd backend
+    python -m benchmarks.bench_rpc_fanout --devices 200 --json fanout.json
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks import results
+from benchmarks.stubs import FAKE_SERVICE_KEY, BackgroundServer, StubThingsBoard
+
+PARAMS = {"light_on": False, "water_plant": False}
+
+
+async def sequential(client, devices: list[str]) -> int:
+    for device_id in devices:
+        await client.send_rpc(device_id, "setControl", PARAMS)
+    return len(devices)
+
+
+async def fanout(client, devices: list[str], workers: int) -> int:
+    from app.mqtt.commands import LIGHT_COMMAND, SENT, CommandDispatcher
+
+    async def send(command):
+        await client.send_rpc(command.device_id, "setControl", command.params)
+
+    dispatcher = CommandDispatcher(send=send, workers=workers)
+    await dispatcher.start()
+    try:
+        commands = list(dispatcher.submit_many(dict.fromkeys(devices, []), LIGHT_COMMAND, PARAMS).values())
+        await dispatcher.wait(commands, timeout=300)
+    finally:
+        await dispatcher.stop()
+    return sum(command.status == SENT for command in commands)
+
+
+async def run(args, url: str, stub: StubThingsBoard) -> dict:
+    from app.mqtt.publisher import ThingsBoardClient
+
+    devices = [f"esp32-{i}" for i in range(args.devices)]
+    concurrency = [int(c) for c in args.concurrency.split(",")]
+    cases = [("sequential", lambda client: sequential(client, devices))]
+    cases += [(f"fanout_{n}", lambda client, n=n: fanout(client, devices, n)) for n in concurrency]
+
+    measured = {}
+    print(f"{'case':<14}{'devices':>8}{'sent':>6}{'wall ms':>10}{'rpc/s':>9}{'conns':>7}")
+    for name, case in cases:
+        client = ThingsBoardClient(base_url=url, username="u", password="p", max_connections=max(concurrency))
+        await client.get_token()  # log in outside the timed part
+        stub.connections = set()
+        started = time.perf_counter()
+        sent = await case(client)
+        elapsed = time.perf_counter() - started
+        await client.aclose()
+        measured[name] = {"sent": sent, "wall_ms": elapsed * 1000, "rpcs_per_s": sent / elapsed,
+                          "connections": len(stub.connections)}
+        print(f"{name:<14}{args.devices:>8}{sent:>6}{elapsed * 1000:>10.0f}{sent / elapsed:>9.0f}{len(stub.connections):>7}")
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--concurrency", default="8,20", help="comma-separated dispatcher worker counts")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub ThingsBoard latency per call (s)")
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    # The dispatcher module pulls in the app's settings; any values will do here
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_KEY)
+
+    stub = StubThingsBoard(latency=args.latency)
+    with BackgroundServer(stub.app) as server:
+        measured = asyncio.run(run(args, server.url, stub))
+    raise SystemExit(results.finish(args, "rpc_fanout", measured))
+
+
+if __name__ == "__main__":
+    main()
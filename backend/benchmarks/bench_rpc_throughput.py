@@ -0,0 +1,100 @@
+"""
+ThingsBoard RPC throughput under concurrency.
+
+Sends bursts of setControl RPCs to a local StubThingsBoard and compares:
+
+  per-call   a fresh httpx.AsyncClient for the login and for every RPC,
+             token never refreshed proactively (the previous implementation)
+  pooled     the shared ThingsBoardClient from app.mqtt.publisher
+
+Reports RPCs/sec, the number of logins and the number of distinct TCP
+connections the stub saw. The stub token lifetime is short so the run
+crosses several refreshes.
+
+    cd backend
+    python -m benchmarks.bench_rpc_throughput --rpcs 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.stubs import BackgroundServer, StubThingsBoard
+
+
+class PerCallClient:
+    """The old publisher: a new client per call and a token cached until a 401."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.token = None
+
+    async def _login(self):
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(f"{self.base_url}/api/auth/login", json={"username": "u", "password": "p"})
+            resp.raise_for_status()
+            self.token = resp.json()["token"]
+
+    async def send(self, device_id: str, params: dict):
+        if not self.token:
+            await self._login()
+        payload = {"method": "setControl", "params": params, "timeout": 5000, "retries": 5}
+        async with httpx.AsyncClient() as client:
+            url = f"{self.base_url}/api/plugins/rpc/oneway/{device_id}"
+            resp = await client.post(url, json=payload, headers={"X-Authorization": f"Bearer {self.token}"})
+            if resp.status_code == 401:
+                self.token = None
+                await self._login()
+                resp = await client.post(url, json=payload, headers={"X-Authorization": f"Bearer {self.token}"})
+            resp.raise_for_status()
+
+
+async def drive(send, rpcs: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await send(f"device-{i % 8}", {"light_on": bool(i % 2), "water_plant": False})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(rpcs)))
+    return time.perf_counter() - start
+
+
+async def run(args, url: str, stub: StubThingsBoard):
+    from app.mqtt.publisher import ThingsBoardClient
+
+    print(f"{'client':<10}{'rpcs':>8}{'rpc/s':>10}{'logins':>8}{'conns':>8}")
+
+    legacy = PerCallClient(url)
+    elapsed = await drive(legacy.send, args.rpcs, args.concurrency)
+    print(f"{'per-call':<10}{args.rpcs:>8}{args.rpcs / elapsed:>10.0f}{stub.login_count:>8}{len(stub.connections):>8}")
+
+    stub.login_count, stub.connections = 0, set()
+    pooled = ThingsBoardClient(base_url=url, username="u", password="p", refresh_margin=1)
+
+    async def send(device_id, params):
+        await pooled.send_rpc(device_id, "setControl", params)
+
+    elapsed = await drive(send, args.rpcs, args.concurrency)
+    await pooled.aclose()
+    print(f"{'pooled':<10}{args.rpcs:>8}{args.rpcs / elapsed:>10.0f}{stub.login_count:>8}{len(stub.connections):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rpcs", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005, help="stub ThingsBoard latency per call (s)")
+    parser.add_argument("--token-ttl", type=int, default=3, help="stub token lifetime (s)")
+    args = parser.parse_args()
+
+    stub = StubThingsBoard(latency=args.latency, token_ttl=args.token_ttl)
+    with BackgroundServer(stub.app) as server:
+        asyncio.run(run(args, server.url, stub))
+
+
+if __name__ == "__main__":
+    main()
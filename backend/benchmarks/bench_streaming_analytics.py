@@ -0,0 +1,175 @@
+"""
+Per-reading cost of the streaming analytics stage as history grows.
+
+For each size in `--sizes`, a fresh app.ml.streaming.StreamingAnalytics is
+fed that many readings from `--plants` devices reporting every 3 s. Then
+`--readings` more are timed through it:
+
+  single      observe() with one reading per call (webhook, POST /sensor-data)
+  batch       observe() with `--batch` readings per call (MQTT, offline uploads)
+  recompute   what the same results cost without streaming state: mean, std
+              and a least-squares soil-moisture line over the plant's whole
+              history, redone for every new reading
+
+Per-plant state is a few floats per metric, so single and batch stay flat
+however much history was fed in; recompute grows with it. The crossover
+table times recompute over 1 to `--max-crossover` readings of one plant's
+history (powers of 4) and reports the shortest history at which it costs
+more than the slowest streaming update: below that, recomputing would be
+the cheaper design.
+
+    cd backend
+    python -m benchmarks.bench_streaming_analytics --json streaming.json
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks import results
+from benchmarks.stubs import FAKE_SERVICE_KEY
+
+INTERVAL_SECONDS = 3
+START = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+PREFILL_BATCH = 2000
+
+
+def stream(plants: int, first_tick: int, count: int, rng: random.Random) -> list[dict]:
+    """`count` readings, round-robin over the plants, every 3 s from `first_tick`."""
+    rows = []
+    for i in range(count):
+        tick, plant_id = divmod(first_tick * plants + i, plants)
+        rows.append({
+            "plant_id": plant_id,
+            "timestamp": datetime.fromtimestamp(START + tick * INTERVAL_SECONDS, tz=timezone.utc).isoformat(),
+            "soil_moisture": 80 - (tick % 20000) * 0.002 + rng.gauss(0, 0.3),
+            "temperature": rng.gauss(24, 1),
+            "humidity": rng.gauss(60, 3),
+            "light_intensity": rng.uniform(0, 1500),
+            "nitrogen": 75.0,
+            "phosphorus": 22.0,
+            "potassium": 110.0,
+        })
+    return rows
+
+
+def timed_observe(analytics, rows: list[dict], batch: int) -> float:
+    started = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        analytics.observe(rows[i:i + batch])
+    return (time.perf_counter() - started) / len(rows)
+
+
+def recompute(history: np.ndarray, hours: np.ndarray):
+    history.mean(axis=0), history.std(axis=0)
+    np.polyfit(hours, history[:, 0], 1)
+
+
+def recompute_us(length: int, metrics: int, repeat: int) -> float:
+    """Cost of one recompute over `length` readings of one plant's history."""
+    history = np.random.default_rng(0).normal(50, 5, size=(max(length, 2), metrics))
+    hours = np.arange(len(history)) * INTERVAL_SECONDS / 3600
+    calls = max(3, min(200, 2_000_000 // max(length, 1)))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(calls):
+            recompute(history, hours)
+        timings.append((time.perf_counter() - started) / calls)
+    return min(timings) * 1e6
+
+
+def crossover(streaming_us: float, metrics: int, args) -> tuple[dict, dict]:
+    """
+    Recompute cost per history length, and the shortest length whose
+    recompute costs more than `streaming_us` (None if none up to --max-crossover).
+    """
+    table, length = {}, 1
+    while length <= args.max_crossover:
+        table[length] = recompute_us(length, metrics, args.repeat)
+        length *= 4
+    first = next((length for length, cost in table.items() if cost > streaming_us), None)
+    return table, {
+        "history_per_plant": first,
+        "streaming_us": streaming_us,
+        "recompute_us": table[first] if first is not None else None,
+    }
+
+
+def measure(size: int, args) -> dict:
+    from app.ml.streaming import StreamingAnalytics
+
+    rng = random.Random(0)
+    analytics = StreamingAnalytics()
+    ticks = size // args.plants
+    for first in range(0, ticks, PREFILL_BATCH // args.plants or 1):
+        analytics.observe(stream(args.plants, first, min(PREFILL_BATCH, (ticks - first) * args.plants), rng))
+
+    tick = ticks
+    single, batch = [], []
+    per_round = -(-args.readings // args.plants)
+    for _ in range(args.repeat):
+        single.append(timed_observe(analytics, stream(args.plants, tick, args.readings, rng), 1))
+        tick += per_round
+        batch.append(timed_observe(analytics, stream(args.plants, tick, args.readings, rng), args.batch))
+        tick += per_round
+
+    return {
+        "history_readings": size,
+        "history_per_plant": ticks,
+        "single_us": min(single) * 1e6,
+        "batch_us": min(batch) * 1e6,
+        # One plant's full history, as a query for it would return
+        "recompute_us": recompute_us(ticks, len(analytics.metrics), args.repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated history sizes (readings)")
+    parser.add_argument("--plants", type=int, default=100)
+    parser.add_argument("--readings", type=int, default=2000, help="timed readings per round")
+    parser.add_argument("--batch", type=int, default=100, help="readings per observe() call in the batch case")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-crossover", type=int, default=16384, help="longest history tried for the crossover")
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    # The analytics module pulls in the app's settings; any values will do for in-memory work
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", FAKE_SERVICE_KEY)
+
+    measured = {}
+    print(f"{'history':>10}{'per plant':>11}{'single us':>11}{'batch us':>10}{'recompute us':>14}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        m = measured[f"history_{size}"] = measure(size, args)
+        print(
+            f"{size:>10}{m['history_per_plant']:>11}{m['single_us']:>11.1f}"
+            f"{m['batch_us']:>10.2f}{m['recompute_us']:>14.1f}"
+        )
+
+    # Compare against the slowest streaming case: the crossover holds for every call pattern
+    from app.history import METRIC_COLUMNS
+
+    streaming = max(max(m["single_us"], m["batch_us"]) for m in measured.values())
+    table, found = crossover(streaming, len(METRIC_COLUMNS), args)
+    print(f"\n{'per plant':>10}{'recompute us':>14}")
+    for length, cost in table.items():
+        print(f"{length:>10}{cost:>14.1f}")
+    if found["history_per_plant"] is None:
+        print(f"Recompute stays under {streaming:.1f} us per reading up to {args.max_crossover} readings per plant")
+    else:
+        print(
+            f"Crossover: from {found['history_per_plant']} readings per plant, recompute "
+            f"({found['recompute_us']:.1f} us) costs more than a streaming update ({streaming:.1f} us)"
+        )
+    measured["crossover"] = found
+    raise SystemExit(results.finish(args, "streaming_analytics", measured))
+
+
+if __name__ == "__main__":
+    main()
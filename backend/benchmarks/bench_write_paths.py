@@ -0,0 +1,109 @@
+"""
+Latency of the light-toggle and plant-creation write paths.
+
+Runs against a local StubPostgrest with a fixed per-request latency
+standing in for the network round trip to Supabase, and compares:
+
+  toggle  legacy   SELECT, then UPDATE or INSERT (the previous toggle_light)
+          upsert   app.writes.upsert_light_status, one request
+  create  legacy   three sequential inserts (the previous create_plant)
+          rpc      app.writes.create_plant_with_defaults, one request
+
+It also fires concurrent first toggles at fresh plants and counts the
+light_status rows left behind: the legacy path can insert duplicates.
+
+    cd backend
+    python -m benchmarks.bench_write_paths --ops 200 --latency 0.01
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+from benchmarks.stubs import FAKE_SERVICE_KEY, FAKE_USER_ID, BackgroundServer, StubPostgrest, percentile
+
+
+def create_plant_with_defaults(stub: StubPostgrest, plant: dict, reading: dict) -> dict:
+    """Stand-in for the stored function in migrations/002_write_paths.sql."""
+    new_plant = stub.insert_rows("plants", [plant])[0]
+    new_reading = stub.insert_rows("sensor_readings", [{**reading, "plant_id": new_plant["id"]}])[0]
+    new_light = stub.insert_rows("light_status", [{"plant_id": new_plant["id"], "is_on": False}])[0]
+    return {"plant": new_plant, "reading": new_reading, "light": new_light}
+
+
+async def legacy_toggle(supabase, plant_id, is_on: bool):
+    existing = await supabase.table("light_status").select("id").eq("plant_id", plant_id).execute()
+    if existing.data:
+        await (
+            supabase.table("light_status")
+            .update({"is_on": is_on, "updated_at": datetime.now(timezone.utc).isoformat()})
+            .eq("plant_id", plant_id)
+            .execute()
+        )
+    else:
+        await supabase.table("light_status").insert({"plant_id": plant_id, "is_on": is_on}).execute()
+
+
+async def legacy_create(supabase, plant: dict, reading: dict):
+    result = await supabase.table("plants").insert(plant).execute()
+    plant_id = result.data[0]["id"]
+    await supabase.table("sensor_readings").insert({**reading, "plant_id": plant_id}).execute()
+    await supabase.table("light_status").insert({"plant_id": plant_id, "is_on": False}).execute()
+
+
+async def measure(fn, ops: int) -> list[float]:
+    latencies = []
+    for i in range(ops):
+        start = time.perf_counter()
+        await fn(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run(args, stub: StubPostgrest):
+    from app.database import supabase
+    from app.writes import DUMMY_READING, create_plant_with_defaults as rpc_create, upsert_light_status
+
+    plant = {"user_id": FAKE_USER_ID, "name": "bench"}
+    stub.insert_rows("plants", [{**plant, "id": 0}])
+
+    print(f"{'path':<16}{'p50 ms':>10}{'p95 ms':>10}{'requests':>10}")
+    cases = (
+        ("toggle legacy", lambda i: legacy_toggle(supabase, 0, bool(i % 2))),
+        ("toggle upsert", lambda i: upsert_light_status(0, bool(i % 2))),
+        ("create legacy", lambda i: legacy_create(supabase, plant, DUMMY_READING)),
+        ("create rpc", lambda i: rpc_create(plant, DUMMY_READING)),
+    )
+    for name, fn in cases:
+        before = stub.request_count
+        latencies = await measure(fn, args.ops)
+        per_op = (stub.request_count - before) / args.ops
+        print(f"{name:<16}{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 95) * 1000:>10.1f}{per_op:>10.1f}")
+
+    print(f"\n{args.plants} fresh plants, {args.toggles} concurrent first toggles each:")
+    for name, toggle in (("legacy", lambda p: legacy_toggle(supabase, p, True)), ("upsert", lambda p: upsert_light_status(p, True))):
+        plant_ids = [row["id"] for row in stub.insert_rows("plants", [plant] * args.plants)]
+        await asyncio.gather(*(toggle(p) for p in plant_ids for _ in range(args.toggles)))
+        rows = [r for r in stub.table("light_status") if r["plant_id"] in set(plant_ids)]
+        print(f"  {name:<8} light_status rows: {len(rows)} (expected {args.plants})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.01, help="stub PostgREST latency per request (s)")
+    parser.add_argument("--plants", type=int, default=20)
+    parser.add_argument("--toggles", type=int, default=5)
+    args = parser.parse_args()
+
+    stub = StubPostgrest(latency=args.latency)
+    stub.functions["create_plant_with_defaults"] = create_plant_with_defaults
+    with BackgroundServer(stub.app) as server:
+        os.environ.update(SUPABASE_URL=server.url, SUPABASE_SERVICE_ROLE_KEY=FAKE_SERVICE_KEY)
+        asyncio.run(run(args, stub))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Machine-readable benchmark output and regression checks.
+
+Results are {case: {metric: number}}. A metric's suffix says which way is
+better: `_ms` and `_us` are latencies (lower is better), `_per_s` is a
+rate (higher is better); anything else is informational. `--json` writes
+the results with the run parameters and environment; `--baseline`
+compares the run against an earlier JSON file and exits non-zero when a
+metric got worse by more than `--tolerance`.
+
+    python -m benchmarks.bench_micro --json micro.json
+    python -m benchmarks.bench_micro --baseline micro.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.stubs import percentile
+
+LOWER_IS_BETTER = ("_ms", "_us")
+HIGHER_IS_BETTER = ("_per_s",)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against an earlier --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default 0.2)")
+
+
+def latency_summary(latencies: list[float], elapsed: float, errors: int = 0) -> dict:
+    """Request count, rate and p50/p95/p99 (in ms) for one scenario."""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    found = []
+    for case, metrics in results.items():
+        for key, value in metrics.items():
+            before = baseline.get(case, {}).get(key)
+            if not isinstance(before, (int, float)) or not before:
+                continue
+            change = (value - before) / before
+            if (key.endswith(LOWER_IS_BETTER) and change > tolerance) or (
+                key.endswith(HIGHER_IS_BETTER) and change < -tolerance
+            ):
+                found.append(f"{case}.{key}: {before:.4g} -> {value:.4g} ({change:+.0%})")
+    return found
+
+
+def finish(args: argparse.Namespace, benchmark: str, results: dict) -> int:
+    """Write/compare results per the command line; returns the process exit code."""
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k not in ("json", "baseline", "tolerance")}
+        document = {
+            "benchmark": benchmark,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": params,
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("benchmark") != benchmark:
+        print(f"Baseline is from {baseline.get('benchmark')!r}, not {benchmark!r}", file=sys.stderr)
+        return 2
+    found = regressions(results, baseline["results"], args.tolerance)
+    if found:
+        print(f"\n{len(found)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in found:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
@@ -0,0 +1,548 @@
+"""
+Local stand-ins used by the benchmark scripts and the tests.
+
+StubThingsBoard mimics the ThingsBoard REST endpoints the backend calls
+(tenant login and device RPC). Tokens expire after `token_ttl` seconds and
+expired tokens get a 401, so refresh logic is exercised realistically;
+`fail_every` and `fail_next` make RPCs fail with 5xx or 429 answers.
+
+StubPostgrest implements the small subset of the PostgREST (Supabase REST)
+protocol the backend actually uses — select/insert/update/delete with
+eq/neq/gt/gte/lt/lte/in filters, order, limit and object responses — on
+top of in-memory tables, with an optional artificial latency per request.
+It runs under uvicorn on a background thread so the real supabase client
+talks to it over a local TCP socket.
+
+StubMqttBroker is a minimal MQTT 3.1.1 broker (QoS 0/1, `+`/`#`
+subscriptions, persistent sessions with redelivery of unacknowledged
+messages, optional in-flight window) for exercising app.mqtt.subscriber
+with a real paho client.
+"""
+
+import asyncio
+import itertools
+import json
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+import jwt
+import uvicorn
+from paho.mqtt.client import topic_matches_sub
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# A syntactically valid (unsigned) JWT; the supabase client only checks the shape.
+FAKE_SERVICE_KEY = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."
+    "eyJyb2xlIjoic2VydmljZV9yb2xlIn0."
+    "c2lnbmF0dXJl"
+)
+
+FAKE_JWT_SECRET = "benchmark-jwt-secret-not-for-production"
+FAKE_USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def make_access_token(user_id: str = FAKE_USER_ID, secret: str = FAKE_JWT_SECRET, ttl: int = 3600) -> str:
+    """Mint an HS256 access token shaped like the ones Supabase Auth issues."""
+    now = int(time.time())
+    claims = {"sub": user_id, "aud": "authenticated", "role": "authenticated", "iat": now, "exp": now + ttl}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+FILTER_OPS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+    "lte": lambda a, b: a is not None and a <= b,
+}
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _coerce(raw: str, like):
+    """Convert a filter literal to the type of the stored value it is compared to."""
+    if isinstance(like, bool):
+        return raw.lower() == "true"
+    if isinstance(like, int):
+        return int(raw)
+    if isinstance(like, float):
+        return float(raw)
+    return raw
+
+
+class StubPostgrest:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: dict[str, list[dict]] = {}
+        self.functions: dict = {}
+        self.request_count = 0
+        self._ids = itertools.count(1)
+        self.app = Starlette(
+            routes=[
+                Route("/rest/v1/rpc/{func}", self._rpc, methods=["POST", "GET"]),
+                Route("/rest/v1/{table}", self._table, methods=["GET", "POST", "PATCH", "DELETE"]),
+                Route("/auth/v1/user", self._user, methods=["GET"]),
+            ]
+        )
+
+    # ── Data helpers ────────────────────────────────────────────
+
+    def table(self, name: str) -> list[dict]:
+        return self.tables.setdefault(name, [])
+
+    def insert_rows(self, name: str, rows: list[dict]) -> list[dict]:
+        stored = []
+        for row in rows:
+            row = dict(row)
+            row.setdefault("id", next(self._ids))
+            if name == "sensor_readings":
+                row.setdefault("timestamp", _now())
+            if name in ("plants",):
+                row.setdefault("created_at", _now())
+            if name == "light_status":
+                row.setdefault("updated_at", _now())
+            self.table(name).append(row)
+            stored.append(row)
+        return stored
+
+    def _matches(self, row: dict, filters: list) -> bool:
+        for column, op, raw in filters:
+            if column in ("or", "and"):
+                results = (self._matches(row, [term]) for term in raw)
+                if not (any(results) if column == "or" else all(results)):
+                    return False
+                continue
+            value = row.get(column)
+            if op == "in":
+                options = [v.strip('"') for v in raw.strip("()").split(",") if v]
+                if str(value) not in options:
+                    return False
+            elif op == "is":
+                if raw == "null" and value is not None:
+                    return False
+            else:
+                if value is None and op == "eq":
+                    return False
+                if not FILTER_OPS[op](value, _coerce(raw, value) if value is not None else raw):
+                    return False
+        return True
+
+    @staticmethod
+    def _split_terms(expr: str) -> list[str]:
+        """Split a PostgREST logic tree body on top-level commas (outside quotes/parens)."""
+        terms, depth, quoted, current = [], 0, False, ""
+        for ch in expr:
+            if ch == '"':
+                quoted = not quoted
+            elif not quoted and ch == "(":
+                depth += 1
+            elif not quoted and ch == ")":
+                depth -= 1
+            elif not quoted and ch == "," and depth == 0:
+                terms.append(current)
+                current = ""
+                continue
+            current += ch
+        return terms + [current] if current else terms
+
+    @classmethod
+    def _parse_term(cls, term: str):
+        for logic in ("or", "and"):
+            if term.startswith(f"{logic}("):
+                return (logic, None, [cls._parse_term(t) for t in cls._split_terms(term[len(logic) + 1 : -1])])
+        column, op, literal = term.split(".", 2)
+        return (column, op, literal.strip('"'))
+
+    @classmethod
+    def _parse(cls, request: Request):
+        filters = []
+        for key, raw in request.query_params.multi_items():
+            if key in RESERVED_PARAMS:
+                continue
+            if key in ("or", "and"):
+                filters.append(cls._parse_term(f"{key}{raw}"))
+                continue
+            op, _, literal = raw.partition(".")
+            filters.append((key, op, literal))
+        return filters
+
+    @staticmethod
+    def _project(rows: list[dict], select: str | None) -> list[dict]:
+        if not select or select == "*":
+            return rows
+        columns = [c.strip() for c in select.split(",")]
+        return [{c: row.get(c) for c in columns} for row in rows]
+
+    @staticmethod
+    def _order(rows: list[dict], order: str | None) -> list[dict]:
+        if not order:
+            return rows
+        for clause in reversed(order.split(",")):
+            parts = clause.split(".")
+            column, desc = parts[0], "desc" in parts[1:]
+            present = [r for r in rows if r.get(column) is not None]
+            missing = [r for r in rows if r.get(column) is None]
+            present.sort(key=lambda r: r[column], reverse=desc)
+            rows = present + missing
+        return rows
+
+    def _respond(self, request: Request, rows: list[dict], status: int = 200) -> Response:
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse(
+                    {"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned",
+                     "details": f"The result contains {len(rows)} rows", "hint": None},
+                    status_code=406,
+                )
+            return JSONResponse(rows[0], status_code=status)
+        return JSONResponse(rows, status_code=status)
+
+    # ── Routes ──────────────────────────────────────────────────
+
+    async def _table(self, request: Request) -> Response:
+        self.request_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        name = request.path_params["table"]
+        params = request.query_params
+        filters = self._parse(request)
+        rows = self.table(name)
+
+        if request.method == "GET":
+            selected = [r for r in rows if self._matches(r, filters)]
+            selected = self._order(selected, params.get("order"))
+            offset = int(params.get("offset", 0))
+            if "limit" in params:
+                selected = selected[offset : offset + int(params["limit"])]
+            return self._respond(request, self._project(selected, params.get("select")))
+
+        if request.method == "POST":
+            body = json.loads(await request.body() or b"null")
+            body = body if isinstance(body, list) else [body]
+            prefer = request.headers.get("prefer", "")
+            if "resolution=merge-duplicates" in prefer and params.get("on_conflict"):
+                keys = params["on_conflict"].split(",")
+                index = {tuple(str(r.get(k)) for k in keys): r for r in rows}
+                stored = []
+                for row in body:
+                    existing = index.get(tuple(str(row.get(k)) for k in keys))
+                    if existing is not None:
+                        existing.update(row)
+                        stored.append(existing)
+                    else:
+                        stored.extend(self.insert_rows(name, [row]))
+                        index[tuple(str(row.get(k)) for k in keys)] = stored[-1]
+            else:
+                stored = self.insert_rows(name, body)
+            if "return=minimal" in prefer:
+                return Response(status_code=201)
+            return self._respond(request, stored, status=201)
+
+        if request.method == "PATCH":
+            patch = json.loads(await request.body())
+            updated = [r for r in rows if self._matches(r, filters)]
+            for row in updated:
+                row.update(patch)
+            return self._respond(request, updated)
+
+        # DELETE
+        deleted = [r for r in rows if self._matches(r, filters)]
+        self.tables[name] = [r for r in rows if not self._matches(r, filters)]
+        return self._respond(request, deleted)
+
+    async def _rpc(self, request: Request) -> Response:
+        self.request_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        func = self.functions.get(request.path_params["func"])
+        if func is None:
+            return JSONResponse({"code": "PGRST202", "message": "function not found"}, status_code=404)
+        body = json.loads(await request.body() or b"{}")
+        return JSONResponse(func(self, **body))
+
+    async def _user(self, request: Request) -> Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return JSONResponse({"id": FAKE_USER_ID, "aud": "authenticated",
+                             "app_metadata": {}, "user_metadata": {}, "created_at": _now()})
+
+
+class StubThingsBoard:
+    def __init__(self, latency: float = 0.0, token_ttl: int = 3600, fail_every: int = 0):
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.fail_every = fail_every  # answer every Nth RPC with a 503 (0 = never)
+        self.fail_next: deque[int] = deque()  # statuses to answer the next RPCs with, e.g. a gateway 504
+        self.login_count = 0
+        self.rpc_calls: list[tuple[str, dict]] = []
+        self.connections: set = set()
+        self.app = Starlette(
+            routes=[
+                Route("/api/auth/login", self._login, methods=["POST"]),
+                Route("/api/plugins/rpc/{kind}/{device_id}", self._rpc, methods=["POST"]),
+            ]
+        )
+
+    async def _login(self, request: Request) -> Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.login_count += 1
+        body = json.loads(await request.body())
+        now = int(time.time())
+        claims = {"sub": body.get("username") or "tenant", "iat": now, "exp": now + self.token_ttl,
+                  "n": self.login_count}
+        return JSONResponse({"token": jwt.encode(claims, "thingsboard-stub", algorithm="HS256"),
+                             "refreshToken": "unused"})
+
+    async def _rpc(self, request: Request) -> Response:
+        self.connections.add((request.client.host, request.client.port))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        token = request.headers.get("x-authorization", "").replace("Bearer ", "")
+        try:
+            jwt.decode(token, "thingsboard-stub", algorithms=["HS256"])
+        except jwt.PyJWTError:
+            return JSONResponse({"status": 401, "message": "Token has expired"}, status_code=401)
+        self.rpc_calls.append((request.path_params["device_id"], json.loads(await request.body())))
+        if self.fail_next:
+            return JSONResponse({"status": self.fail_next[0]}, status_code=self.fail_next.popleft())
+        if self.fail_every and len(self.rpc_calls) % self.fail_every == 0:
+            return JSONResponse({"status": 503}, status_code=503)
+        return Response(status_code=200)
+
+
+def _mqtt_packet(header: int, body: bytes) -> bytes:
+    length, encoded = len(body), bytearray()
+    while True:
+        byte, length = length & 0x7F, length >> 7
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes([header]) + bytes(encoded) + body
+
+
+def _mqtt_publish_packet(topic: str, payload: bytes, qos: int, mid: int = 0, dup: bool = False) -> bytes:
+    name = topic.encode()
+    body = struct.pack("!H", len(name)) + name + (struct.pack("!H", mid) if qos else b"") + payload
+    return _mqtt_packet(0x30 | (0x08 if dup else 0) | qos << 1, body)
+
+
+class _MqttSession:
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.subscriptions: dict[str, int] = {}
+        self.writer = None
+        self.next_mid = 0
+        self.inflight: OrderedDict[int, tuple] = OrderedDict()  # sent QoS 1, waiting for PUBACK
+        self.backlog: deque = deque()  # QoS 1 waiting for room in the in-flight window
+
+    def new_mid(self) -> int:
+        self.next_mid = self.next_mid % 0xFFFF + 1
+        return self.next_mid
+
+
+class StubMqttBroker:
+    """
+    MQTT 3.1.1 broker on a free localhost port, run on a daemon thread.
+
+    `max_inflight` caps unacknowledged QoS 1 messages per client (0 means
+    unlimited), like mosquitto's max_inflight_messages. `publish` and
+    `publish_many` inject messages as if a device had published them;
+    `kick` drops every connection to exercise reconnects.
+    """
+
+    def __init__(self, max_inflight: int = 0):
+        self.max_inflight = max_inflight
+        self.sessions: dict[str, _MqttSession] = {}
+        self.published = 0
+        self.acked = 0
+        self.redelivered = 0
+        self.connects = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.server = None
+        self.port = None
+
+    def __enter__(self):
+        self.thread.start()
+        start = asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.server = asyncio.run_coroutine_threadsafe(start, self.loop).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(self, *exc):
+        self.kick()
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+    @property
+    def unacked(self) -> int:
+        return sum(len(s.inflight) + len(s.backlog) for s in self.sessions.values())
+
+    def publish(self, topic: str, payload: bytes, qos: int = 1):
+        self.loop.call_soon_threadsafe(self._route, topic, payload, qos)
+
+    def publish_many(self, messages: list[tuple[str, bytes]], qos: int = 1):
+        def route_all():
+            for topic, payload in messages:
+                self._route(topic, payload, qos)
+
+        self.loop.call_soon_threadsafe(route_all)
+
+    def kick(self):
+        def close_all():
+            for session in self.sessions.values():
+                if session.writer is not None:
+                    session.writer.close()
+                    session.writer = None
+
+        self.loop.call_soon_threadsafe(close_all)
+
+    def _route(self, topic: str, payload: bytes, qos: int):
+        self.published += 1
+        for session in self.sessions.values():
+            granted = max((q for f, q in session.subscriptions.items() if topic_matches_sub(f, topic)), default=None)
+            if granted is not None:
+                self._deliver(session, topic, payload, min(qos, granted))
+
+    def _deliver(self, session: _MqttSession, topic: str, payload: bytes, qos: int):
+        if qos == 0:
+            if session.writer is not None:
+                session.writer.write(_mqtt_publish_packet(topic, payload, 0))
+            return
+        if self.max_inflight and len(session.inflight) >= self.max_inflight:
+            session.backlog.append((topic, payload))
+            return
+        mid = session.new_mid()
+        session.inflight[mid] = (topic, payload)
+        if session.writer is not None:
+            session.writer.write(_mqtt_publish_packet(topic, payload, 1, mid))
+
+    def _connect(self, body: bytes, writer) -> _MqttSession:
+        name_len = struct.unpack_from("!H", body)[0]
+        offset = 2 + name_len + 1  # protocol name, level
+        flags = body[offset]
+        offset += 1 + 2  # flags, keepalive
+        id_len = struct.unpack_from("!H", body, offset)[0]
+        client_id = body[offset + 2:offset + 2 + id_len].decode() or f"anonymous-{id(writer)}"
+
+        session = self.sessions.get(client_id)
+        resumed = session is not None and not flags & 0x02
+        if not resumed:
+            session = self.sessions[client_id] = _MqttSession(client_id)
+        if session.writer is not None:
+            session.writer.close()  # takeover: the newest connection wins
+        session.writer = writer
+        self.connects += 1
+        writer.write(_mqtt_packet(0x20, bytes([1 if resumed else 0, 0])))
+        for mid, (topic, payload) in session.inflight.items():
+            writer.write(_mqtt_publish_packet(topic, payload, 1, mid, dup=True))
+            self.redelivered += 1
+        return session
+
+    def _puback(self, session: _MqttSession, mid: int):
+        if session.inflight.pop(mid, None) is None:
+            return
+        self.acked += 1
+        while session.backlog and len(session.inflight) < self.max_inflight:
+            self._deliver(session, *session.backlog.popleft(), 1)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = None
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, shift = 0, 0
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length |= (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                kind = header >> 4
+
+                if kind == 1:  # CONNECT
+                    session = self._connect(body, writer)
+                elif session is None:
+                    break
+                elif kind == 3:  # PUBLISH
+                    qos = (header >> 1) & 0x03
+                    name_len = struct.unpack_from("!H", body)[0]
+                    topic, offset = body[2:2 + name_len].decode(), 2 + name_len
+                    if qos:
+                        writer.write(_mqtt_packet(0x40, body[offset:offset + 2]))  # PUBACK
+                        offset += 2
+                    self._route(topic, body[offset:], min(qos, 1))
+                elif kind == 4:  # PUBACK
+                    self._puback(session, struct.unpack("!H", body)[0])
+                elif kind == 8:  # SUBSCRIBE
+                    offset, granted = 2, bytearray()
+                    while offset < len(body):
+                        name_len = struct.unpack_from("!H", body, offset)[0]
+                        topic_filter = body[offset + 2:offset + 2 + name_len].decode()
+                        qos = min(body[offset + 2 + name_len], 1)
+                        session.subscriptions[topic_filter] = qos
+                        granted.append(qos)
+                        offset += 3 + name_len
+                    writer.write(_mqtt_packet(0x90, body[:2] + bytes(granted)))
+                elif kind == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if session is not None and session.writer is writer:
+                session.writer = None
+            writer.close()
+
+
+class BackgroundServer:
+    """Run an ASGI app under uvicorn on a free localhost port in a daemon thread."""
+
+    def __init__(self, app, lifespan: str = "off"):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Accepted sockets inherit this; avoids 40 ms delayed-ACK stalls on keep-alive.
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(app, log_level="warning", lifespan=lifespan)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.run(self.server.serve(sockets=[self.sock]))
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
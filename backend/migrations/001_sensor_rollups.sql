@@ -0,0 +1,28 @@
+-- Continuous rollups of sensor_readings, maintained by app/rollups.py.
+-- One row per (plant, resolution, bucket, metric); metric 'rows' only carries
+-- the number of readings in the bucket.
+
+create table if not exists sensor_rollups (
+    plant_id      bigint      not null references plants (id) on delete cascade,
+    resolution    text        not null check (resolution in ('minute', 'hour', 'day')),
+    bucket_start  timestamptz not null,
+    metric        text        not null,
+    "count"       integer     not null,
+    "min"         double precision,
+    "max"         double precision,
+    "sum"         double precision,
+    "last"        double precision,
+    last_at       timestamptz,
+    primary key (plant_id, resolution, bucket_start, metric)
+);
+
+-- Watermark: highest sensor_readings.id already rolled up
+create table if not exists rollup_state (
+    name           text primary key,
+    last_id        bigint not null default 0,
+    covered_until  timestamptz
+);
+
+-- The rollup pass follows sensor_readings by id and re-reads whole minutes per plant
+create index if not exists sensor_readings_plant_timestamp_idx
+    on sensor_readings (plant_id, "timestamp");
@@ -0,0 +1,52 @@
+-- Single-round-trip write paths used by app/writes.py.
+
+-- One light_status row per plant, so toggles can upsert on plant_id.
+-- Keep only the newest row of any duplicates left by the old SELECT-then-INSERT.
+delete from light_status a
+    using light_status b
+    where a.plant_id = b.plant_id
+      and (a.updated_at, a.id) < (b.updated_at, b.id);
+
+alter table light_status
+    add constraint light_status_plant_id_key unique (plant_id);
+
+-- Plant + placeholder sensor reading + default light status in one transaction.
+-- `plant` and `reading` are JSON objects with the columns to insert.
+create or replace function create_plant_with_defaults(plant jsonb, reading jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    new_plant   plants;
+    new_reading sensor_readings;
+    new_light   light_status;
+begin
+    insert into plants (user_id, name, variety, plant_type, image_url)
+    select p.user_id, p.name, p.variety, p.plant_type, p.image_url
+    from jsonb_populate_record(null::plants, plant) p
+    returning * into new_plant;
+
+    insert into sensor_readings (
+        plant_id, soil_moisture, temperature, humidity, light_intensity,
+        nitrogen, phosphorus, potassium, watering_needed, health_status, light_on
+    )
+    select new_plant.id, r.soil_moisture, r.temperature, r.humidity, r.light_intensity,
+           r.nitrogen, r.phosphorus, r.potassium, r.watering_needed, r.health_status, r.light_on
+    from jsonb_populate_record(null::sensor_readings, reading) r
+    returning * into new_reading;
+
+    insert into light_status (plant_id, is_on)
+    values (new_plant.id, false)
+    returning * into new_light;
+
+    return jsonb_build_object(
+        'plant', to_jsonb(new_plant),
+        'reading', to_jsonb(new_reading),
+        'light', to_jsonb(new_light)
+    );
+end;
+$$;
+
+-- Called by the backend with the service role only
+revoke execute on function create_plant_with_defaults(jsonb, jsonb) from public, anon, authenticated;
+grant execute on function create_plant_with_defaults(jsonb, jsonb) to service_role;
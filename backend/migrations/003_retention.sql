@@ -0,0 +1,73 @@
+-- Bounded growth for sensor_readings, used by app/retention.py.
+-- Raw readings are kept for RAW_RETENTION_DAYS and minute rollups for
+-- ROLLUP_MINUTE_RETENTION_DAYS; hour and day rollups are kept forever.
+
+-- "Latest" and history pages read one plant newest first, tie-broken on id.
+-- Replaces the (plant_id, "timestamp") index from 001, which cannot serve the id tie-break.
+create index if not exists sensor_readings_plant_timestamp_id_idx
+    on sensor_readings (plant_id, "timestamp" desc, id desc);
+drop index if exists sensor_readings_plant_timestamp_idx;
+
+-- Pruning finds old rows by time across all plants; readings arrive roughly
+-- in time order, so a BRIN index is enough and stays tiny
+create index if not exists sensor_readings_timestamp_brin_idx
+    on sensor_readings using brin ("timestamp");
+
+create index if not exists sensor_rollups_resolution_bucket_idx
+    on sensor_rollups (resolution, bucket_start);
+
+-- Delete up to `batch_size` readings older than `cutoff` that the rollups
+-- have already consumed (id <= max_id). A plant's newest reading is always
+-- kept so "latest" still answers for plants that went quiet.
+-- Returns the number of rows deleted; call again until it is below batch_size.
+create or replace function prune_sensor_readings(cutoff timestamptz, max_id bigint, batch_size integer default 5000)
+returns integer
+language plpgsql
+as $$
+declare
+    deleted integer;
+begin
+    delete from sensor_readings s
+    where (s.id, s."timestamp") in (
+        select r.id, r."timestamp"
+        from sensor_readings r
+        where r."timestamp" < cutoff
+          and r.id <= max_id
+          and exists (
+              select 1 from sensor_readings n
+              where n.plant_id = r.plant_id
+                and (n."timestamp", n.id) > (r."timestamp", r.id)
+          )
+        limit batch_size
+    );
+    get diagnostics deleted = row_count;
+    return deleted;
+end;
+$$;
+
+-- Delete up to `batch_size` rollup buckets of one resolution that start before `cutoff`.
+create or replace function prune_sensor_rollups(resolution text, cutoff timestamptz, batch_size integer default 5000)
+returns integer
+language plpgsql
+as $$
+declare
+    deleted integer;
+begin
+    delete from sensor_rollups s
+    where (s.plant_id, s.resolution, s.bucket_start, s.metric) in (
+        select r.plant_id, r.resolution, r.bucket_start, r.metric
+        from sensor_rollups r
+        where r.resolution = prune_sensor_rollups.resolution
+          and r.bucket_start < cutoff
+        limit batch_size
+    );
+    get diagnostics deleted = row_count;
+    return deleted;
+end;
+$$;
+
+-- Called by the backend with the service role only
+revoke execute on function prune_sensor_readings(timestamptz, bigint, integer) from public, anon, authenticated;
+grant execute on function prune_sensor_readings(timestamptz, bigint, integer) to service_role;
+revoke execute on function prune_sensor_rollups(text, timestamptz, integer) from public, anon, authenticated;
+grant execute on function prune_sensor_rollups(text, timestamptz, integer) to service_role;
@@ -0,0 +1,154 @@
+-- Optional: partition sensor_readings by month on "timestamp" (needs 003).
+-- With partitions in place app/retention.py drops whole months past the raw
+-- window instead of deleting them row by row, and creates upcoming months
+-- ahead of time. Readings outside every month land in sensor_readings_default
+-- and are moved into their month the next time partitions are ensured.
+--
+-- Run in a maintenance window: every reading is copied inside one
+-- transaction with writes blocked. The old table is kept as
+-- sensor_readings_unpartitioned; drop it once the copy is verified.
+-- Row level security policies are not copied: recreate any you rely on.
+
+begin;
+
+lock table sensor_readings in access exclusive mode;
+
+alter table sensor_readings rename to sensor_readings_unpartitioned;
+alter index if exists sensor_readings_pkey rename to sensor_readings_unpartitioned_pkey;
+alter index if exists sensor_readings_plant_timestamp_id_idx rename to sensor_readings_unpartitioned_plant_timestamp_id_idx;
+alter index if exists sensor_readings_timestamp_brin_idx rename to sensor_readings_unpartitioned_timestamp_brin_idx;
+
+create table sensor_readings (
+    like sensor_readings_unpartitioned including defaults including constraints including identity including generated
+) partition by range ("timestamp");
+
+-- The partition key has to be part of the primary key
+alter table sensor_readings add primary key (id, "timestamp");
+create index sensor_readings_plant_timestamp_id_idx on sensor_readings (plant_id, "timestamp" desc, id desc);
+create table sensor_readings_default partition of sensor_readings default;
+
+do $$
+declare
+    next_id bigint;
+    id_seq  text := pg_get_serial_sequence('sensor_readings_unpartitioned', 'id');
+    fk      record;
+begin
+    -- New ids continue after the copied ones
+    select coalesce(max(id), 0) + 1 into next_id from sensor_readings_unpartitioned;
+    if exists (
+        select 1 from pg_attribute
+        where attrelid = 'sensor_readings'::regclass and attname = 'id' and attidentity <> ''
+    ) then
+        execute format('alter table sensor_readings alter column id restart with %s', next_id);
+    elsif id_seq is not null then
+        -- serial id: keep the same sequence, so it survives dropping the old table
+        execute format('alter sequence %s owned by sensor_readings.id', id_seq);
+    end if;
+
+    -- Same foreign keys (e.g. plants on delete cascade) as before
+    for fk in
+        select conname, pg_get_constraintdef(oid) as definition
+        from pg_constraint
+        where conrelid = 'sensor_readings_unpartitioned'::regclass and contype = 'f'
+    loop
+        execute format('alter table sensor_readings add constraint %I %s', fk.conname || '_part', fk.definition);
+    end loop;
+
+    if (select relrowsecurity from pg_class where oid = 'sensor_readings_unpartitioned'::regclass) then
+        alter table sensor_readings enable row level security;
+    end if;
+end;
+$$;
+
+-- Monthly partitions (UTC) from the month of `since` (or of the oldest row
+-- waiting in the default partition) through `months_ahead` months from now.
+-- Returns the number of partitions created.
+create or replace function ensure_sensor_partitions(since timestamptz default now(), months_ahead integer default 2)
+returns integer
+language plpgsql
+as $$
+declare
+    oldest  timestamptz;
+    month   timestamp;
+    through timestamp;
+    lo      timestamptz;
+    hi      timestamptz;
+    part    text;
+    created integer := 0;
+begin
+    select min("timestamp") into oldest from sensor_readings_default;
+    month := date_trunc('month', least(since, coalesce(oldest, since)) at time zone 'UTC');
+    through := date_trunc('month', now() at time zone 'UTC') + make_interval(months => months_ahead);
+    while month <= through loop
+        part := 'sensor_readings_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM');
+        if to_regclass(part) is null then
+            lo := month at time zone 'UTC';
+            hi := (month + interval '1 month') at time zone 'UTC';
+            execute format('create table %I (like sensor_readings including defaults including constraints)', part);
+            -- A month cannot be attached while the default partition holds rows for it
+            execute format(
+                'with moved as (delete from sensor_readings_default where "timestamp" >= $1 and "timestamp" < $2 returning *) '
+                'insert into %I select * from moved',
+                part
+            ) using lo, hi;
+            execute format('alter table sensor_readings attach partition %I for values from (%L) to (%L)', part, lo, hi);
+            created := created + 1;
+        end if;
+        month := month + interval '1 month';
+    end loop;
+    return created;
+end;
+$$;
+
+-- Detach and drop monthly partitions that end on or before `cutoff`, as long
+-- as every row in them is rolled up (id <= max_id) and none is a plant's
+-- newest reading. Anything left over is pruned row by row by
+-- prune_sensor_readings(). Returns the number of partitions dropped.
+create or replace function drop_sensor_partitions(cutoff timestamptz, max_id bigint)
+returns integer
+language plpgsql
+as $$
+declare
+    part    record;
+    hi      timestamptz;
+    blocked boolean;
+    dropped integer := 0;
+begin
+    for part in
+        select c.relname
+        from pg_inherits i
+        join pg_class c on c.oid = i.inhrelid
+        where i.inhparent = 'sensor_readings'::regclass
+          and c.relname ~ '^sensor_readings_y[0-9]{4}m[0-9]{2}$'
+        order by c.relname
+    loop
+        hi := (make_timestamp(substr(part.relname, 18, 4)::int, substr(part.relname, 23, 2)::int, 1, 0, 0, 0)
+               + interval '1 month') at time zone 'UTC';
+        exit when hi > cutoff;
+        execute format(
+            'select exists (select 1 from %1$I where id > $1) '
+            'or exists (select 1 from (select distinct plant_id from %1$I) p where not exists ('
+            '    select 1 from sensor_readings n where n.plant_id = p.plant_id and n."timestamp" >= $2))',
+            part.relname
+        ) into blocked using max_id, hi;
+        continue when blocked;
+        execute format('alter table sensor_readings detach partition %I', part.relname);
+        execute format('drop table %I', part.relname);
+        dropped := dropped + 1;
+    end loop;
+    return dropped;
+end;
+$$;
+
+select ensure_sensor_partitions(coalesce((select min("timestamp") from sensor_readings_unpartitioned), now()));
+
+insert into sensor_readings overriding system value
+select * from sensor_readings_unpartitioned;
+
+-- Called by the backend with the service role only
+revoke execute on function ensure_sensor_partitions(timestamptz, integer) from public, anon, authenticated;
+grant execute on function ensure_sensor_partitions(timestamptz, integer) to service_role;
+revoke execute on function drop_sensor_partitions(timestamptz, bigint) from public, anon, authenticated;
+grant execute on function drop_sensor_partitions(timestamptz, bigint) to service_role;
+
+commit;
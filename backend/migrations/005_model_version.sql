@@ -0,0 +1,4 @@
+-- Which model version scored each reading (app/ml/registry.py).
+-- Null when the device sent its own predictions or the row predates this column.
+-- On a partitioned sensor_readings (004) the column is added to every partition.
+alter table sensor_readings add column if not exists model_version text;
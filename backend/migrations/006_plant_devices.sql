@@ -0,0 +1,46 @@
+-- Plant → ThingsBoard device routing and zones for bulk controls (app/devices.py).
+-- Plants left without a device_id keep using THINGSBOARD_DEVICE_ID.
+
+alter table plants add column if not exists device_id text;
+alter table plants add column if not exists zone text;
+
+create index if not exists plants_user_id_zone_idx on plants (user_id, zone);
+
+-- 002's create_plant_with_defaults, now also storing device_id and zone
+create or replace function create_plant_with_defaults(plant jsonb, reading jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    new_plant   plants;
+    new_reading sensor_readings;
+    new_light   light_status;
+begin
+    insert into plants (user_id, name, variety, plant_type, image_url, device_id, zone)
+    select p.user_id, p.name, p.variety, p.plant_type, p.image_url, p.device_id, p.zone
+    from jsonb_populate_record(null::plants, plant) p
+    returning * into new_plant;
+
+    insert into sensor_readings (
+        plant_id, soil_moisture, temperature, humidity, light_intensity,
+        nitrogen, phosphorus, potassium, watering_needed, health_status, light_on
+    )
+    select new_plant.id, r.soil_moisture, r.temperature, r.humidity, r.light_intensity,
+           r.nitrogen, r.phosphorus, r.potassium, r.watering_needed, r.health_status, r.light_on
+    from jsonb_populate_record(null::sensor_readings, reading) r
+    returning * into new_reading;
+
+    insert into light_status (plant_id, is_on)
+    values (new_plant.id, false)
+    returning * into new_light;
+
+    return jsonb_build_object(
+        'plant', to_jsonb(new_plant),
+        'reading', to_jsonb(new_reading),
+        'light', to_jsonb(new_light)
+    );
+end;
+$$;
+
+revoke execute on function create_plant_with_defaults(jsonb, jsonb) from public, anon, authenticated;
+grant execute on function create_plant_with_defaults(jsonb, jsonb) to service_role;
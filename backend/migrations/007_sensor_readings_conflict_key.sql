@@ -0,0 +1,12 @@
+-- Conflict target for prediction write-backs (app/backfill.py), which upsert
+-- on (id, "timestamp"). A table partitioned by 004 already has that primary
+-- key; an unpartitioned one, whose primary key is id alone, gets a matching
+-- unique index.
+
+do $$
+begin
+    if (select relkind from pg_class where oid = 'sensor_readings'::regclass) = 'r' then
+        create unique index if not exists sensor_readings_id_timestamp_key on sensor_readings (id, "timestamp");
+    end if;
+end
+$$;
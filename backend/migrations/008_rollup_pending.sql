@@ -0,0 +1,5 @@
+-- Ids the rollup watermark passed before they were committed (app/rollups.py).
+-- Each entry is [first id, last id, epoch seconds first seen]; the rollup pass
+-- looks them up again until ROLLUP_LAG_SECONDS have gone by.
+
+alter table rollup_state add column if not exists pending jsonb not null default '[]'::jsonb;
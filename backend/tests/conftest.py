@@ -0,0 +1,39 @@
+"""
+Tests run from backend/ (`python -m pytest tests`). app.database builds its
+client at import time, so one StubPostgrest is started for the session
+before any app module is imported; the `postgrest` fixture hands it to a
+test with empty tables. `api` runs the app's lifespan once per session:
+shutting it down closes the shared database client.
+"""
+
+import os
+
+import pytest
+
+from benchmarks.stubs import FAKE_JWT_SECRET, FAKE_SERVICE_KEY, BackgroundServer, StubPostgrest
+
+stub = StubPostgrest()
+server = BackgroundServer(stub.app).__enter__()
+
+os.environ.update(
+    SUPABASE_URL=server.url,
+    SUPABASE_SERVICE_ROLE_KEY=FAKE_SERVICE_KEY,
+    SUPABASE_JWT_SECRET=FAKE_JWT_SECRET,
+    ROLLUP_ENABLED="false",
+)
+
+
+@pytest.fixture
+def postgrest() -> StubPostgrest:
+    stub.tables.clear()
+    return stub
+
+
+@pytest.fixture(scope="session")
+def api():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
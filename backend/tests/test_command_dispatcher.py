@@ -0,0 +1,49 @@
+import asyncio
+
+from app.mqtt.commands import WATER_COMMAND, CommandDispatcher, CommandRateLimited
+
+WATER = {"light_on": False, "water_plant": True}
+
+
+async def noop(command):
+    pass
+
+
+def run_dispatcher(check):
+    async def main():
+        dispatcher = CommandDispatcher(send=noop, workers=1, water_interval=60)
+        await dispatcher.start()
+        try:
+            check(dispatcher)
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(main())
+
+
+def test_water_limit_is_per_plant_on_a_shared_device():
+    # Plants without their own device all fall back to the same device id
+    def check(dispatcher):
+        dispatcher.submit("shared", WATER_COMMAND, WATER, plant_ids=["1"])
+        dispatcher.submit("shared", WATER_COMMAND, WATER, plant_ids=["2"])
+        assert dispatcher.water_retry_after("shared", ["1"]) > 0
+        assert dispatcher.water_retry_after("shared", ["3"]) == 0
+        try:
+            dispatcher.submit("shared", WATER_COMMAND, WATER, plant_ids=["1"])
+        except CommandRateLimited as e:
+            assert 0 < e.retry_after <= 60
+        else:
+            raise AssertionError("second water command for plant 1 was accepted")
+
+    run_dispatcher(check)
+
+
+def test_submit_many_limits_devices_with_a_recently_watered_plant():
+    def check(dispatcher):
+        dispatcher.submit("esp-a", WATER_COMMAND, WATER, plant_ids=["1"])
+        submitted = dispatcher.submit_many({"esp-a": ["1", "2"], "esp-b": ["3"]}, WATER_COMMAND, WATER)
+        assert isinstance(submitted["esp-a"], CommandRateLimited)
+        assert not isinstance(submitted["esp-b"], CommandRateLimited)
+        assert dispatcher.water_retry_after("esp-b", ["3"]) > 0
+
+    run_dispatcher(check)
@@ -0,0 +1,162 @@
+"""
+app.mqtt.subscriber against benchmarks.stubs.StubMqttBroker, with a real
+paho client and the database write replaced by a fake.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+
+import pytest
+
+from app.mqtt import subscriber
+from app.mqtt.subscriber import MqttSubscriber
+from benchmarks.stubs import StubMqttBroker
+
+TOPIC = "plantpulse/dev1/telemetry"
+READING = json.dumps({"plant_id": 1, "soil_moisture": 40.0}).encode()
+client_ids = itertools.count()
+
+
+class FakeStore:
+    """
+    Stands in for app.ingest.write_readings: `fail` makes every insert fail
+    transiently, `refuse` has the database reject (dead-letter) every row.
+    """
+
+    def __init__(self, broker: StubMqttBroker):
+        self.broker = broker
+        self.fail = False
+        self.refuse = False
+        self.release = None  # an asyncio.Event to hold inserts until it is set
+        self.rows = []
+        self.acked_before_insert = []
+
+    async def write_readings(self, rows, table="sensor_readings"):
+        self.acked_before_insert.append(self.broker.acked)
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            return [], rows
+        if self.refuse:
+            return [], []
+        self.rows += rows
+        return rows, []
+
+
+@pytest.fixture
+def broker():
+    with StubMqttBroker() as broker:
+        yield broker
+
+
+@pytest.fixture
+def store(broker, monkeypatch):
+    store = FakeStore(broker)
+
+    async def annotate(rows):
+        pass
+
+    monkeypatch.setattr(subscriber, "write_readings", store.write_readings)
+    monkeypatch.setattr(subscriber, "publish_readings", lambda rows: None)
+    monkeypatch.setattr(subscriber.inference, "annotate", annotate)
+    return store
+
+
+async def wait_for(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def run(broker: StubMqttBroker, scenario, **options):
+    """Run `scenario(sub)` with a subscriber connected to `broker`, then stop it."""
+    sub = MqttSubscriber(
+        broker="127.0.0.1", port=broker.port, client_id=f"test-{next(client_ids)}", flush_interval=0.02, **options
+    )
+
+    async def main():
+        await sub.start()
+        try:
+            await asyncio.to_thread(sub.subscribed.wait, 5)
+            await scenario(sub)
+        finally:
+            await sub.stop()
+
+    asyncio.run(main())
+    return sub
+
+
+def test_acks_only_after_insert(broker, store):
+    async def scenario(sub):
+        broker.publish_many([(TOPIC, READING)] * 5)
+        await wait_for(lambda: broker.acked == 5)
+
+    sub = run(broker, scenario)
+    assert len(store.rows) == 5
+    assert store.acked_before_insert[0] == 0
+    assert sub.stored == 5
+    assert broker.unacked == 0
+
+
+def test_no_ack_while_insert_fails(broker, store):
+    store.fail = True
+
+    async def scenario(sub):
+        broker.publish_many([(TOPIC, READING)] * 3)
+        await wait_for(lambda: len(store.acked_before_insert) >= 1)
+        await asyncio.sleep(0.3)
+        assert broker.acked == 0
+        assert broker.unacked == 3
+        assert sub.stored == 0
+        # Once the database is back, the retry stores and acknowledges the batch
+        store.fail = False
+        await wait_for(lambda: broker.acked == 3)
+
+    sub = run(broker, scenario)
+    assert sub.insert_retries >= 1
+    assert len(store.rows) == 3
+
+
+def test_refused_rows_are_acked(broker, store):
+    store.refuse = True
+
+    async def scenario(sub):
+        broker.publish_many([(TOPIC, READING)] * 3)
+        await wait_for(lambda: broker.acked == 3)
+
+    sub = run(broker, scenario)
+    assert sub.insert_retries == 0
+    assert sub.stored == 0
+
+
+def test_invalid_messages_are_acked(broker, store):
+    async def scenario(sub):
+        broker.publish(TOPIC, b"not json")
+        broker.publish(TOPIC, json.dumps({"soil_moisture": 1}).encode())
+        await wait_for(lambda: broker.acked == 2)
+
+    sub = run(broker, scenario)
+    assert sub.rejected == 2
+    assert store.rows == []
+
+
+def test_qos0_dropped_when_buffer_full(broker, store):
+    async def scenario(sub):
+        store.release = asyncio.Event()
+        try:
+            broker.publish(TOPIC, READING, qos=0)
+            await wait_for(lambda: len(store.acked_before_insert) == 1)
+            # The first message is held by the blocked insert; two more fit in the buffer
+            broker.publish_many([(TOPIC, READING)] * 10, qos=0)
+            await wait_for(lambda: sub.received == 11)
+            await wait_for(lambda: sub.dropped == 8)
+        finally:
+            store.release.set()
+        await wait_for(lambda: sub.stored == 3)
+
+    sub = run(broker, scenario, buffer_size=2, batch_size=1)
+    assert sub.dropped == 8
+    assert broker.acked == 0
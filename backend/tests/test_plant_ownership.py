@@ -0,0 +1,52 @@
+"""Every /{plant_id} route answers 404 for a plant the caller does not own."""
+
+import pytest
+from app.cache import latest_cache
+from benchmarks.stubs import FAKE_USER_ID, make_access_token
+
+OTHER_USER_ID = "00000000-0000-0000-0000-000000000002"
+
+ROUTES = [
+    ("GET", "/sensor-data/{plant_id}"),
+    ("GET", "/sensor-data/{plant_id}/history"),
+    ("GET", "/sensor-data/{plant_id}/export"),
+    ("GET", "/sensor-data/{plant_id}/nutrients"),
+    ("POST", "/sensor-data/{plant_id}/rescore"),
+    ("GET", "/controls/light/{plant_id}"),
+    ("POST", "/controls/light/{plant_id}"),
+    ("POST", "/controls/water/{plant_id}"),
+    ("GET", "/plants/{plant_id}/analytics"),
+]
+
+
+@pytest.fixture
+def client(api, postgrest):
+    postgrest.insert_rows("plants", [
+        {"id": 1, "user_id": FAKE_USER_ID, "name": "mine"},
+        {"id": 2, "user_id": OTHER_USER_ID, "name": "theirs"},
+    ])
+    postgrest.insert_rows("sensor_readings", [{"plant_id": 1, "soil_moisture": 40.0}])
+    latest_cache._entries.clear()
+    api.headers["Authorization"] = f"Bearer {make_access_token()}"
+    return api
+
+
+@pytest.mark.parametrize("method,path", ROUTES)
+def test_other_users_plant_is_not_found(client, method, path):
+    response = client.request(method, path.format(plant_id=2), json={"is_on": True})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("plant_id", [2, 999])
+def test_stream_checks_owner(client, plant_id):
+    response = client.get(f"/sensor-data/{plant_id}/stream", params={"access_token": make_access_token()})
+    assert response.status_code == 404
+
+
+def test_own_plant(client):
+    assert client.get("/sensor-data/1").json()["soil_moisture"] == 40.0
+    command_id = client.post("/controls/light/1", json={"is_on": True}).json()["command_id"]
+    assert client.get(f"/controls/commands/{command_id}").status_code == 200
+    other = {"Authorization": f"Bearer {make_access_token(OTHER_USER_ID)}"}
+    assert client.get(f"/controls/commands/{command_id}", headers=other).status_code == 404
+    assert client.get("/sensor-data/1", headers=other).status_code == 404
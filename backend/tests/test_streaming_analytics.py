@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+from app.ml.streaming import StreamingAnalytics
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def reading(plant_id, seconds, **values):
+    return {"plant_id": plant_id, "timestamp": (START + timedelta(seconds=seconds)).isoformat(), **values}
+
+
+def test_spike_and_stuck_sensor():
+    analytics = StreamingAnalytics(warmup=5, stuck_seconds=60)
+    analytics.observe([reading(1, 10 * i, temperature=20.0 + i % 2 * 0.5, humidity=55.0) for i in range(10)])
+    analytics.observe([reading(1, 100, temperature=35.0, humidity=55.0)])
+    snapshot = analytics.snapshot(1)
+    assert snapshot["readings"] == 11
+    assert snapshot["metrics"]["temperature"]["spike"]
+    assert snapshot["metrics"]["humidity"]["stuck"]
+    assert {a["kind"] for a in snapshot["anomalies"]} == {"spike", "stuck"}
+
+
+def test_out_of_order_and_unknown_plants():
+    analytics = StreamingAnalytics()
+    # A batch in any order is applied oldest first; a replayed reading is ignored
+    analytics.observe([reading(1, 20, soil_moisture=50.0), reading(1, 10, soil_moisture=60.0)])
+    analytics.observe([reading(1, 10, soil_moisture=99.0)])
+    snapshot = analytics.snapshot(1)
+    assert snapshot["readings"] == 2
+    assert snapshot["metrics"]["soil_moisture"]["last"] == 50.0
+    assert analytics.snapshot(2) is None
+    analytics.forget(1)
+    assert analytics.snapshot(1) is None and analytics.plant_count == 0
+
+
+def test_drying_forecast_restarts_after_watering():
+    analytics = StreamingAnalytics(min_trend_hours=0.5, dry_threshold=30)
+    # Drying by 2 points per hour, one reading every 10 minutes for 3 hours
+    analytics.observe([reading(1, 600 * i, soil_moisture=60.0 - i / 3) for i in range(19)])
+    forecast = analytics.snapshot(1)["forecast"]
+    assert abs(forecast["soil_moisture_per_hour"] + 2) < 0.01
+    assert abs(forecast["hours_until_dry"] - 12) < 0.1
+
+    analytics.observe([reading(1, 600 * 19, soil_moisture=80.0)])
+    assert analytics.snapshot(1)["forecast"]["soil_moisture_per_hour"] is None
@@ -0,0 +1,131 @@
+"""app.mqtt.publisher.ThingsBoardClient against benchmarks.stubs.StubThingsBoard."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.mqtt import publisher
+from app.mqtt.publisher import ThingsBoardClient
+from benchmarks.stubs import BackgroundServer, StubThingsBoard
+
+PARAMS = {"light_on": True, "water_plant": False}
+
+
+@pytest.fixture
+def thingsboard(monkeypatch):
+    monkeypatch.setattr(publisher, "RPC_BACKOFF_BASE", 0.01)
+    stub = StubThingsBoard()
+    with BackgroundServer(stub.app) as server:
+        stub.url = server.url
+        yield stub
+
+
+def send(stub: StubThingsBoard, *calls, **client_options):
+    """Run `calls` (coroutine functions taking the client) concurrently on a fresh client."""
+    client = ThingsBoardClient(base_url=stub.url, username="tenant", password="secret", **client_options)
+
+    async def main():
+        try:
+            return await asyncio.gather(*(call(client) for call in calls), return_exceptions=True)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main()), client
+
+
+def rpc(idempotent: bool = True):
+    return lambda client: client.send_rpc("dev1", "setControl", PARAMS, idempotent=idempotent)
+
+
+def test_concurrent_calls_share_one_login(thingsboard):
+    results, client = send(thingsboard, *[rpc()] * 20)
+    assert all(isinstance(r, httpx.Response) and r.status_code == 200 for r in results)
+    assert thingsboard.login_count == client.login_count == 1
+    assert len(thingsboard.rpc_calls) == 20
+
+
+def test_stale_token_refreshed_once(thingsboard):
+    async def twice(client):
+        await asyncio.gather(*(rpc()(client) for _ in range(10)))
+        client._token_exp = 0.0  # the cached token is about to expire
+        await asyncio.gather(*(rpc()(client) for _ in range(10)))
+
+    results, client = send(thingsboard, twice)
+    assert results == [None]
+    assert thingsboard.login_count == 2
+
+
+def test_revoked_token_logs_in_again(thingsboard):
+    async def call(client):
+        await client.get_token()
+        client._token = "revoked"
+        return await rpc()(client)
+
+    results, _ = send(thingsboard, call)
+    assert results[0].status_code == 200
+    assert thingsboard.login_count == 2
+
+
+def test_gateway_timeout_retried_for_idempotent_rpc(thingsboard):
+    thingsboard.fail_next.extend([504, 503])
+    results, _ = send(thingsboard, rpc(idempotent=True))
+    assert results[0].status_code == 200
+    assert len(thingsboard.rpc_calls) == 3
+
+
+def test_gateway_timeout_not_retried_for_water(thingsboard):
+    thingsboard.fail_next.append(504)
+    results, _ = send(thingsboard, rpc(idempotent=False))
+    assert isinstance(results[0], httpx.HTTPStatusError)
+    assert results[0].response.status_code == 504
+    assert len(thingsboard.rpc_calls) == 1
+
+
+def test_rate_limit_retried_for_water(thingsboard):
+    thingsboard.fail_next.append(429)
+    results, _ = send(thingsboard, rpc(idempotent=False))
+    assert results[0].status_code == 200
+    assert len(thingsboard.rpc_calls) == 2
+
+
+def test_gives_up_after_max_attempts(thingsboard):
+    thingsboard.fail_next.extend([503] * 5)
+    results, _ = send(thingsboard, rpc(), max_attempts=3)
+    assert isinstance(results[0], httpx.HTTPStatusError)
+    assert len(thingsboard.rpc_calls) == 3
+
+
+def test_connect_error_retried_for_water(monkeypatch):
+    monkeypatch.setattr(publisher, "RPC_BACKOFF_BASE", 0.01)
+    attempts = []
+
+    def refuse(request):
+        attempts.append(request.url.path)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    client = ThingsBoardClient(base_url="http://thingsboard", max_attempts=3)
+    client._client = httpx.AsyncClient(base_url="http://thingsboard", transport=httpx.MockTransport(refuse))
+    client._token, client._token_exp = "token", float("inf")
+
+    async def main():
+        try:
+            await client.send_rpc("dev1", "setControl", PARAMS, idempotent=False)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(main())
+    assert len(attempts) == 3
+
+
+@pytest.mark.parametrize("water_plant", [False, True])
+def test_water_command_is_not_idempotent(monkeypatch, water_plant):
+    sent = []
+
+    async def send_rpc(device_id, method, params, oneway=True, idempotent=True):
+        sent.append(idempotent)
+
+    monkeypatch.setattr(publisher.thingsboard, "send_rpc", send_rpc)
+    asyncio.run(publisher.send_rpc_command("dev1", light_on=True, water_plant=water_plant))
+    assert sent == [not water_plant]
@@ -16,6 +16,22 @@ export async function getPlants() {
   return res.json()
 }
 
+// Plants with their latest reading and light state, in one request
+export async function getDashboard() {
+  const headers = await getAuthHeader()
+  const res = await fetch(`${BACKEND_URL}/dashboard`, { headers })
+  if (!res.ok) throw new Error('Failed to fetch dashboard')
+  return res.json()
+}
+
+// { plant, sensor, light } for the plant detail page, in one request
+export async function getPlantOverview(plantId) {
+  const headers = await getAuthHeader()
+  const res = await fetch(`${BACKEND_URL}/plants/${plantId}/overview`, { headers })
+  if (!res.ok) throw new Error('Failed to fetch plant')
+  return res.json()
+}
+
 export async function getPlant(plantId) {
   const headers = await getAuthHeader()
   const res = await fetch(`${BACKEND_URL}/plants/${plantId}`, { headers })
@@ -50,6 +66,25 @@ export async function getLatestSensorData(plantId) {
   return res.json()
 }
 
+// Live readings over Server-Sent Events. Calls onReading for each new reading
+// and returns a function that closes the stream.
+export function subscribeSensorData(plantId, onReading) {
+  let source = null
+  let closed = false
+
+  supabase.auth.getSession().then(({ data: { session } }) => {
+    if (closed) return
+    const token = encodeURIComponent(session?.access_token || '')
+    source = new EventSource(`${BACKEND_URL}/sensor-data/${plantId}/stream?access_token=${token}`)
+    source.addEventListener('reading', (event) => onReading(JSON.parse(event.data)))
+  })
+
+  return () => {
+    closed = true
+    source?.close()
+  }
+}
+
 // ── Controls ────────────────────────────────────────────────
 
 export async function getLightStatus(plantId) {
@@ -1,4 +1,12 @@
-function getNPKStatus(type, value) {
+const statusStyles = {
+  low:     { label: 'Low',    style: 'bg-red-50 text-red-600 border-red-200' },
+  high:    { label: 'Excess', style: 'bg-orange-50 text-orange-600 border-orange-200' },
+  optimal: { label: 'Good',   style: 'bg-forest-50 text-forest-700 border-forest-200' },
+}
+
+// Prefer the backend's classification (thresholds from the ML metadata); fall back to local ranges
+function getNPKStatus(type, value, serverStatus) {
+  if (serverStatus && statusStyles[serverStatus]) return statusStyles[serverStatus]
   const ranges = {
     nitrogen:   { low: 40, high: 120 },
     phosphorus: { low: 10, high: 40 },
@@ -6,13 +14,13 @@ function getNPKStatus(type, value) {
   }
   const r = ranges[type]
   if (value === null || value === undefined) return { label: '—', style: 'bg-earth-50 text-earth-400 border-earth-100' }
-  if (value < r.low) return { label: 'Low', style: 'bg-red-50 text-red-600 border-red-200' }
-  if (value > r.high) return { label: 'Excess', style: 'bg-orange-50 text-orange-600 border-orange-200' }
-  return { label: 'Good', style: 'bg-forest-50 text-forest-700 border-forest-200' }
+  if (value < r.low) return statusStyles.low
+  if (value > r.high) return statusStyles.high
+  return statusStyles.optimal
 }
 
-function NPKRow({ label, symbol, value, type }) {
-  const status = getNPKStatus(type, value)
+function NPKRow({ label, symbol, value, type, serverStatus }) {
+  const status = getNPKStatus(type, value, serverStatus)
   return (
     <div className="flex items-center justify-between py-3 border-b border-earth-50 last:border-0">
       <div className="flex items-center gap-3">
@@ -31,14 +39,14 @@ function NPKRow({ label, symbol, value, type }) {
   )
 }
 
-export default function NPKStatus({ nitrogen, phosphorus, potassium }) {
+export default function NPKStatus({ nitrogen, phosphorus, potassium, status }) {
   return (
     <div className="bg-white rounded-3xl border border-earth-100 p-5">
       <h3 className="font-display text-lg font-semibold text-forest-900 mb-1">Nutrient Levels</h3>
       <p className="text-xs text-earth-400 mb-4">NPK soil analysis</p>
-      <NPKRow label="Nitrogen" symbol="N" value={nitrogen} type="nitrogen" />
-      <NPKRow label="Phosphorus" symbol="P" value={phosphorus} type="phosphorus" />
-      <NPKRow label="Potassium" symbol="K" value={potassium} type="potassium" />
+      <NPKRow label="Nitrogen" symbol="N" value={nitrogen} type="nitrogen" serverStatus={status?.nitrogen} />
+      <NPKRow label="Phosphorus" symbol="P" value={phosphorus} type="phosphorus" serverStatus={status?.phosphorus} />
+      <NPKRow label="Potassium" symbol="K" value={potassium} type="potassium" serverStatus={status?.potassium} />
     </div>
   )
 }
@@ -3,7 +3,7 @@ import { useNavigate } from 'react-router-dom'
 import Navbar from '../components/Navbar'
 import AddPlantModal from '../components/AddPlantModal'
 import PlantCard from '../components/PlantCard'
-import { getPlants } from '../api'
+import { getDashboard } from '../api'
 
 export default function Dashboard({ session }) {
   const navigate = useNavigate()
@@ -14,8 +14,8 @@ export default function Dashboard({ session }) {
 
   async function fetchPlants() {
     try {
-      const data = await getPlants()
-      setPlants(data)
+      const data = await getDashboard()
+      setPlants(data.plants)
     } catch (err) {
       setError('Failed to load plants')
     } finally {
@@ -4,7 +4,7 @@ import Navbar from '../components/Navbar'
 import SensorCard from '../components/SensorCard'
 import NPKStatus from '../components/NPKStatus'
 import LightToggle from '../components/LightToggle'
-import { getPlant, getLatestSensorData, getLightStatus, toggleLight, triggerWater } from '../api'
+import { getPlantOverview, toggleLight, triggerWater, subscribeSensorData } from '../api'
 
 const healthConfig = {
   'Healthy':         { bg: 'bg-forest-100', text: 'text-forest-700', dot: 'bg-forest-500', icon: '✅' },
@@ -29,11 +29,7 @@ export default function PlantDetail({ session }) {
   useEffect(() => {
     async function load() {
       try {
-        const [plantData, sensorData, lightData] = await Promise.all([
-          getPlant(id),
-          getLatestSensorData(id),
-          getLightStatus(id),
-        ])
+        const { plant: plantData, sensor: sensorData, light: lightData } = await getPlantOverview(id)
         setPlant(plantData)
         setSensor(sensorData)
         setLightOn(lightData?.is_on || false)
@@ -52,19 +48,16 @@ export default function PlantDetail({ session }) {
     }
     load()
 
-    // Poll sensor data every 30 seconds for near-realtime updates
-    const interval = setInterval(async () => {
-      try {
-        const sensorData = await getLatestSensorData(id)
-        setSensor(sensorData)
-        // Update last watered from sensor timestamp when watering_needed is true
-        if (sensorData?.watering_needed && sensorData?.timestamp) {
-          setLastWatered(sensorData.timestamp)
-        }
-      } catch {}
-    }, 30000)
+    // Live sensor updates pushed by the backend as readings are ingested
+    const unsubscribe = subscribeSensorData(id, (sensorData) => {
+      setSensor(prev => ({ ...prev, ...sensorData }))
+      // Update last watered from sensor timestamp when watering_needed is true
+      if (sensorData?.watering_needed && sensorData?.timestamp) {
+        setLastWatered(sensorData.timestamp)
+      }
+    })
 
-    return () => clearInterval(interval)
+    return unsubscribe
   }, [id])
 
   async function handleLightToggle() {
@@ -207,6 +200,7 @@ export default function PlantDetail({ session }) {
             nitrogen={sensor?.nitrogen}
             phosphorus={sensor?.phosphorus}
             potassium={sensor?.potassium}
+            status={sensor?.nutrient_status}
           />
 
           {/* Controls */}
@@ -1,7 +1,15 @@
 from pathlib import Path
 import json
 import numpy as np
-import tensorflow as tf
+
+# Lightweight interpreters first; full TensorFlow only as a last resort
+try:
+    from ai_edge_litert.interpreter import Interpreter
+except ImportError:
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
 
 BASE_DIR = Path(__file__).resolve().parent
 WATERING_TFLITE = BASE_DIR / "watering_model_float32.tflite"
@@ -18,7 +26,7 @@ def load_metadata():
     return {}
 
 
-def run_tflite(interpreter: tf.lite.Interpreter, x_float: np.ndarray):
+def run_tflite(interpreter: Interpreter, x_float: np.ndarray):
     input_details = interpreter.get_input_details()[0]
     output_details = interpreter.get_output_details()[0]
     interpreter.set_tensor(input_details["index"], x_float.astype(np.float32))
@@ -29,8 +37,8 @@ def run_tflite(interpreter: tf.lite.Interpreter, x_float: np.ndarray):
 def main():
     metadata = load_metadata()
 
-    watering_interpreter = tf.lite.Interpreter(model_path=str(WATERING_TFLITE))
-    health_interpreter = tf.lite.Interpreter(model_path=str(HEALTH_TFLITE))
+    watering_interpreter = Interpreter(model_path=str(WATERING_TFLITE))
+    health_interpreter = Interpreter(model_path=str(HEALTH_TFLITE))
     watering_interpreter.allocate_tensors()
     health_interpreter.allocate_tensors()
 